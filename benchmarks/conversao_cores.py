@@ -0,0 +1,50 @@
+"""
+Benchmark do motor de conversão de modos de cor de mn2.imagens (Imagem.converter).
+
+Mede a vazão, em megapixels por segundo, de cada par de modos suportado e da
+conversão de um lote de imagens em uma única chamada.
+
+Uso:
+  python benchmarks/conversao_cores.py [megapixels] [tamanho_lote]
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "mn2", "imagens"))
+from medicao import medir
+from Imagem import Imagem, CANAIS_MODO, converter
+
+
+def imagem_aleatoria(modo, altura, largura, rng):
+  dados = rng.random((altura, largura, CANAIS_MODO[modo]), dtype=np.float32)
+  return Imagem(dados, largura, altura, None, modo)
+
+
+def main():
+  megapixels = float(sys.argv[1]) if len(sys.argv) > 1 else 12
+  tamanho_lote = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+  largura = int(np.sqrt(megapixels * 1e6 * 4 / 3))
+  altura = int(megapixels * 1e6 / largura)
+  mp = altura * largura / 1e6
+  rng = np.random.default_rng(0)
+
+  print(f"Imagem {largura}x{altura} ({mp:.1f} MP)")
+  print(f"{'origem':>6} -> {'destino':<7} {'tempo (ms)':>11} {'MP/s':>9}")
+  for origem in CANAIS_MODO:
+    img = imagem_aleatoria(origem, altura, largura, rng)
+    for destino in CANAIS_MODO:
+      if origem == destino:
+        continue
+      t, _ = medir(lambda: converter(img, destino))
+      print(f"{origem:>6} -> {destino:<7} {t * 1e3:>11.1f} {mp / t:>9.1f}")
+
+  lote = [imagem_aleatoria("RGB", altura // 4, largura // 4, rng) for _ in range(tamanho_lote)]
+  mp_lote = tamanho_lote * (altura // 4) * (largura // 4) / 1e6
+  t, _ = medir(lambda: converter(lote, "L"))
+  print(f"Lote de {tamanho_lote} imagens RGB -> L ({mp_lote:.1f} MP): {t * 1e3:.1f} ms, {mp_lote / t:.1f} MP/s")
+
+
+if __name__ == "__main__":
+  main()
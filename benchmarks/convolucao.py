@@ -0,0 +1,57 @@
+"""
+Benchmark da escolha automática do método de Sinais.convolucao (mn2.sinais).
+
+Para uma grade de tamanhos de sinal e de filtro, mede o tempo dos métodos direto, FFT e
+overlap-add e compara o mais rápido com o escolhido por metodo='auto'. A última coluna é o
+tempo do método escolhido dividido pelo do mais rápido (1.00 quando a escolha é a ótima).
+
+Uso:
+  python benchmarks/convolucao.py [tamanho_lote]
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "mn2", "sinais"))
+from medicao import medir
+from sinais import Sinais
+
+METODOS = ["direct", "fft", "overlap-add"]
+TAMANHOS_SINAL = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6]
+TAMANHOS_FILTRO = [3, 15, 63, 255, 1023, 4095, 16383]
+
+# Limite de multiplicações da convolução direta medida, para a grade não levar horas
+MAXIMO_DIRETA = 5 * 10 ** 9
+
+
+def main():
+  lote = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+  rng = np.random.default_rng(0)
+
+  print(f"{lote} sinal(is) por chamada")
+  print(f"{'sinal':>8} {'filtro':>7} " + " ".join(f"{m:>12}" for m in METODOS) + f" {'melhor':>12} {'auto':>12} {'razão':>6}")
+  for n in TAMANHOS_SINAL:
+    sinais = rng.standard_normal((lote, n))
+    for m in TAMANHOS_FILTRO:
+      if m > n:
+        continue
+      filtro = rng.standard_normal(m)
+      tempos, referencia = {}, None
+      for metodo in METODOS:
+        if metodo == "direct" and lote * n * m > MAXIMO_DIRETA:
+          continue
+        tempos[metodo], resultado = medir(lambda: Sinais.convolucao(sinais, filtro, metodo))
+        if referencia is None:
+          referencia = resultado
+        assert np.allclose(resultado, referencia, atol=1e-8 * m), "métodos com resultados diferentes"
+
+      melhor = min(tempos, key=tempos.get)
+      auto = Sinais.metodo_convolucao(n, m)
+      razao = tempos[auto] / tempos[melhor] if auto in tempos else float("nan")
+      colunas = " ".join(f"{tempos[m_] * 1e3:>10.2f}ms" if m_ in tempos else f"{'-':>12}" for m_ in METODOS)
+      print(f"{n:>8} {m:>7} {colunas} {melhor:>12} {auto:>12} {razao:>6.2f}")
+
+
+if __name__ == "__main__":
+  main()
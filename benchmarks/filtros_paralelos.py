@@ -0,0 +1,51 @@
+"""
+Benchmark de escalabilidade dos filtros de mn2.imagens executados em paralelo (opção executor).
+
+Mede o tempo de detectar_bordas, blur_gaussiano e nitidez com 1, 2, 4, ... até N threads,
+conferindo que o resultado é idêntico ao do caminho serial.
+
+Uso:
+  python benchmarks/filtros_paralelos.py [megapixels] [max_threads]
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "mn2", "imagens"))
+from medicao import medir
+from filtros import Imagem, detectar_bordas, blur_gaussiano, nitidez
+
+
+def main():
+  megapixels = float(sys.argv[1]) if len(sys.argv) > 1 else 8
+  max_threads = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+  largura = int(np.sqrt(megapixels * 1e6 * 16 / 9))
+  altura = int(megapixels * 1e6 / largura)
+  dados = np.random.default_rng(0).random((altura, largura, 3), dtype=np.float32)
+  img = Imagem(dados, largura, altura, None, "RGB")
+
+  filtros = {
+    "detectar_bordas": lambda executor: detectar_bordas(img, executor=executor),
+    "blur_gaussiano(n=3)": lambda executor: blur_gaussiano(img, 3, executor=executor),
+    "nitidez": lambda executor: nitidez(img, executor=executor),
+  }
+  threads = [1]
+  while threads[-1] * 2 <= max_threads:
+    threads.append(threads[-1] * 2)
+  if threads[-1] != max_threads:
+    threads.append(max_threads)
+
+  print(f"Imagem {largura}x{altura} RGB, {os.cpu_count()} núcleos disponíveis")
+  print(f"{'filtro':<20} {'threads':>7} {'tempo (ms)':>11} {'speedup':>8}")
+  for nome, filtro in filtros.items():
+    serial, referencia = medir(lambda: filtro(None))
+    print(f"{nome:<20} {'serial':>7} {serial * 1e3:>11.1f} {1:>8.2f}")
+    for n in threads:
+      tempo, resultado = medir(lambda: filtro(n))
+      assert np.array_equal(resultado.dados, referencia.dados), "resultado diferente do serial"
+      print(f"{nome:<20} {n:>7} {tempo * 1e3:>11.1f} {serial / tempo:>8.2f}")
+
+
+if __name__ == "__main__":
+  main()
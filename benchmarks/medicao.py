@@ -0,0 +1,19 @@
+"""
+Medição de tempo compartilhada pelos benchmarks.
+
+Os benchmarks são executados como scripts (python benchmarks/<nome>.py), então este diretório
+já está no sys.path e o módulo é importado com `from medicao import medir`.
+"""
+import time
+
+
+def medir(funcao, repeticoes=3):
+  """
+  Retorna o menor tempo (em segundos) entre as repetições e o último resultado da função.
+  """
+  tempos = []
+  for _ in range(repeticoes):
+    inicio = time.perf_counter()
+    resultado = funcao()
+    tempos.append(time.perf_counter() - inicio)
+  return min(tempos), resultado
@@ -24,20 +24,60 @@ import copy
 
 class Imagem():
   def __init__(self, dados, largura, altura, formato, modo):
-    self.dados = dados
     self.largura = largura
     self.altura = altura
     self.formato = formato
     self.modo = modo
+    self.dados = dados
+
+  @property
+  def dados(self):
+    # Imagens resultantes de operações preguiçosas só calculam os dados no primeiro acesso
+    if self._expressao is not None:
+      self._dados = avaliar_expressao(self._expressao)
+      self._expressao = None
+    return self._dados
+
+  @dados.setter
+  def dados(self, dados):
+    # Os dados são sempre guardados como uma matriz (altura, largura, canais).
+    # Vetores unidimensionais (formato antigo) são remodelados, sem cópia quando contíguos.
+    if dados is not None:
+      dados = np.asarray(dados)
+      if dados.ndim != 3 or dados.shape[:2] != (self.altura, self.largura):
+        dados = dados.reshape(self.altura, self.largura, -1)
+    self._dados = dados
+    self._expressao = None
+
+  @property
+  def canais(self):
+    if self._expressao is not None:
+      return self._expressao.forma[-1]
+    return self._dados.shape[-1]
+
+  def normalizados(self):
+    """
+    Retorna os dados como floats entre 0 e 1. Se já estiverem em float, não há cópia.
+    """
+    dados = self.dados
+    if dados.dtype == np.uint8:
+      return np.multiply(dados, 1 / 255, dtype=np.float32)
+    return dados
  
-def abrir(arquivo):
+def abrir(arquivo, dtype=np.float32):
   """
-  Dado o caminho para o arquivo de imagem, retOrna uma instancia de Imagem.
+  Dado o caminho para o arquivo de imagem, retorna uma instancia de Imagem.
+  dtype: np.float32 para floats entre 0 e 1, ou np.uint8 para inteiros entre 0 e 255
   """
   img = Image.open(arquivo)
   largura, altura = img.width, img.height
-  # Os dados guardados serão floats entre 0 e 1 armazenados em um array unidimensional
-  dados = np.array(img.getdata())/255
+  # Lemos o buffer do PIL diretamente como uma matriz (altura, largura, canais)
+  dados = np.asarray(img)
+  if np.dtype(dtype) == np.uint8:
+    if not dados.flags.writeable:
+      dados = dados.copy()
+  else:
+    dados = np.multiply(dados, 1 / 255, dtype=dtype)
   formato = img.format
   modo = img.mode
   imagem = Imagem(dados, largura, altura, formato, modo)
@@ -46,17 +86,25 @@ def abrir(arquivo):
 def abrir_url(img_url):
   return abrir(requests.get(img_url, stream=True).raw)
  
+def para_uint8(dados):
+  """
+  Converte dados em floats entre 0 e 1 para o formato do PIL (valores inteiros entre 0 e 255,
+  convertidos para uint8). Dados que já estão em uint8 são retornados sem cópia.
+  """
+  if dados.dtype == np.uint8:
+    return dados
+  dados = np.multiply(dados, 255, dtype=np.float32)
+  np.clip(dados, 0, 255, out=dados)
+  return dados.astype(np.uint8)
+ 
 def converter_PIL(imagem):
   """
   Dada uma instância de Imagem, retorna uma instancia de PIL.Image
   """
-  # Convertemos o dado para o formato do PIL (valores inteiros entre 0 e 255, convertidos para uint8)
-  dados = np.clip(imagem.dados * 255, 0, 255).astype(np.uint8)
-  # Mudamos a forma de um vetor unidimensional para uma matriz
-  if imagem.modo == "L":
-    dados = dados.reshape(imagem.altura, imagem.largura)
-  else:
-    dados = dados.reshape(imagem.altura, imagem.largura, imagem.dados.shape[-1])
+  dados = para_uint8(imagem.dados)
+  # Imagens de um só canal são passadas ao PIL como matriz (altura, largura), sem cópia
+  if dados.shape[-1] == 1:
+    dados = dados[..., 0]
   imagem_pil = Image.fromarray(dados)
   return imagem_pil
  
@@ -83,50 +131,161 @@ def imprimir(*args):
 class ErroValidacaoDeCor(Exception):
     pass
 
-def validar_cor(modo, cor):
-  comprimentos = {"RGB": 3, "RGBA": 4, "L": 1, "CMYK": 4}
+# Número de canais de cada modo suportado
+CANAIS_MODO = {"L": 1, "RGB": 3, "RGBA": 4, "CMYK": 4, "HSL": 3}
 
+def validar_cor(modo, cor):
   if any(not isinstance(x,(int, float)) for x in cor):
-        raise ErroValidacaoDeCor("Cor inválida:" + cor)
+    raise ErroValidacaoDeCor(f"Cor inválida: {cor}")
   
-  if len(cor) != comprimentos[modo]:
-    raise ErroValidacaoDeCor(f"Cor incompatível com o modo {modo}: {args}")
-    
+  if len(cor) != CANAIS_MODO[modo]:
+    raise ErroValidacaoDeCor(f"Cor incompatível com o modo {modo}: {cor}")
+
+
+def rgb_para_hsl(rgb):
+  """
+  Converte um array (..., 3) RGB para HSL, com H, S e L entre 0 e 1.
+  """
+  # Operamos sobre as visões de cada canal: reduções no último eixo são lentas no numpy
+  r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+  maximo = np.maximum(np.maximum(r, g), b)
+  minimo = np.minimum(np.minimum(r, g), b)
+  delta = maximo - minimo
+  soma = maximo + minimo
+  l = soma / 2
+  # Pixels cinzas (delta == 0) geram divisões por zero; eles são zerados logo em seguida
+  with np.errstate(divide="ignore", invalid="ignore"):
+    s = delta / np.where(l <= 0.5, soma, 2 - soma)
+    h = np.where(
+      maximo == r, (g - b) / delta,
+      np.where(maximo == g, (b - r) / delta + 2, (r - g) / delta + 4),
+    )
+  h[h < 0] += 6
+  cinza = delta == 0
+  h[cinza] = 0
+  s[cinza] = 0
+  h /= 6
+  return np.stack([h, s, l], axis=-1)
+
+def hsl_para_rgb(hsl):
+  """
+  Converte um array (..., 3) HSL (valores entre 0 e 1) para RGB.
+  """
+  h, s, l = hsl[..., 0:1], hsl[..., 1:2], hsl[..., 2:3]
+  a = s * np.minimum(l, 1 - l)
+  k = np.array([0, 8, 4], dtype=hsl.dtype) + h * 12
+  # k fica entre 0 e 20, então uma subtração substitui o módulo 12
+  k = np.where(k >= 12, k - 12, k)
+  return l - a * np.clip(np.minimum(k - 3, 9 - k), -1, 1)
+
+def rgb_para_cmyk(rgb):
+  """
+  Converte um array (..., 3) RGB para CMYK.
+  """
+  maximo = np.maximum(np.maximum(rgb[..., 0:1], rgb[..., 1:2]), rgb[..., 2:3])
+  k = 1 - maximo
+  with np.errstate(divide="ignore", invalid="ignore"):
+    cmy = np.where(maximo > 0, (maximo - rgb) / maximo, 0)
+  return np.concatenate([cmy, k], axis=-1).astype(rgb.dtype, copy=False)
+
+def cmyk_para_rgb(cmyk):
+  """
+  Converte um array (..., 4) CMYK para RGB.
+  """
+  return (1 - cmyk[..., :3]) * (1 - cmyk[..., 3:])
+
+def para_rgb(dados, modo, cor_transparente):
+  """
+  Converte um array (..., canais) no modo dado para RGB.
+  Pixels RGBA são compostos sobre cor_transparente usando o canal alpha.
+  """
+  if modo == "RGB":
+    return dados
+  if modo == "L":
+    return np.repeat(dados, 3, axis=-1)
+  if modo == "RGBA":
+    alpha = dados[..., 3:]
+    return dados[..., :3] * alpha + np.asarray(cor_transparente, dtype=dados.dtype) * (1 - alpha)
+  if modo == "CMYK":
+    return cmyk_para_rgb(dados)
+  return hsl_para_rgb(dados)
+
+def de_rgb(rgb, modo):
+  """
+  Converte um array (..., 3) RGB para o modo dado.
+  """
+  if modo == "RGB":
+    return rgb
+  if modo == "L":
+    return (rgb[..., 0:1] + rgb[..., 1:2] + rgb[..., 2:3]) / 3
+  if modo == "RGBA":
+    alpha = np.ones(rgb.shape[:-1] + (1,), dtype=rgb.dtype)
+    return np.concatenate([rgb, alpha], axis=-1)
+  if modo == "CMYK":
+    return rgb_para_cmyk(rgb)
+  return rgb_para_hsl(rgb)
+
+def converter_dados(dados, modo_origem, modo, cor_transparente=(0, 0, 0)):
+  """
+  Converte um array (..., canais) de floats entre 0 e 1 entre dois modos, em operações
+  sobre o array inteiro. Qualquer número de dimensões iniciais é aceito, então lotes
+  (n, altura, largura, canais) são convertidos em uma única chamada.
+  """
+  for m in (modo_origem, modo):
+    if m not in CANAIS_MODO:
+      raise Exception(f"Modo {m} não suportado na conversão")
+  if modo_origem == modo:
+    return dados
+  return de_rgb(para_rgb(dados, modo_origem, cor_transparente), modo)
+
 def converter(img, modo, *cor_transparente):
   """
   Converte a imagem para o modo escolhido.
 
   Parametros:
-  img (Image): A imagem para ser convertida
-  modo (str): O modo da imagem ("L", "RGB", "RGBA", "CMY", "HSL")
-  cor_transparente: Cor definida como transparente no caso de conversão RGBA -> RGB
+  img (Image ou lista de Image): A imagem para ser convertida, ou um lote de imagens
+  modo (str): O modo da imagem ("L", "RGB", "RGBA", "CMYK", "HSL")
+  cor_transparente: Cor de fundo sobre a qual pixels transparentes são compostos nas
+    conversões a partir de RGBA (padrão: preto)
   
   Retorna:
-  Image: A imagem convertida
-  """
-
-  if img.modo == "RGB" and modo == "L":
-    f = lambda c: sum(c)/3
-  elif img.modo == "L" and modo == "RGB":
-    f = lambda c: np.array([c] * 3)
-  elif img.modo == "L" and modo == "RGBA":
-    f = lambda c: np.append(np.array([c] * 3), 1)
-  elif img.modo != "RGB" and modo == "RGBA":
-    f = lambda c: [sum(c)/3, 1]
-  elif img.modo == "RGBA" and modo == "L":
-    f = lambda c: sum(c[:3]/3) * c[3]
-  elif img.modo == "RGBA" and modo == "RGB":
-    validar_cor("RGB", cor_transparente) 
-    transparente = np.array(cor_transparente)
-    f = lambda c: c[:3] * c[3] + transparente * (1 - c[3]) 
-    
-  novos_dados = np.array([f(x) for x in img.dados])
-  nova_img = Imagem(novos_dados, img.largura, img.altura, img.formato, modo)  
-  ## TODO: Outras conversões
-  return nova_img
+  Image: A imagem convertida (ou lista de imagens convertidas)
+  """
+  if not isinstance(img, Imagem):
+    return converter_lote(img, modo, *cor_transparente)
+
+  if cor_transparente:
+    validar_cor("RGB", cor_transparente)
+  else:
+    cor_transparente = (0, 0, 0)
+
+  novos_dados = converter_dados(img.normalizados(), img.modo, modo, cor_transparente)
+  return Imagem(novos_dados, img.largura, img.altura, img.formato, modo)
+
+def converter_lote(imagens, modo, *cor_transparente):
+  """
+  Converte um lote de imagens para o modo escolhido.
+  Imagens de mesmo modo e tamanho são empilhadas e convertidas em uma única operação;
+  as imagens retornadas são visões do array convertido.
+  """
+  imagens = list(imagens)
+  if not imagens:
+    return []
+  primeira = imagens[0]
+  if any(i.modo != primeira.modo or i.dados.shape != primeira.dados.shape for i in imagens):
+    return [converter(i, modo, *cor_transparente) for i in imagens]
+
+  if cor_transparente:
+    validar_cor("RGB", cor_transparente)
+  else:
+    cor_transparente = (0, 0, 0)
+
+  lote = np.stack([i.normalizados() for i in imagens])
+  convertidos = converter_dados(lote, primeira.modo, modo, cor_transparente)
+  return [Imagem(dados, i.largura, i.altura, i.formato, modo) for dados, i in zip(convertidos, imagens)]
 
 
-def filtrar_canal(img, canal, colorido=False):
+def filtrar_canal(img, canal, colorido=False, out=None):
   """
   Retorna uma imagem que possui apenas o canal escolhido.
 
@@ -134,119 +293,283 @@ def filtrar_canal(img, canal, colorido=False):
   img (Image): A imagem para filtrar o canal
   canal (char): O caracter correspondente do modo da imagem ("R", para "RGB")
   colorido (bool): Se verdadeiro, retorna uma imagem no modo "RGB", se falso, retorna no modo "L"
+  out (ndarray): Buffer opcional (altura, largura, canais) onde o resultado é escrito
 
   Retorna:
-  Image: A imagem apenas com o canal escolhido
-  """
-  nova_img = copy.deepcopy(img)
-  funcoes_filtro_colorido = {
-    "R": lambda c: [c[0], 0, 0],
-    "G": lambda c: [0, c[1], 0],
-    "B": lambda c: [0, 0, c[2]]
-  }
-  funcoes_filtro_cinza = {
-    "R": lambda c: c[0],
-    "G": lambda c: c[1],
-    "B": lambda c: c[2]
-  }
+  Image: A imagem apenas com o canal escolhido. No modo "L" sem out, os dados são
+  uma visão dos dados de img (sem cópia).
+  """
+  indice = img.modo.index(canal)
   if colorido:
-    nova_img.dados = np.array([funcoes_filtro_colorido[canal](c) for c in img.dados ])
-  else:
-    nova_img.dados = np.array([funcoes_filtro_cinza[canal](c) for c in img.dados ])
-    nova_img.modo = "L"
-    
-  return nova_img
+    if out is None:
+      out = np.zeros((img.altura, img.largura, 3), dtype=img.dados.dtype)
+    else:
+      out[...] = 0
+    out[..., indice] = img.dados[..., indice]
+    return Imagem(out, img.largura, img.altura, img.formato, "RGB")
 
+  dados = img.dados[..., indice:indice + 1]
+  if out is not None:
+    np.copyto(out, dados)
+    dados = out
+  return Imagem(dados, img.largura, img.altura, img.formato, "L")
 
-def adicionar(img_A, B):
+
+# Se verdadeiro, as operações aritméticas constroem uma expressão em vez de calcular os dados
+AVALIACAO_PREGUICOSA = False
+
+# Número aproximado de valores por pedaço na avaliação de expressões, para que os resultados
+# intermediários de cada pedaço caibam no cache do processador
+TAMANHO_PEDACO = 1 << 16
+
+class avaliacao_preguicosa():
   """
-  Adiciona img_A por B. B pode ser outra imagem, uma lista de 3 elementos ou um número.
+  Liga (ou desliga) a avaliação preguiçosa das operações aritméticas entre imagens.
+  Pode ser chamada como função ou usada em um bloco with, que restaura o modo anterior:
+
+    with avaliacao_preguicosa():
+      resultado = (a - b) * 0.5 + c   # nenhum dado é calculado aqui
+    salvar(resultado, "saida.png")    # a expressão é avaliada em uma única passada
+
+  No modo preguiçoso, os operandos são guardados por referência: alterar os dados de uma
+  imagem antes da avaliação altera o resultado. Operações envolvendo uma imagem ainda não
+  avaliada também são preguiçosas, mesmo fora do modo.
   """
-  if isinstance(B, int) or isinstance(B, float):
-    B = np.array([B, B, B])
-  if isinstance(B, np.ndarray) or isinstance(B, list):
-    img_B = copy.deepcopy(img_A)
-    img_B.dados = np.full(img_A.dados.shape, B)
-  else:
-    img_B = B
+  def __init__(self, ativa=True):
+    global AVALIACAO_PREGUICOSA
+    self.anterior = AVALIACAO_PREGUICOSA
+    AVALIACAO_PREGUICOSA = ativa
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    global AVALIACAO_PREGUICOSA
+    AVALIACAO_PREGUICOSA = self.anterior
+
 
-  nova_img = copy.deepcopy(img_A)
-  nova_img.dados = img_A.dados + img_B.dados
+class Expressao():
+  """
+  Nó de uma expressão aritmética preguiçosa. Os operandos são outras expressões ou arrays:
+  dados (altura, largura, canais) de imagens, valores por canal ou números.
+  """
+  def __init__(self, operacao, a, b):
+    self.operacao = operacao
+    self.a = a
+    self.b = b
+    self.forma = np.broadcast_shapes(np.shape(a) if isinstance(a, np.ndarray) else a.forma,
+                                     np.shape(b) if isinstance(b, np.ndarray) else b.forma)
+    self.dtype = np.result_type(tipo_termo(a), tipo_termo(b))
+
+def tipo_termo(termo):
+  """
+  Tipo do resultado de um termo da expressão: dados inteiros ou booleanos viram float32.
+  """
+  if isinstance(termo, Expressao):
+    return termo.dtype
+  if termo.dtype.kind in "biu":
+    return np.dtype(np.float32)
+  return termo.dtype
+
+def termo_expressao(B):
+  """
+  Retorna o termo de uma expressão correspondente a B (imagem, lista por canal ou número).
+  Imagens ainda não avaliadas contribuem com a própria expressão, fundindo as operações.
+  """
+  if isinstance(B, Imagem):
+    return B._expressao if B._expressao is not None else B._dados
+  return np.asarray(B, dtype=np.float32)
+
+def avaliar_pedaco(termo, linhas, out=None):
+  """
+  Avalia um termo da expressão nas linhas dadas. Retorna o array e se ele é temporário,
+  caso em que pode ser reaproveitado como saída das operações seguintes.
+  """
+  if not isinstance(termo, Expressao):
+    if termo.ndim < 3:
+      return termo, False
+    termo = termo[linhas]
+    if termo.dtype == np.uint8:
+      return np.multiply(termo, 1 / 255, dtype=np.float32), True
+    return termo, False
+
+  a, temporario_a = avaliar_pedaco(termo.a, linhas)
+  b, temporario_b = avaliar_pedaco(termo.b, linhas)
+  forma = np.broadcast_shapes(a.shape, b.shape)
+  # Acumulamos no próprio resultado intermediário sempre que ele tiver a forma final
+  if out is None:
+    if temporario_a and a.shape == forma and a.dtype == termo.dtype:
+      out = a
+    elif temporario_b and b.shape == forma and b.dtype == termo.dtype:
+      out = b
+  return termo.operacao(a, b, out=out, dtype=termo.dtype), True
+
+def avaliar_expressao(expressao):
+  """
+  Avalia a expressão em uma única passada, pedaço a pedaço de linhas, escrevendo direto
+  no array de resultado.
+  """
+  altura, largura, canais = expressao.forma
+  resultado = np.empty(expressao.forma, dtype=expressao.dtype)
+  passo = max(1, TAMANHO_PEDACO // (largura * canais))
+  for topo in range(0, altura, passo):
+    linhas = slice(topo, topo + passo)
+    avaliar_pedaco(expressao, linhas, out=resultado[linhas])
+  return resultado
+
+def dados_operando(B):
+  """
+  Retorna B pronto para operar por broadcasting com os dados (altura, largura, canais) de uma Imagem.
+  B pode ser outra imagem, uma lista com um valor por canal ou um número.
+  """
+  if isinstance(B, Imagem):
+    return B.normalizados()
+  return np.asarray(B, dtype=np.float32)
+
+def operar(img_A, B, operacao):
+  """
+  Aplica a operação (ufunc do numpy) entre img_A e B, imediatamente ou de forma preguiçosa.
+  """
+  preguicosa = AVALIACAO_PREGUICOSA or img_A._expressao is not None or (
+    isinstance(B, Imagem) and B._expressao is not None)
+  if not preguicosa:
+    dados = operacao(img_A.normalizados(), dados_operando(B))
+    return Imagem(dados, img_A.largura, img_A.altura, img_A.formato, img_A.modo)
+
+  nova_img = Imagem(None, img_A.largura, img_A.altura, img_A.formato, img_A.modo)
+  nova_img._expressao = Expressao(operacao, termo_expressao(img_A), termo_expressao(B))
   return nova_img
 
+
+def adicionar(img_A, B):
+  """
+  Adiciona img_A por B. B pode ser outra imagem, uma lista com um valor por canal ou um número.
+  """
+  return operar(img_A, B, np.add)
+
 Imagem.__add__ = adicionar
 
 def subtrair(img_A, B):
   """
-  Subtrai img_A por B. B pode ser outra imagem, uma lista de 3 elementos ou um número.
+  Subtrai img_A por B. B pode ser outra imagem, uma lista com um valor por canal ou um número.
   """
-  if isinstance(B, int) or isinstance(B, float):
-    B = np.array([B, B, B])
-  if isinstance(B, np.ndarray) or isinstance(B, list):
-    img_B = copy.deepcopy(img_A)
-    img_B.dados = np.full(img_A.dados.shape, B)
-  else:
-    img_B = B
-
-  nova_img = copy.deepcopy(img_A)
-  nova_img.dados = img_A.dados - img_B.dados
-  return nova_img
+  return operar(img_A, B, np.subtract)
 
 Imagem.__sub__ = subtrair
 
 def multiplicar(img_A, B):
   """
-  Multiplica img_A por B. B pode ser outra imagem, uma lista de 3 elementos ou um número.
+  Multiplica img_A por B. B pode ser outra imagem, uma lista com um valor por canal ou um número.
   """
-  if isinstance(B, int) or isinstance(B, float):
-    B = np.array([B, B, B])
-  if isinstance(B, np.ndarray) or isinstance(B, list):
-    img_B = copy.deepcopy(img_A)
-    img_B.dados = np.full(img_A.dados.shape, B)
-  else:
-    img_B = B
-
-  nova_img = copy.deepcopy(img_A)
-  nova_img.dados = img_A.dados * img_B.dados
-  return nova_img
+  return operar(img_A, B, np.multiply)
 
 Imagem.__mul__ = multiplicar
 
 def dividir(img_A, B):
   """
-  Divide img_A por B. B pode ser outra imagem, uma lista de 3 elementos ou um número.
+  Divide img_A por B. B pode ser outra imagem, uma lista com um valor por canal ou um número.
   """
-  if isinstance(B, int) or isinstance(B, float):
-    B = np.array([B, B, B])
-  if isinstance(B, np.ndarray) or isinstance(B, list):
-    img_B = copy.deepcopy(img_A)
-    img_B.dados = np.full(img_A.dados.shape, B)
-  else:
-    img_B = B
-
-  nova_img = copy.deepcopy(img_A)
-  nova_img.dados = img_A.dados / img_B.dados
-  return nova_img
+  return operar(img_A, B, np.divide)
 
 Imagem.__truediv__ = dividir
 
 
-def blend(img_A, img_B, n_frames):
-  range_A = np.linspace(start = 1., stop = 0., num = n_frames)
-  range_B = 1. - range_A
+def blend(img_A, img_B, n_frames, gerador=False):
+  """
+  Gera a transição de img_A para img_B em n_frames quadros.
 
-  blend_imgs = []
-  for i in range(len(range_A)):
-    blend_imgs = np.append(blend_imgs, img_A * range_A[i] + img_B * range_B[i])
+  Parametros:
+  img_A (Image): Imagem do primeiro quadro
+  img_B (Image): Imagem do último quadro
+  n_frames (int): Número de quadros
+  gerador (bool): Se verdadeiro, retorna um gerador que calcula cada quadro apenas quando é
+    pedido, mantendo em memória só o quadro atual. Se falso, todos os quadros são calculados
+    de uma vez em um único array (n_frames, altura, largura, canais). Para salvar a transição
+    como GIF, use salvar_blend, que usa o gerador
 
-  return blend_imgs
+  Retorna:
+  list ou generator: Os quadros como instâncias de Imagem
+  """
+  pesos_A = np.linspace(start = 1., stop = 0., num = n_frames, dtype=np.float32)
+  dados_B = img_B.normalizados()
+  # Cada quadro é B + (A - B) * peso, então a diferença é calculada uma só vez
+  diferenca = img_A.normalizados() - dados_B
+
+  def quadro(dados):
+    return Imagem(dados, img_A.largura, img_A.altura, img_A.formato, img_A.modo)
 
+  if gerador:
+    return (quadro(np.add(diferenca * peso, dados_B)) for peso in pesos_A)
 
-def salvar_gif(nome, imagens, duracao, loop=0):
-  imgs_pil = []
-  for img in imagens:
-    imgs_pil.append(converter_PIL(img))
-  imgs_pil[0].save(nome, format="GIF", save_all=True, append_images=imgs_pil[1:], duration=duracao, loop=loop)
+  quadros = np.multiply(diferenca, pesos_A[:, np.newaxis, np.newaxis, np.newaxis])
+  quadros += dados_B
+  return [quadro(dados) for dados in quadros]
+
+
+def paleta_gif(img, cores=256):
+  """
+  Calcula uma paleta com até `cores` cores a partir de uma Imagem, para ser usada em salvar_gif.
+  Retorna uma PIL.Image no modo "P".
+  """
+  return converter_PIL(img).convert("RGB").quantize(cores)
+
+
+def salvar_gif(nome, imagens, duracao, loop=0, paleta=None):
+  """
+  Salva as imagens como um GIF animado.
+
+  Os quadros são consumidos um a um e cada um é reduzido a uma imagem no modo "P" (1 byte por
+  pixel) assim que chega. O PIL só escreve o arquivo depois de receber todos os quadros, então
+  apenas esses quadros já reduzidos ficam na memória, e não os floats de cada Imagem.
+
+  Parametros:
+  nome (str): Caminho do arquivo
+  imagens: Lista ou gerador (como o de blend(..., gerador=True)) de instâncias de Imagem
+  duracao (int): Duração de cada quadro em milissegundos
+  loop (int): Número de repetições (0 para repetir sempre)
+  paleta: None para calcular uma paleta por quadro; True para calcular uma paleta
+    compartilhada a partir do primeiro quadro; uma Imagem para calcular a paleta a partir
+    dela; ou uma PIL.Image no modo "P" (veja paleta_gif)
+  """
+  imagens = iter(imagens)
+  primeira = next(imagens)
+  if paleta is True:
+    paleta = paleta_gif(primeira)
+  elif isinstance(paleta, Imagem):
+    paleta = paleta_gif(paleta)
+
+  def quadro_gif(img):
+    img_pil = converter_PIL(img)
+    if paleta is not None:
+      return img_pil.convert("RGB").quantize(palette=paleta)
+    # A mesma paleta adaptativa que o PIL calcularia ao salvar; imagens L já têm 1 byte por
+    # pixel e as RGBA ficam com o PIL, que converte a transparência
+    if img_pil.mode == "RGB":
+      return img_pil.convert("P", palette=Image.ADAPTIVE)
+    return img_pil
+
+  quadros = [quadro_gif(primeira)]
+  quadros.extend(quadro_gif(img) for img in imagens)
+  quadros[0].save(nome, format="GIF", save_all=True, append_images=quadros[1:], duration=duracao, loop=loop)
+
+
+def salvar_blend(nome, img_A, img_B, n_frames, duracao, loop=0, paleta=True):
+  """
+  Salva a transição de img_A para img_B (veja blend) como um GIF animado, calculando cada
+  quadro só quando salvar_gif o pede: nenhum array com todos os quadros é criado.
+
+  Parametros:
+  nome (str): Caminho do arquivo
+  img_A, img_B, n_frames: Como em blend
+  duracao, loop: Como em salvar_gif
+  paleta: True para uma paleta compartilhada calculada a partir de img_A e img_B juntas, ou
+    qualquer outro valor aceito por salvar_gif
+  """
+  if paleta is True:
+    # Os quadros intermediários misturam as cores dos dois extremos
+    dados = np.concatenate([img_A.normalizados(), img_B.normalizados()], axis=0)
+    paleta = Imagem(dados, img_A.largura, 2 * img_A.altura, img_A.formato, img_A.modo)
+  salvar_gif(nome, blend(img_A, img_B, n_frames, gerador=True), duracao, loop, paleta)
 
 
 def salvar(img, caminho):
@@ -0,0 +1,159 @@
+"""
+Processamento de imagens maiores que a memória, bloco a bloco.
+
+Cada bloco é lido sob demanda (por memmap quando o arquivo permite, ou por regiões do PIL),
+expandido por um halo de pixels vizinhos para que os filtros de convolução enxerguem os
+dados dos blocos adjacentes, processado como uma Imagem comum e escrito em um arquivo .npy
+mapeado em memória. Como o halo é cortado nas bordas da imagem, o resultado é idêntico ao
+do processamento da imagem inteira para todos os modos de borda exceto "wrap".
+"""
+
+from filtros import *
+
+# Geometria da divisão de imagens em pedaços
+from images import Images
+
+# Tamanho padrão (em pixels) do lado de cada bloco
+TAMANHO_BLOCO = 1024
+
+# Modos do numpy para os arquivos .npy, de acordo com o número de canais
+MODOS_CANAIS = {1: "L", 3: "RGB", 4: "RGBA"}
+
+
+def abrir_memmap(caminho):
+  """
+  Retorna os pixels do arquivo como um array (altura, largura[, canais]) mapeado em memória,
+  sem decodificar a imagem. Funciona para arquivos .npy e para formatos sem compressão cujos
+  pixels são guardados em um único bloco contíguo (PPM/PGM, TIFF sem compressão em uma faixa).
+  Retorna None se o arquivo não puder ser mapeado.
+  """
+  return Images.memmap_pixels(caminho)
+
+
+class LeitorBlocos():
+  """
+  Lê regiões de uma imagem grande sob demanda, retornando cada uma como uma Imagem de floats
+  entre 0 e 1. O limite de pixels do PIL (Image.MAX_IMAGE_PIXELS) não se aplica às imagens
+  abertas aqui.
+
+  Só arquivos .npy e PPM/PGM ou TIFF sem compressão (veja abrir_memmap) são lidos de fato
+  bloco a bloco. Para os demais formatos (PNG, JPEG, TIFF comprimido...) as regiões são
+  recortadas pelo PIL, que decodifica a imagem inteira no primeiro recorte e a mantém na
+  memória em uint8 (largura*altura bytes por canal); imagens maiores que a memória devem
+  antes ser convertidas para um desses formatos.
+  """
+  def __init__(self, caminho, modo=None):
+    self.caminho = caminho
+    self.pil = None
+    self.dados = abrir_memmap(caminho)
+    if self.dados is None:
+      self.pil = Images.open_large(caminho)
+      self.altura, self.largura = self.pil.height, self.pil.width
+      self.modo = self.pil.mode
+    else:
+      if self.dados.ndim == 2:
+        self.dados = self.dados[..., np.newaxis]
+      self.altura, self.largura, canais = self.dados.shape
+      self.modo = modo or MODOS_CANAIS.get(canais)
+
+  def ler(self, topo, base, esquerda, direita):
+    """
+    Retorna a região [topo:base, esquerda:direita] da imagem como Imagem.
+    """
+    if self.pil is not None:
+      regiao = np.asarray(self.pil.crop((esquerda, topo, direita, base)))
+    else:
+      regiao = self.dados[topo:base, esquerda:direita]
+    if np.issubdtype(regiao.dtype, np.floating):
+      dados = regiao.astype(np.float32)
+    else:
+      dados = np.multiply(regiao, 1 / 255, dtype=np.float32)
+    return Imagem(dados, direita - esquerda, base - topo, None, self.modo)
+
+
+def grade_blocos(altura, largura, tamanho_bloco=TAMANHO_BLOCO):
+  """
+  Retorna os limites (topo, base, esquerda, direita) dos blocos que cobrem a imagem, linha a
+  linha, com lados de no máximo tamanho_bloco pixels.
+  """
+  linhas = -(-altura // tamanho_bloco)
+  colunas = -(-largura // tamanho_bloco)
+  return Images.split_bounds(altura, largura, colunas, linhas)
+
+
+def processar_em_blocos(entradas, destino, operacao, halo=0, tamanho_bloco=TAMANHO_BLOCO, dtype=np.uint8):
+  """
+  Aplica uma operação sobre imagens grandes bloco a bloco, escrevendo o resultado em disco.
+
+  Parametros:
+  entradas: caminho (ou LeitorBlocos) de uma imagem, ou lista deles, todas do mesmo tamanho
+  destino: caminho do arquivo .npy (altura, largura, canais) onde o resultado é escrito
+  operacao: função que recebe uma Imagem por entrada e retorna uma Imagem, por exemplo
+    blur_gaussiano ou lambda a, b: (a - b) * 0.5
+  halo: quantos pixels vizinhos a operação precisa em volta de cada pixel (o raio do kernel)
+  tamanho_bloco: lado máximo de cada bloco, em pixels
+  dtype: np.uint8 (valores entre 0 e 255) ou np.float32 (valores entre 0 e 1) no destino
+
+  Retorna:
+  np.memmap: O resultado mapeado em memória
+  """
+  if isinstance(entradas, (str, LeitorBlocos)):
+    entradas = [entradas]
+  leitores = [e if isinstance(e, LeitorBlocos) else LeitorBlocos(e) for e in entradas]
+  altura, largura = leitores[0].altura, leitores[0].largura
+  if any((l.altura, l.largura) != (altura, largura) for l in leitores):
+    raise Exception('As imagens de entrada devem ter o mesmo tamanho')
+
+  saida = None
+  for topo, base, esquerda, direita in grade_blocos(altura, largura, tamanho_bloco):
+    # Expandimos o bloco pelo halo, sem ultrapassar as bordas da imagem
+    topo_h, base_h = max(0, topo - halo), min(altura, base + halo)
+    esquerda_h, direita_h = max(0, esquerda - halo), min(largura, direita + halo)
+    resultado = operacao(*[l.ler(topo_h, base_h, esquerda_h, direita_h) for l in leitores])
+    nucleo = resultado.dados[topo - topo_h:base - topo_h, esquerda - esquerda_h:direita - esquerda_h]
+
+    # O arquivo de saída só é criado no primeiro bloco, quando sabemos o número de canais
+    if saida is None:
+      saida = np.lib.format.open_memmap(destino, mode="w+", dtype=dtype, shape=(altura, largura, nucleo.shape[-1]))
+    saida[topo:base, esquerda:direita] = para_uint8(nucleo) if np.dtype(dtype) == np.uint8 else nucleo
+
+  saida.flush()
+  return saida
+
+
+def validar_borda_blocos(borda):
+  if borda == "wrap":
+    raise Exception('O modo de borda "wrap" não é suportado no processamento em blocos')
+
+
+def convoluir_em_blocos(entrada, destino, filtro, borda="constant", **kwargs):
+  """
+  Versão em blocos de convoluir. Os demais argumentos são os de processar_em_blocos.
+  """
+  validar_borda_blocos(borda)
+  halo = max(np.shape(filtro)) // 2
+  return processar_em_blocos(entrada, destino, lambda img: convoluir(img, filtro, borda), halo, **kwargs)
+
+
+def detectar_bordas_em_blocos(entrada, destino, branco=None, borda="constant", **kwargs):
+  """
+  Versão em blocos de detectar_bordas. Os demais argumentos são os de processar_em_blocos.
+  """
+  validar_borda_blocos(borda)
+  return processar_em_blocos(entrada, destino, lambda img: detectar_bordas(img, branco, borda), 1, **kwargs)
+
+
+def blur_gaussiano_em_blocos(entrada, destino, n=1, borda="constant", **kwargs):
+  """
+  Versão em blocos de blur_gaussiano. Os demais argumentos são os de processar_em_blocos.
+  """
+  validar_borda_blocos(borda)
+  return processar_em_blocos(entrada, destino, lambda img: blur_gaussiano(img, n, borda), n, **kwargs)
+
+
+def nitidez_em_blocos(entrada, destino, borda="constant", **kwargs):
+  """
+  Versão em blocos de nitidez. Os demais argumentos são os de processar_em_blocos.
+  """
+  validar_borda_blocos(borda)
+  return processar_em_blocos(entrada, destino, lambda img: nitidez(img, borda), 1, **kwargs)
@@ -1,49 +1,207 @@
 from Imagem import *
 
-def convoluir(img, filtro):
+# Convolução via FFT
+from scipy import signal, fft
+
+# Execução das faixas da imagem em paralelo (ndimage e numpy liberam o GIL)
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+# Modos de borda aceitos, com o equivalente em np.pad usado no caminho via FFT
+MODOS_BORDA = {
+  "constant": "constant",
+  "reflect": "symmetric",
+  "mirror": "reflect",
+  "nearest": "edge",
+  "wrap": "wrap",
+}
+
+# Tamanhos de kernel (multiplicações por pixel) a partir dos quais a convolução via FFT
+# fica mais barata que a direta e que as duas passadas 1D de um kernel separável
+LIMIAR_FFT = 49
+LIMIAR_FFT_SEPARAVEL = 80
+
+# Número de faixas de linhas por thread na execução em paralelo, para equilibrar a carga
+FAIXAS_POR_THREAD = 2
+
+def kernel_separavel(filtro, tolerancia=1e-8):
+  """
+  Tenta decompor um kernel 2D como o produto externo de dois kernels 1D.
+  filtro: kernel (ndarray 2D)
+  retorno: tupla (coluna, linha) tal que np.outer(coluna, linha) == filtro, ou None se o
+  kernel não for separável (posto maior que 1)
+  """
+  u, s, vt = np.linalg.svd(np.asarray(filtro, dtype="float64"))
+  if s[0] == 0 or (len(s) > 1 and s[1] > tolerancia * s[0]):
+    return None
+  raiz = np.sqrt(s[0])
+  return u[:, 0] * raiz, vt[0] * raiz
+
+
+def compor_kernel(filtro, n):
+  """
+  Retorna o kernel equivalente a aplicar o filtro n vezes seguidas.
+  No interior da imagem o resultado é idêntico; junto às bordas (até n vezes o raio do
+  kernel) ele corresponde a aplicar o kernel composto sobre a borda escolhida.
+  """
+  composto = np.asarray(filtro, dtype="float64")
+  for _ in range(n - 1):
+    composto = signal.convolve(composto, filtro)
+  return composto
+
+
+def numero_threads(executor):
+  """
+  Retorna o número de threads correspondente à opção executor dos filtros: None (serial),
+  um número de threads ou um concurrent.futures.Executor já criado. O Executor não informa
+  quantas threads tem, então para ele é usado o número de núcleos (os.cpu_count()); para
+  fixar o número de threads, passe o número em vez do Executor.
+  """
+  if executor is None:
+    return 1
+  if isinstance(executor, int):
+    return executor
+  return os.cpu_count() or 1
+
+
+def obter_executor(executor):
+  """
+  Retorna (executor, número de threads, se o executor foi criado aqui) a partir da opção
+  executor dos filtros. Um número de threads cria um ThreadPoolExecutor com exatamente
+  esse número de threads.
+  """
+  if isinstance(executor, int):
+    return ThreadPoolExecutor(executor), executor, True
+  return executor, numero_threads(executor), False
+
+
+def convoluir_em_faixas(dados, filtro, borda, metodo, executor):
+  """
+  Divide os dados em faixas de linhas, expandidas por um halo do tamanho do raio do kernel,
+  e convolui as faixas em paralelo. Cada pixel é calculado com as mesmas operações do caminho
+  serial, então o resultado é idêntico bit a bit.
+  """
+  executor, n_threads, proprio = obter_executor(executor)
+  altura = dados.shape[0]
+  halo = filtro.shape[0] // 2
+  n_faixas = max(1, min(n_threads * FAIXAS_POR_THREAD, altura // max(1, 2 * halo)))
+  limites = np.linspace(0, altura, n_faixas + 1).round().astype(int)
+  saida = np.empty(dados.shape, dtype=dados.dtype)
+
+  def convoluir_faixa(topo, base):
+    # O halo é cortado nas bordas da imagem, onde o modo de borda é aplicado normalmente
+    topo_h, base_h = max(0, topo - halo), min(altura, base + halo)
+    faixa = convoluir_dados(dados[topo_h:base_h], filtro, borda, metodo)
+    saida[topo:base] = faixa[topo - topo_h:base - topo_h]
+
+  try:
+    for tarefa in [executor.submit(convoluir_faixa, a, b) for a, b in zip(limites[:-1], limites[1:])]:
+      tarefa.result()
+  finally:
+    if proprio:
+      executor.shutdown()
+  return saida
+
+
+def convoluir_dados(dados, filtro, borda="constant", metodo="auto", executor=None):
+  """
+  Convolui um kernel 2D com todos os canais de um array (altura, largura, canais).
+  dados: array (altura, largura, canais) de floats
+  filtro: kernel (ndarray). Não reverte-lo antes de passar para a função
+  borda: modo de tratamento das bordas ("constant", "reflect", "mirror", "nearest", "wrap")
+  metodo: "auto", "direto", "separavel" ou "fft". No modo "auto", kernels separáveis
+    (como o gaussiano e o sobel) são aplicados em duas passadas 1D e kernels grandes via FFT
+  executor: número de threads ou concurrent.futures.ThreadPoolExecutor para convoluir em
+    paralelo. O resultado é idêntico ao serial; com a borda "wrap" a execução é serial
+  retorno: array com o mesmo formato de dados
+  """
+  if borda not in MODOS_BORDA:
+    raise Exception(f'Modo de borda {borda} não suportado')
+  filtro = np.asarray(filtro, dtype="float64")
+
+  separavel = kernel_separavel(filtro) if metodo in ("auto", "separavel") else None
+  if metodo == "auto":
+    if separavel is not None:
+      metodo = "fft" if sum(filtro.shape) >= LIMIAR_FFT_SEPARAVEL else "separavel"
+    else:
+      metodo = "fft" if filtro.size >= LIMIAR_FFT else "direto"
+  elif metodo == "separavel" and separavel is None:
+    raise Exception('O kernel não é separável')
+
+  if executor is not None and metodo != "fft" and borda != "wrap":
+    return convoluir_em_faixas(dados, filtro, borda, metodo, executor)
+
+  if metodo == "separavel":
+    coluna, linha = separavel
+    convolucao = ndimage.convolve1d(dados, coluna[::-1], axis=0, mode=borda)
+    return ndimage.convolve1d(convolucao, linha[::-1], axis=1, mode=borda)
+
+  if metodo == "fft":
+    # Mesma origem do ndimage.convolve com o kernel revertido, para qualquer tamanho de kernel
+    altura_k, largura_k = filtro.shape
+    pad = [
+      (altura_k - 1 - altura_k // 2, altura_k // 2),
+      (largura_k - 1 - largura_k // 2, largura_k // 2),
+      (0, 0),
+    ]
+    expandidos = np.pad(dados, pad, mode=MODOS_BORDA[borda])
+    # No caminho via FFT, o paralelismo fica a cargo das threads do próprio scipy.fft, que
+    # dividem as transformadas 1D independentes sem alterar o resultado
+    with fft.set_workers(numero_threads(executor)):
+      convolucao = signal.fftconvolve(expandidos, filtro[::-1, ::-1, np.newaxis], mode="valid", axes=(0, 1))
+    return convolucao.astype(dados.dtype, copy=False)
+
+  return ndimage.convolve(dados, filtro[::-1, ::-1, np.newaxis], mode=borda)
+
+
+def convoluir(img, filtro, borda="constant", metodo="auto", executor=None):
   """
-  Convolui um kernel com uma Imagem L
+  Convolui um kernel com todos os canais de uma Imagem, de uma só vez.
+  O canal alpha de imagens RGBA é preservado.
   img: Imagem
   filtro: kernel (ndarray). Não reverte-lo antes de passar para a função
+  borda: modo de tratamento das bordas ("constant", "reflect", "mirror", "nearest", "wrap")
+  metodo: "auto", "direto", "separavel" ou "fft" (veja convoluir_dados)
+  executor: número de threads ou ThreadPoolExecutor para convoluir faixas da imagem em
+    paralelo (veja convoluir_dados)
   retorno: Imagem resultado da convolução
   """
-  nova_img = Imagem(None, img.largura, img.altura, img.formato, img.modo)
-  if img.modo != "L":
-    raise Exception('O modo da imagem é incompatível com esta função')
-  convolucao = ndimage.convolve(
-    img.dados.reshape(img.altura, img.largura),
-    filtro[::-1, ::-1],
-    mode="constant",
-  )
-  nova_img.dados = convolucao.reshape(img.largura * img.altura)
-  return nova_img
+  dados = img.normalizados()
+  if img.modo == "RGBA":
+    cores = convoluir_dados(dados[..., :3], filtro, borda, metodo, executor)
+    convolucao = np.concatenate([cores, dados[..., 3:]], axis=-1)
+  else:
+    convolucao = convoluir_dados(dados, filtro, borda, metodo, executor)
+  return Imagem(convolucao, img.largura, img.altura, img.formato, img.modo)
 
 
-def reunir_canais(img_r, img_g, img_b, img_a=None):
+def reunir_canais(img_r, img_g, img_b, img_a=None, out=None):
     """
     Cria imagem colorida RGB/RGBA a partir de três imagems em modo L.
     img_r: Imagem L para o canal vermelho
     img_g: Imagem L para o canal verde
     img_b: Imagem L para o canal azul
     img_a: Imagem L para o canal alpha
+    out: buffer opcional (altura, largura, 3 ou 4) onde os canais são escritos
     retorno: Imagem
     """
-    altura, largura = img_r.altura, img_g.largura
-    novos_dados = np.zeros([altura * largura, 4 if img_a else 3] )
-    for i in range(novos_dados.shape[0]):
-      novos_dados[i][0] = img_r.dados[i]
-      novos_dados[i][1] = img_g.dados[i]
-      novos_dados[i][2] = img_b.dados[i]
-    if img_a:
-        novos_dados[i][3] = img_a[i]
-    return Imagem(novos_dados, largura, altura, img_r.formato, "RGBA" if img_a else "RGB" )
+    canais = [img_r, img_g, img_b] if img_a is None else [img_r, img_g, img_b, img_a]
+    # Canais com tipos diferentes (uint8 e float) são reunidos como floats entre 0 e 1
+    if all(c.dados.dtype == img_r.dados.dtype for c in canais):
+      dados = [c.dados[..., 0] for c in canais]
+    else:
+      dados = [c.normalizados()[..., 0] for c in canais]
+    novos_dados = np.stack(dados, axis=-1, out=out)
+    return Imagem(novos_dados, img_r.largura, img_r.altura, img_r.formato, "RGB" if img_a is None else "RGBA")
     
         
-def detectar_bordas(img, branco=None):
+def detectar_bordas(img, branco=None, borda="constant", executor=None):
   """
   Retorna nova Imagem com aplicação de filtro de detecção de bordas
   img: Imagem de entrada
   branco: (float) se especificado, todo cinza maior ou igual a esse valor vira 1
+  borda: modo de tratamento das bordas da imagem (veja convoluir)
+  executor: número de threads ou ThreadPoolExecutor para filtrar em paralelo (veja convoluir)
   """
   vertical_sobel = np.array([
     [-1, 0, 1],
@@ -57,15 +215,14 @@ def detectar_bordas(img, branco=None):
     [-1, -2, -1]
   ], dtype="float64") 
 
-  canais = [
-    filtrar_canal(img, "R"), filtrar_canal(img, "G"), filtrar_canal(img, "B")  
-  ]
-    
-  bordas_verticais = [convoluir(img, vertical_sobel) for img in canais]
-  bordas_horizontais = [convoluir(img, horizontal_sobel)for img in canais]
-   
-  canais = [ x[0] * x[0] + x[1] * x[1] for x in zip(bordas_verticais, bordas_horizontais) ]
-  dados = sum([img.dados for img in canais]) / 3
+  # Filtramos todos os canais de cor de uma só vez e tiramos a média das magnitudes
+  dados = img.normalizados()
+  if img.modo in ("RGB", "RGBA"):
+    dados = dados[..., :3]
+  bordas_verticais = convoluir_dados(dados, vertical_sobel, borda, executor=executor)
+  bordas_horizontais = convoluir_dados(dados, horizontal_sobel, borda, executor=executor)
+  magnitudes = bordas_verticais * bordas_verticais + bordas_horizontais * bordas_horizontais
+  dados = magnitudes.sum(axis=-1, keepdims=True) / magnitudes.shape[-1]
 
   if branco:
     dados = dados >= branco
@@ -73,12 +230,15 @@ def detectar_bordas(img, branco=None):
   return Imagem(dados, img.largura, img.altura, img.formato, "L")
 
 
-def blur_gaussiano(img, n=1):
+def blur_gaussiano(img, n=1, borda="constant", executor=None):
   """
   Aplica blur gaussiano na imagem e retorna a nova imagem
   img: Imagem de entrada
-  n: (int) número de vezes que o filtro será aplicado
-  retrno: Imagem com o filtro aplicado
+  n: (int) número de vezes que o filtro será aplicado. As n passadas são combinadas em
+    um único kernel equivalente; com n <= 0 a imagem é retornada sem blur (uma cópia)
+  borda: modo de tratamento das bordas da imagem (veja convoluir)
+  executor: número de threads ou ThreadPoolExecutor para filtrar em paralelo (veja convoluir)
+  retorno: Imagem com o filtro aplicado
   """
   kernel = np.array([
     [1, 2, 1],
@@ -86,22 +246,17 @@ def blur_gaussiano(img, n=1):
     [1, 2, 1]
       
   ], dtype="float64") / 16
-  if img.modo == "L":
-    return convoluir(img, kernel)
-  canais = [
-    filtrar_canal(img, "R"), filtrar_canal(img, "G"), filtrar_canal(img, "B")  
-  ]
-
-  for i in range(0, n):
-    canais = [convoluir(i, kernel) for i in canais]
-
-  return reunir_canais(*canais)
+  if n <= 0:
+    return Imagem(np.array(img.normalizados()), img.largura, img.altura, img.formato, img.modo)
+  return convoluir(img, compor_kernel(kernel, n), borda, executor=executor)
 
 
-def nitidez(img):
+def nitidez(img, borda="constant", executor=None):
   """
   Aplica um filtro de nitidez (unsharpen mask) na imagem e retorna a nova imagem.
   img: Imagem de entrada
+  borda: modo de tratamento das bordas da imagem (veja convoluir)
+  executor: número de threads ou ThreadPoolExecutor para filtrar em paralelo (veja convoluir)
   retorno: Imagem com o filtro aplicado 
   """
   kernel = np.array([
@@ -109,10 +264,4 @@ def nitidez(img):
       [-1, 5, -1],
       [0, -1, 0]
   ])
-  if img.modo == "L":
-    return convoluir(img, kernel)
-  canais = [
-    filtrar_canal(img, "R"), filtrar_canal(img, "G"), filtrar_canal(img, "B")  
-  ]
-  canais = [convoluir(i, kernel) for i in canais]
-  return reunir_canais(*canais)
\ No newline at end of file
+  return convoluir(img, kernel, borda, executor=executor)
@@ -0,0 +1,326 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from scipy import fft
+from typing import Dict, List, Optional, Sequence, Tuple
+from images import Images
+
+# Number of set bits of every byte value, used to count hamming distances
+POPCOUNT_8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# Number of set bits of every 16 bit value, used to enumerate the substring probes
+POPCOUNT_16 = POPCOUNT_8[np.arange(1 << 16) & 0xFF] + POPCOUNT_8[np.arange(1 << 16) >> 8]
+
+class ImageHash:
+    """
+        64 bit perceptual hashes (aHash, dHash and pHash) computed
+        from the grayscale matrices retrieved by Images.to_vector
+    """
+
+    HASH_SIZE = 8
+
+    @staticmethod
+    def resize(matrix: np.ndarray, height: int, width: int) -> np.ndarray:
+        """
+            Resizes a grayscale matrix and retrieves it as floats
+        """
+        img = Image.fromarray(matrix).resize((width, height), Image.LANCZOS)
+
+        return np.asarray(img, dtype=np.float32)
+
+    @staticmethod
+    def to_int(bits: np.ndarray) -> int:
+        """
+            Packs a boolean array of 64 bits into an integer
+        """
+        return int(np.packbits(bits.ravel()).view(">u8")[0])
+
+    @staticmethod
+    def average(matrix: np.ndarray) -> int:
+        """
+            aHash: which pixels of the 8x8 thumbnail are brighter than the mean
+        """
+        small = ImageHash.resize(matrix, ImageHash.HASH_SIZE, ImageHash.HASH_SIZE)
+
+        return ImageHash.to_int(small > small.mean())
+
+    @staticmethod
+    def difference(matrix: np.ndarray) -> int:
+        """
+            dHash: which pixels of the 8x9 thumbnail are brighter than their right neighbour
+        """
+        small = ImageHash.resize(matrix, ImageHash.HASH_SIZE, ImageHash.HASH_SIZE + 1)
+
+        return ImageHash.to_int(small[:, :-1] > small[:, 1:])
+
+    @staticmethod
+    def perceptual(matrix: np.ndarray) -> int:
+        """
+            pHash: which of the 8x8 lowest frequency DCT coefficients
+            of the 32x32 thumbnail are above their median
+        """
+        small = ImageHash.resize(matrix, 4 * ImageHash.HASH_SIZE, 4 * ImageHash.HASH_SIZE)
+        low = fft.dctn(small, norm="ortho")[:ImageHash.HASH_SIZE, :ImageHash.HASH_SIZE]
+
+        return ImageHash.to_int(low > np.median(low))
+
+    METHODS = {
+        "ahash": average.__func__,
+        "dhash": difference.__func__,
+        "phash": perceptual.__func__,
+    }
+
+    @staticmethod
+    def from_file(file_path: str, method: str = "phash") -> int:
+        """
+            Computes the hash of an image file
+        """
+        return ImageHash.METHODS[method](Images.to_vector(file_path))
+
+    @staticmethod
+    def distance(hashes: np.ndarray, hash: int) -> np.ndarray:
+        """
+            Hamming distances between an array of uint64 hashes and one hash
+        """
+        xor = np.bitwise_xor(hashes, np.uint64(hash))
+
+        return POPCOUNT_8[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+class HashIndex:
+    """
+        Index of 64 bit hashes answering hamming radius and k nearest
+        neighbour queries with multi-index hashing: the hashes are split in
+        `tables` substrings of 16 bits and, by the pigeonhole principle, any
+        hash within distance tables * (r + 1) - 1 of the query matches it in
+        at least one substring within distance r. Each substring is kept in a
+        sorted array, so the probes are answered with binary searches instead
+        of a linear scan over the whole collection
+    """
+
+    TABLES = 4
+
+    # Largest substring radius that is probed; beyond it a vectorized linear scan is cheaper
+    MAX_PROBE_RADIUS = 3
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self.buffer = np.empty(0, dtype=np.uint64)
+        self.alive_buffer = np.empty(0, dtype=bool)
+        self.positions: Dict[str, int] = {}
+        self.sorted_values: List[np.ndarray] = []
+        self.sorted_ids: List[np.ndarray] = []
+        self.indexed = 0
+        self.dirty = True
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @property
+    def hashes(self) -> np.ndarray:
+        """
+            Hash of every slot, including the removed ones
+        """
+        return self.buffer[:len(self.keys)]
+
+    @property
+    def alive(self) -> np.ndarray:
+        """
+            Whether every slot still holds a key of the index
+        """
+        return self.alive_buffer[:len(self.keys)]
+
+    def reserve(self, size: int) -> None:
+        """
+            Grows the slot buffers geometrically, so that adding is amortized O(len(keys))
+        """
+        if size <= len(self.buffer):
+            return
+
+        capacity = max(size, 2 * len(self.buffer))
+        buffer = np.empty(capacity, dtype=np.uint64)
+        alive = np.zeros(capacity, dtype=bool)
+        buffer[:len(self.keys)] = self.hashes
+        alive[:len(self.keys)] = self.alive
+        self.buffer, self.alive_buffer = buffer, alive
+
+    def add(self, keys: Sequence[str], hashes: Sequence[int]) -> None:
+        """
+            Adds hashes identified by keys (e.g. file paths).
+            Keys already in the index have their hash replaced and,
+            when a key is repeated in keys, its last hash is kept.
+            The new slots are merged into the sorted tables on the next query
+        """
+        keys = list(keys)
+        hashes = np.asarray(hashes, dtype=np.uint64).reshape(-1)
+
+        if len(keys) != len(hashes):
+            raise ValueError("keys and hashes must have the same length")
+
+        #first occurrence of every key in the reversed keys, i.e. its last occurrence
+        _, last = np.unique(np.array(keys[::-1], dtype=object), return_index=True)
+        kept = np.sort(len(keys) - 1 - last)
+
+        if len(kept) < len(keys):
+            keys = [keys[i] for i in kept]
+            hashes = hashes[kept]
+
+        self.remove([key for key in keys if key in self.positions])
+
+        start = len(self.keys)
+        self.reserve(start + len(keys))
+        self.buffer[start:start + len(keys)] = hashes
+        self.alive_buffer[start:start + len(keys)] = True
+        self.keys.extend(keys)
+        self.positions.update((key, start + i) for i, key in enumerate(keys))
+
+    def add_files(self, paths: Sequence[str], method: str = "phash", workers: Optional[int] = None) -> None:
+        """
+            Hashes the received image files, in worker processes, and adds them to the index
+        """
+        with ProcessPoolExecutor(workers) as executor:
+            hashes = list(executor.map(ImageHash.from_file, paths, [method] * len(paths), chunksize=64))
+
+        self.add(paths, hashes)
+
+    def remove(self, keys: Sequence[str]) -> None:
+        """
+            Removes keys from the index. Their slots are dropped on compact or save
+        """
+        for key in keys:
+            self.alive_buffer[self.positions.pop(key)] = False
+
+    def compact(self) -> None:
+        """
+            Drops the slots of removed keys
+        """
+        alive = self.alive
+        self.buffer = self.hashes[alive]
+        self.keys = [key for key, kept in zip(self.keys, alive) if kept]
+        self.alive_buffer = np.ones(len(self.keys), dtype=bool)
+        self.positions = {key: i for i, key in enumerate(self.keys)}
+        self.dirty = True
+
+    def substrings(self, hashes: np.ndarray, table: int) -> np.ndarray:
+        return ((hashes >> np.uint64(16 * table)) & np.uint64(0xFFFF)).astype(np.uint16)
+
+    def build(self) -> None:
+        """
+            Brings the sorted substring tables up to date before a query.
+            After compact or load every table is sorted from scratch; otherwise
+            only the slots added since the last query are sorted and merged
+            into each table with binary searches, in O(N + m log m)
+        """
+        if self.dirty:
+            self.sorted_values, self.sorted_ids = [], []
+
+            for table in range(HashIndex.TABLES):
+                values = self.substrings(self.hashes, table)
+                order = np.argsort(values, kind="stable")
+                self.sorted_values.append(values[order])
+                self.sorted_ids.append(order)
+
+            self.indexed = len(self.keys)
+            self.dirty = False
+
+        if self.indexed == len(self.keys):
+            return
+
+        pending = np.arange(self.indexed, len(self.keys))
+
+        for table in range(HashIndex.TABLES):
+            values = self.substrings(self.hashes[pending], table)
+            order = np.argsort(values, kind="stable")
+            values, ids = values[order], pending[order]
+            at = np.searchsorted(self.sorted_values[table], values, side="right")
+            self.sorted_values[table] = np.insert(self.sorted_values[table], at, values)
+            self.sorted_ids[table] = np.insert(self.sorted_ids[table], at, ids)
+
+        self.indexed = len(self.keys)
+
+    def candidates(self, hash: int, sub_radius: int) -> np.ndarray:
+        """
+            Retrieves the ids of the hashes that match the query
+            in at least one substring within distance sub_radius
+        """
+        self.build()
+        masks = np.flatnonzero(POPCOUNT_16 <= sub_radius).astype(np.uint16)
+        query = np.array([hash], dtype=np.uint64)
+        found = []
+
+        for table in range(HashIndex.TABLES):
+            probes = self.substrings(query, table)[0] ^ masks
+            starts = np.searchsorted(self.sorted_values[table], probes, side="left")
+            ends = np.searchsorted(self.sorted_values[table], probes, side="right")
+            lengths = ends - starts
+
+            # Concatenates every [start, end) range of sorted positions without a python loop
+            offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+            found.append(self.sorted_ids[table][np.arange(lengths.sum()) + offsets])
+
+        return np.unique(np.concatenate(found))
+
+    def query_radius(self, hash: int, radius: int) -> List[Tuple[str, int]]:
+        """
+            Retrieves the (key, distance) of every hash within the
+            hamming radius of the query, closest first
+        """
+        sub_radius = radius // HashIndex.TABLES
+
+        if sub_radius > HashIndex.MAX_PROBE_RADIUS:
+            ids = np.flatnonzero(self.alive)
+        else:
+            ids = self.candidates(hash, sub_radius)
+            ids = ids[self.alive[ids]]
+
+        distances = ImageHash.distance(self.hashes[ids], hash)
+        selected = distances <= radius
+        ids, distances = ids[selected], distances[selected]
+        order = np.argsort(distances, kind="stable")
+
+        return [(self.keys[i], int(d)) for i, d in zip(ids[order], distances[order])]
+
+    def query_knn(self, hash: int, k: int) -> List[Tuple[str, int]]:
+        """
+            Retrieves the (key, distance) of the k hashes closest to the query,
+            growing the search radius until k results are guaranteed
+        """
+        for sub_radius in range(HashIndex.MAX_PROBE_RADIUS + 1):
+            results = self.query_radius(hash, HashIndex.TABLES * (sub_radius + 1) - 1)
+
+            if len(results) >= k:
+                return results[:k]
+
+        return self.query_radius(hash, 64)[:k]
+
+    def save(self, file_path: str) -> None:
+        """
+            Saves the index as a compressed .npz file: 8 bytes of packed bits
+            per hash, plus the keys as concatenated UTF-8 bytes and their offsets
+        """
+        self.compact()
+        encoded = [key.encode("utf-8") for key in self.keys]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(key) for key in encoded], out=offsets[1:])
+        key_bytes = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+        np.savez_compressed(file_path, hashes=self.hashes, key_bytes=key_bytes, key_offsets=offsets)
+
+    @staticmethod
+    def load(file_path: str) -> "HashIndex":
+        """
+            Loads an index saved with save
+        """
+        data = np.load(file_path)
+
+        if "key_bytes" in data:
+            blob = data["key_bytes"].tobytes()
+            offsets = data["key_offsets"].tolist()
+            keys = [blob[start:end].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])]
+        else:
+            #indexes saved before the keys were stored as UTF-8 bytes
+            keys = data["keys"].tolist()
+
+        index = HashIndex()
+        index.add(keys, data["hashes"])
+
+        return index
@@ -1,9 +1,14 @@
+import io
 import numpy as np
 import os
 import sys
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from os import path
 from PIL import Image
-from typing import List
+from typing import List, Optional, Tuple
 from skimage.metrics import mean_squared_error as mse
 from skimage.metrics import structural_similarity as ssim
 
@@ -13,13 +18,18 @@ class Images:
         pass
     
     @staticmethod
-    def to_vector(file_path: str, height: int = 0, width: int = 0) -> np.ndarray:
+    def to_vector(file_path: str, height: int = 0, width: int = 0, draft: bool = False) -> np.ndarray:
         """
             It receives an absolute path to an image file and retreives a vector
             height or width, if passed, resize the vector.
+            draft lets JPEG decoders downscale while decoding, which is
+            much faster for thumbnails but gives slightly different pixels
         """
         img = Image.open(file_path)
 
+        if draft and height > 0 and width > 0:
+            img.draft("L", (width, height))
+
         #convert image to grey scale
         img = img.convert("L")
 
@@ -31,18 +41,104 @@ class Images:
 
         return matrix
 
+    # Serializes the lifting of Pillow's process-wide pixel limit in open_large
+    LARGE_IMAGE_LOCK = threading.Lock()
+
     @staticmethod
-    def split_images(matrix: np.ndarray, vertical: int = 1, horizontal: int = 1) -> List[np.ndarray]:
+    def open_large(file_path: str) -> Image.Image:
         """
-            Splits an image matrix evenly in vertical * horizontal pieces
-            If those arguments are not specified the matrix is not altered
+            Opens an image without Pillow's decompression bomb limit
+            (Image.MAX_IMAGE_PIXELS), for slides and scans known to be huge
+            The limit is a process-wide setting, so it is only lifted when
+            the image exceeds it, under a lock, while the header is read
+            Nothing is decoded yet: the pixels are loaded on first use
         """
-        height, width = matrix.shape
+        try:
+            return Image.open(file_path)
+        except Image.DecompressionBombError:
+            pass
+
+        with Images.LARGE_IMAGE_LOCK:
+            limit = Image.MAX_IMAGE_PIXELS
+            Image.MAX_IMAGE_PIXELS = None
+
+            try:
+                return Image.open(file_path)
+            finally:
+                Image.MAX_IMAGE_PIXELS = limit
+
+    # Modes whose pixels can be mapped straight from the file, one byte per band
+    RAW_MODES = ("L", "RGB", "RGBA")
+
+    # Largest image, in pixels, that export_tiles decodes whole when it cannot map the file
+    MAX_DECODED_PIXELS = 1 << 28
+
+    @staticmethod
+    def memmap_pixels(file_path: str) -> Optional[np.ndarray]:
+        """
+            Retrieves the pixels of a .npy file or of an uncompressed image
+            stored in a single contiguous block (PPM/PGM, single strip TIFF)
+            as a memory-mapped (height, width[, bands]) array, without
+            decoding it, or None when the file cannot be mapped
+        """
+        if str(file_path).endswith(".npy"):
+            return np.load(file_path, mmap_mode="r")
+
+        img = Images.open_large(file_path)
+
+        if len(img.tile) != 1 or img.mode not in Images.RAW_MODES:
+            return None
+
+        decoder, _, offset, args = img.tile[0]
+
+        if decoder != "raw":
+            return None
+
+        #the raw decoder arguments are the raw mode and, optionally, the stride and orientation
+        if isinstance(args, str):
+            args = (args,)
+
+        raw_mode, stride, orientation = (tuple(args) + (0, 1)[len(args) - 1:])[:3]
+        bands = len(img.getbands())
 
+        if raw_mode != img.mode or stride not in (0, img.width * bands) or orientation != 1:
+            return None
+
+        return np.memmap(file_path, dtype=np.uint8, mode="r", offset=offset, shape=(img.height, img.width, bands))
+
+    @staticmethod
+    def read_level(pixels: np.ndarray, level: int, box: Tuple[int, int, int, int], grayscale: bool) -> Image.Image:
+        """
+            Reads the (left, top, right, bottom) box of a pyramid level
+            from the memory-mapped level 0 pixels, halving the matching
+            level 0 region level times, so only that region is read
+            The region starts at a multiple of 2 ** level, so the result
+            is identical to halving the whole image level times
+        """
+        scale = 1 << level
+        left, top, right, bottom = (side * scale for side in box)
+        region = np.asarray(pixels[top:bottom, left:right])
+
+        piece = Image.fromarray(region[..., 0] if region.ndim == 3 and region.shape[-1] == 1 else region)
+
+        if grayscale:
+            piece = piece.convert("L")
+
+        for _ in range(level):
+            piece = piece.reduce(2)
+
+        return piece
+
+    @staticmethod
+    def split_bounds(height: int, width: int, vertical: int = 1, horizontal: int = 1) -> List[Tuple[int, int, int, int]]:
+        """
+            Computes the (h_start, h_end, w_start, w_end) bounds of the
+            vertical * horizontal pieces of a height x width matrix, row by row
+        """
         h_delta = height/horizontal
         w_delta = width/vertical
 
-        matrices = []
+        bounds = []
 
         for i in range(horizontal):
             h_start = round( i * h_delta )
@@ -52,31 +148,150 @@ class Images:
                 w_start = round( j * w_delta )
                 w_end = round( (j + 1) * w_delta )
 
-                matrices.append(matrix[h_start:h_end, w_start:w_end])
-        
-        return matrices
+                bounds.append((h_start, h_end, w_start, w_end))
+
+        return bounds
+
+    @staticmethod
+    def split_images(matrix: np.ndarray, vertical: int = 1, horizontal: int = 1) -> List[np.ndarray]:
+        """
+            Splits an image matrix evenly in vertical * horizontal pieces
+            If those arguments are not specified the matrix is not altered
+        """
+        height, width = matrix.shape[:2]
+
+        return [
+            matrix[h_start:h_end, w_start:w_end]
+            for h_start, h_end, w_start, w_end in Images.split_bounds(height, width, vertical, horizontal)
+        ]
 
     @staticmethod
-    def split_and_save_main_img(img_path: str, vertical: int, horizontal: int):
+    def split_and_save_main_img(img_path: str, vertical: int, horizontal: int, output: Optional[str] = None) -> List[str]:
         """
-            Split and save the received image path
+            Split and save the received image path as grayscale
+            PNG pieces (part_0.png, part_1.png, ...) into output,
+            which defaults to main/imgs under the current directory
         """
-        matrices = Images.split_images(Images.to_vector(img_path), vertical, horizontal)
+        if output is None:
+            output = path.join(path.abspath(os.curdir), "main/imgs")
 
-        i = 0
+        return Images.export_tiles(img_path, output, vertical, horizontal)
 
-        for M in matrices:
-            
-            img = Image.fromarray()
+    @staticmethod
+    def export_tiles(img_path: str, output: str, vertical: int = 1, horizontal: int = 1, tile_size: int = 0,
+                     overlap: int = 0, levels: int = 1, grayscale: bool = True, workers: Optional[int] = None,
+                     max_pixels: Optional[int] = None) -> List[str]:
+        """
+            Splits an image with the split_images geometry and
+            streams the pieces as PNG files, encoded by a thread pool,
+            into the output directory or into a single .zip archive
+
+            tile_size, if passed, replaces vertical and horizontal by
+            as many pieces as needed for each side to be at most tile_size
+            overlap extends every piece by that many pixels on each side
+            levels builds a pyramid: each level halves the previous one
+            and is written under level_<n>/ when there is more than one
+
+            uint8 .npy files and uncompressed PPM/TIFF images (see
+            memmap_pixels) are never loaded whole: every piece is read
+            from a memory map by the thread that encodes it. Other formats
+            have to be decoded whole, so images with more than max_pixels
+            pixels (MAX_DECODED_PIXELS by default) are rejected
+
+            Retrieves the names of the written pieces
+        """
+        pixels = Images.memmap_pixels(img_path)
+        img = None
 
-            img.show()
+        if pixels is not None:
+            if pixels.dtype != np.uint8 or pixels.ndim not in (2, 3) or pixels.shape[2:] not in ((), (1,), (3,), (4,)):
+                raise ValueError("tiles can only be exported from uint8 (height, width[, 1, 3 or 4]) arrays")
 
-            img_path = path.join(path.abspath(os.curdir), "main/imgs/part_{0}.png".format(i))
+            height, width = pixels.shape[:2]
+        else:
+            img = Images.open_large(img_path)
+            width, height = img.size
+            max_pixels = Images.MAX_DECODED_PIXELS if max_pixels is None else max_pixels
 
-            i += 1
+            if width * height > max_pixels:
+                raise ValueError(
+                    "{0} has {1} pixels and would be decoded whole; convert it to .npy or to an "
+                    "uncompressed PPM/TIFF to export its tiles from a memory map".format(img_path, width * height)
+                )
+
+            #decode once, in grayscale when requested, before the threads encode its crops
+            if grayscale:
+                img = img.convert("L")
+
+            img.load()
+
+        archive = zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) if output.endswith(".zip") else None
+        workers = workers or os.cpu_count()
+        pending = deque()
+        names = []
+
+        def encode(piece: Optional[Image.Image], level: int, box: Tuple[int, int, int, int], name: str) -> Tuple[str, Optional[bytes]]:
+            if piece is None:
+                piece = Images.read_level(pixels, level, box, grayscale)
+
+            if archive is None:
+                piece.save(path.join(output, name), format="PNG")
+                return name, None
+
+            buffer = io.BytesIO()
+            piece.save(buffer, format="PNG")
+            return name, buffer.getvalue()
+
+        def finish(future) -> None:
+            name, data = future.result()
+
+            if archive is not None:
+                archive.writestr(name, data)
+
+            names.append(name)
+
+        try:
+            with ThreadPoolExecutor(workers) as executor:
+                for level in range(levels):
+                    if level > 0:
+                        #every level halves the previous one, rounding up like Image.reduce
+                        height, width = -(-height // 2), -(-width // 2)
+
+                        if img is not None:
+                            img = img.reduce(2)
+
+                    prefix = "level_{0}/".format(level) if levels > 1 else ""
+
+                    if archive is None:
+                        os.makedirs(path.join(output, prefix), exist_ok=True)
+
+                    if tile_size > 0:
+                        vertical = -(-width // tile_size)
+                        horizontal = -(-height // tile_size)
+
+                    bounds = Images.split_bounds(height, width, vertical, horizontal)
+
+                    for i, (h_start, h_end, w_start, w_end) in enumerate(bounds):
+                        box = (
+                            max(0, w_start - overlap), max(0, h_start - overlap),
+                            min(width, w_end + overlap), min(height, h_end + overlap),
+                        )
+                        name = "{0}part_{1}.png".format(prefix, i)
+                        piece = img.crop(box) if img is not None else None
+                        pending.append(executor.submit(encode, piece, level, box, name))
+
+                        #keep a bounded number of encoded pieces in memory
+                        while len(pending) > 4 * workers:
+                            finish(pending.popleft())
+
+                while pending:
+                    finish(pending.popleft())
+        finally:
+            if archive is not None:
+                archive.close()
+
+        return names
 
-            img.save(fp=img_path, format="PNG")
-    
     @staticmethod
     def is_image(file_path: str) -> bool:
         """
@@ -95,6 +310,37 @@ class Images:
 
         return False
 
+    # Leading bytes (and their offset) that identify each image format
+    MAGIC_BYTES = [
+        (0, b"\xff\xd8\xff", "jpeg"),
+        (0, b"\x89PNG\r\n\x1a\n", "png"),
+        (0, b"GIF87a", "gif"),
+        (0, b"GIF89a", "gif"),
+        (0, b"BM", "bmp"),
+        (0, b"II*\x00", "tiff"),
+        (0, b"MM\x00*", "tiff"),
+        (8, b"WEBP", "webp"),
+    ]
+
+    @staticmethod
+    def sniff_image(file_path: str) -> Optional[str]:
+        """
+            Identifies the image format of a file by its
+            leading bytes instead of its extension, retrieving
+            None if the file is missing or not a known image
+        """
+        try:
+            with open(file_path, "rb") as file:
+                header = file.read(16)
+        except OSError:
+            return None
+
+        for offset, magic, name in Images.MAGIC_BYTES:
+            if header[offset:offset + len(magic)] == magic:
+                return name
+
+        return None
+
     @staticmethod
     def get_imgs() -> List[str]:
         """
@@ -0,0 +1,149 @@
+import argparse
+import glob
+import numpy as np
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from os import path
+from typing import List, Sequence, Tuple
+from images import Images
+from similarity import ImageStore
+
+class Ingestor:
+    """
+        Bulk ingestion of image files into one memory mapped .npy stack of
+        grayscale matrices plus a manifest, in the layout read by ImageStore.load
+    """
+
+    REJECTED_FILE = "rejected.txt"
+
+    # Number of files decoded by each worker task
+    BATCH_SIZE = 256
+
+    @staticmethod
+    def expand(inputs: Sequence[str]) -> List[str]:
+        """
+            Expands directories (recursively) and glob patterns
+            into a list of files, without duplicates
+        """
+        files = []
+
+        for entry in inputs:
+            if path.isdir(entry):
+                for root, _, names in sorted(os.walk(entry)):
+                    files.extend(path.join(root, name) for name in sorted(names))
+            elif glob.has_magic(entry):
+                files.extend(sorted(glob.glob(entry, recursive=True)))
+            else:
+                files.append(entry)
+
+        return list(dict.fromkeys(files))
+
+    @staticmethod
+    def decode_batch(stack_path: str, batch: List[Tuple[int, str]], height: int, width: int) -> List[Tuple[int, str]]:
+        """
+            Decodes a batch of (row, file path) straight into the rows of
+            the stack and retrieves the (row, error) of the files that failed
+        """
+        stack = np.load(stack_path, mmap_mode="r+")
+        errors = []
+
+        for row, file_path in batch:
+            try:
+                stack[row] = Images.to_vector(file_path, height, width, draft=True)
+            except Exception as error:
+                errors.append((row, "{0}: {1}".format(type(error).__name__, error)))
+
+        stack.flush()
+
+        return errors
+
+    @staticmethod
+    def compact(stack_path: str, keep: np.ndarray) -> None:
+        """
+            Rewrites the stack keeping only the received rows
+        """
+        stack = np.load(stack_path, mmap_mode="r")
+        temp_path = stack_path + ".tmp.npy"
+        compacted = np.lib.format.open_memmap(temp_path, mode="w+", dtype=stack.dtype, shape=(len(keep),) + stack.shape[1:])
+
+        for start in range(0, len(keep), Ingestor.BATCH_SIZE):
+            compacted[start:start + Ingestor.BATCH_SIZE] = stack[keep[start:start + Ingestor.BATCH_SIZE]]
+
+        compacted.flush()
+        del stack, compacted
+        os.replace(temp_path, stack_path)
+
+    @staticmethod
+    def ingest(inputs: Sequence[str], output_dir: str, height: int = 128, width: int = 128,
+               workers: int = None) -> Tuple[List[str], List[Tuple[str, str]]]:
+        """
+            Ingests the images found in inputs (files, directories or globs)
+            into output_dir and retrieves the ingested paths and the
+            (path, reason) of every rejected file. Bad files never stop the ingestion
+        """
+        valid, rejected = [], []
+
+        for file_path in Ingestor.expand(inputs):
+            if Images.sniff_image(file_path):
+                valid.append(file_path)
+            else:
+                rejected.append((file_path, "not an image" if path.isfile(file_path) else "not a file"))
+
+        os.makedirs(output_dir, exist_ok=True)
+        stack_path = path.join(output_dir, ImageStore.MATRICES_FILE)
+        failed = []
+
+        if valid:
+            np.lib.format.open_memmap(stack_path, mode="w+", dtype=np.uint8, shape=(len(valid), height, width)).flush()
+
+            rows = list(enumerate(valid))
+            batches = [rows[i:i + Ingestor.BATCH_SIZE] for i in range(0, len(rows), Ingestor.BATCH_SIZE)]
+
+            with ProcessPoolExecutor(workers) as executor:
+                futures = [executor.submit(Ingestor.decode_batch, stack_path, batch, height, width) for batch in batches]
+
+                for future in futures:
+                    failed.extend(future.result())
+        else:
+            np.save(stack_path, np.empty((0, height, width), dtype=np.uint8))
+
+        if failed:
+            failed_rows = {row for row, _ in failed}
+            rejected.extend((valid[row], reason) for row, reason in failed)
+            keep = np.array([row for row in range(len(valid)) if row not in failed_rows], dtype=int)
+            Ingestor.compact(stack_path, keep)
+            valid = [valid[row] for row in keep]
+
+        # Thumbnails from a previous ingestion into the same directory would be stale
+        thumbnails_path = path.join(output_dir, ImageStore.THUMBNAILS_FILE)
+
+        if path.isfile(thumbnails_path):
+            os.remove(thumbnails_path)
+
+        with open(path.join(output_dir, ImageStore.MANIFEST_FILE), "w") as manifest:
+            manifest.write("\n".join(valid))
+
+        with open(path.join(output_dir, Ingestor.REJECTED_FILE), "w") as report:
+            report.write("\n".join("{0}\t{1}".format(file_path, reason) for file_path, reason in rejected))
+
+        return valid, rejected
+
+def main(argv: Sequence[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Ingests images into a memory mapped .npy stack of grayscale matrices")
+    parser.add_argument("inputs", nargs="+", help="image files, directories or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="output directory")
+    parser.add_argument("--height", type=int, default=128)
+    parser.add_argument("--width", type=int, default=128)
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    ingested, rejected = Ingestor.ingest(args.inputs, args.output, args.height, args.width, args.workers)
+
+    for file_path, reason in rejected:
+        print("rejected {0}: {1}".format(file_path, reason), file=sys.stderr)
+
+    print("ingested {0} images, rejected {1} files".format(len(ingested), len(rejected)))
+
+if __name__ == "__main__":
+    main()
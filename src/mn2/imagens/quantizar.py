@@ -1,19 +1,135 @@
 import Imagem
-import copy
+import numpy as np
 
 # Clusterização com K-Means
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 
-def quantizar(img, n_colors):
+# Busca da cor mais próxima da paleta
+from scipy.spatial import cKDTree
+
+# Número de pixels sorteados para ajustar a paleta
+AMOSTRAS = 20000
+
+# Bits por canal da tabela de consulta (LUT) de cores, de acordo com o número de canais.
+# Com 3 canais e 6 bits, a tabela tem 64^3 células
+BITS_LUT = {1: 8, 2: 8, 3: 6}
+
+def amostrar_pixels(imagens, amostras=AMOSTRAS, semente=0):
+  """
+  Sorteia aproximadamente `amostras` pixels, divididos igualmente entre as imagens.
+  Retorna um array (amostras, canais) de floats entre 0 e 1.
+  """
+  rng = np.random.default_rng(semente)
+  por_imagem = max(1, amostras // len(imagens))
+  partes = []
+  for img in imagens:
+    # Visão (pixels, canais) dos dados, sem cópia; só a amostra é convertida para float
+    pixels = img.dados.reshape(-1, img.canais)
+    amostra = pixels[rng.integers(0, len(pixels), min(por_imagem, len(pixels)))]
+    partes.append(Imagem.Imagem(amostra, len(amostra), 1, None, img.modo).normalizados().reshape(-1, img.canais))
+  return np.concatenate(partes)
+
+def ajustar_paleta(imagens, n_colors, amostras=AMOSTRAS, mini_batch=False, semente=0):
+  """
+  Calcula uma paleta com n_colors cores usando K-Means sobre uma amostra dos pixels.
+
+  Parametros:
+  imagens (Image ou lista de Image): A imagem, ou as imagens que vão compartilhar a paleta
+  n_colors (int): O número de cores da paleta
+  amostras (int): Quantos pixels sortear para o ajuste
+  mini_batch (bool): Se verdadeiro, usa MiniBatchKMeans, mais rápido para amostras grandes
+  semente (int): Semente do sorteio e do K-Means
+
+  Retorna:
+  ndarray: A paleta (n_colors, canais) com floats entre 0 e 1
+  """
+  if isinstance(imagens, Imagem.Imagem):
+    imagens = [imagens]
+  amostra = amostrar_pixels(imagens, amostras, semente)
+  if mini_batch:
+    kmeans = MiniBatchKMeans(n_colors, random_state=semente)
+  else:
+    kmeans = KMeans(n_colors, n_init=4, random_state=semente)
+  return kmeans.fit(amostra).cluster_centers_.astype(np.float32)
+
+def tipo_indices(paleta):
+  return np.uint8 if len(paleta) <= 256 else np.uint16
+
+def tabela_cores(paleta):
+  """
+  Pré-calcula a tabela de consulta (LUT) com o índice da cor da paleta mais próxima do
+  centro de cada célula do espaço de cores. Com 8 bits por canal, a tabela é exata.
+  """
+  canais = paleta.shape[-1]
+  bits = BITS_LUT[canais]
+  passo = 1 << (8 - bits)
+  # Centro, entre 0 e 1, dos valores uint8 que caem em cada célula
+  eixo = (np.arange(1 << bits) * passo + (passo - 1) / 2) / 255
+  grade = np.stack(np.meshgrid(*[eixo] * canais, indexing="ij"), axis=-1).reshape(-1, canais)
+  return cKDTree(paleta).query(grade)[1].astype(tipo_indices(paleta))
+
+def indexar(img, paleta, lut=None, metodo="lut"):
+  """
+  Atribui a cada pixel o índice da cor mais próxima da paleta, de forma vetorizada.
+
+  Parametros:
+  img (Image): A imagem
+  paleta (ndarray): Paleta (n_cores, canais) com floats entre 0 e 1
+  lut (ndarray): Tabela pré-calculada por tabela_cores, para reaproveitar entre imagens
+  metodo (str): "lut" para consultar a tabela de cores (imagens com até 3 canais), ou
+    "kdtree" para a busca exata em uma KD-tree
+
+  Retorna:
+  ndarray: Matriz (altura, largura) de índices uint8 (uint16 se houver mais de 256 cores)
+  """
+  canais = img.canais
+  if metodo == "lut" and canais in BITS_LUT:
+    if lut is None:
+      lut = tabela_cores(paleta)
+    bits = BITS_LUT[canais]
+    codigos = Imagem.para_uint8(img.dados).reshape(-1, canais) >> (8 - bits)
+    chave = codigos[:, 0].astype(np.int32)
+    for canal in range(1, canais):
+      chave <<= bits
+      chave |= codigos[:, canal]
+    indices = lut[chave]
+  else:
+    indices = cKDTree(paleta).query(img.normalizados().reshape(-1, canais), workers=-1)[1]
+  return indices.astype(tipo_indices(paleta), copy=False).reshape(img.altura, img.largura)
+
+def quantizar_indices(img, n_colors, metodo="lut", **kwargs):
+  """
+  Reduz o número de cores da imagem para n_colors, no formato compacto de paleta e índices.
+  metodo é o de indexar ("lut" ou "kdtree"); os argumentos adicionais são os de ajustar_paleta.
+
+  Retorna:
+  tuple: A paleta (n_colors, canais) e a matriz (altura, largura) de índices
+  """
+  paleta = ajustar_paleta(img, n_colors, **kwargs)
+  return paleta, indexar(img, paleta, metodo=metodo)
+
+def quantizar_lote(imagens, n_colors, metodo="lut", **kwargs):
+  """
+  Quantiza um lote de imagens com uma única paleta compartilhada, ajustada sobre pixels de
+  todas elas. Com metodo="lut", a tabela de cores é calculada uma só vez; com "kdtree", cada
+  imagem é indexada pela busca exata. Os argumentos adicionais são os de ajustar_paleta.
+
+  Retorna:
+  tuple: A paleta e a lista de matrizes de índices, uma por imagem
+  """
+  paleta = ajustar_paleta(imagens, n_colors, **kwargs)
+  lut = tabela_cores(paleta) if metodo == "lut" and paleta.shape[-1] in BITS_LUT else None
+  return paleta, [indexar(img, paleta, lut, metodo) for img in imagens]
+
+def quantizar(img, n_colors, metodo="lut", **kwargs):
   """
   Reduz o número de cores da imagem para n_colors. Utiliza K-Means para quantização.
 
   Parametros:
   img (Image): A imagem para ser quantizada
   n_colors (int): O número de cores para se ter na nova imagem.
+  metodo (str): Busca da cor mais próxima, "lut" ou "kdtree" (veja indexar)
+  Os argumentos adicionais são os de ajustar_paleta.
   """
-  quantized_image = copy.deepcopy(img)
-  kmeans = KMeans(n_colors).fit(img.dados)
-  for i in range(len(img.dados)):
-    quantized_image.dados[i] = kmeans.cluster_centers_[kmeans.labels_[i]]
-  return quantized_image
\ No newline at end of file
+  paleta, indices = quantizar_indices(img, n_colors, metodo, **kwargs)
+  return Imagem.Imagem(paleta[indices], img.largura, img.altura, img.formato, img.modo)
@@ -0,0 +1,195 @@
+import numpy as np
+import os
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from os import path
+from typing import List, Optional, Sequence, Tuple
+from skimage.metrics import mean_squared_error as mse
+from skimage.metrics import structural_similarity as ssim
+from images import Images
+
+class ImageStore:
+    """
+        Reference images decoded once into a stack of grayscale matrices,
+        all resized to the same shape, plus a thumbnail descriptor per image
+        used to prefilter candidates before the expensive comparisons
+    """
+
+    MATRICES_FILE = "matrices.npy"
+    THUMBNAILS_FILE = "thumbnails.npy"
+    MANIFEST_FILE = "manifest.txt"
+
+    def __init__(self, height: int = 128, width: int = 128, thumb_size: int = 16):
+        self.height = height
+        self.width = width
+        self.thumb_size = thumb_size
+        self.paths: List[str] = []
+        self.matrices = np.empty((0, height, width), dtype=np.uint8)
+        self.thumbnails = np.empty((0, thumb_size * thumb_size), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    @staticmethod
+    def thumbnail(matrices: np.ndarray, size: int) -> np.ndarray:
+        """
+            Computes a descriptor for each matrix of a (n, height, width) stack:
+            the size x size block averages, shifted to zero mean and scaled to
+            unit norm, so that euclidean distances between descriptors are
+            insensitive to global brightness and contrast changes
+        """
+        n, height, width = matrices.shape
+        block_h, block_w = height // size, width // size
+
+        blocks = matrices[:, :block_h * size, :block_w * size].reshape(n, size, block_h, size, block_w)
+        descriptors = blocks.mean(axis=(2, 4), dtype=np.float32).reshape(n, size * size)
+
+        descriptors -= descriptors.mean(axis=1, keepdims=True)
+        norms = np.linalg.norm(descriptors, axis=1, keepdims=True)
+
+        return descriptors / np.maximum(norms, 1e-6)
+
+    def decode(self, paths: Sequence[str], workers: Optional[int] = None) -> np.ndarray:
+        """
+            Decodes and resizes the images to the store shape,
+            spreading the work across worker processes
+        """
+        heights = [self.height] * len(paths)
+        widths = [self.width] * len(paths)
+
+        if workers == 1:
+            matrices = list(map(Images.to_vector, paths, heights, widths))
+        else:
+            with ProcessPoolExecutor(workers) as executor:
+                matrices = list(executor.map(Images.to_vector, paths, heights, widths, chunksize=64))
+
+        return np.stack(matrices) if matrices else np.empty((0, self.height, self.width), dtype=np.uint8)
+
+    def add(self, paths: Sequence[str], workers: Optional[int] = None) -> None:
+        """
+            Decodes the received image paths and appends them to the store
+        """
+        matrices = self.decode(paths, workers)
+
+        self.paths.extend(paths)
+        self.matrices = np.concatenate([self.matrices, matrices])
+        self.thumbnails = np.concatenate([self.thumbnails, ImageStore.thumbnail(matrices, self.thumb_size)])
+
+    def save(self, directory: str) -> None:
+        """
+            Saves the store to a directory, so that later runs skip decoding
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        np.save(path.join(directory, ImageStore.MATRICES_FILE), self.matrices)
+        np.save(path.join(directory, ImageStore.THUMBNAILS_FILE), self.thumbnails)
+
+        with open(path.join(directory, ImageStore.MANIFEST_FILE), "w") as manifest:
+            manifest.write("\n".join(self.paths))
+
+    @staticmethod
+    def load(directory: str, thumb_size: int = 16) -> "ImageStore":
+        """
+            Loads a store saved with save. The matrices are memory mapped,
+            so only the candidates that get compared are read from disk.
+            Thumbnails are recomputed if they are missing
+        """
+        matrices = np.load(path.join(directory, ImageStore.MATRICES_FILE), mmap_mode="r")
+
+        with open(path.join(directory, ImageStore.MANIFEST_FILE)) as manifest:
+            paths = manifest.read().splitlines()
+
+        store = ImageStore(matrices.shape[1], matrices.shape[2], thumb_size)
+        store.paths = paths
+        store.matrices = matrices
+
+        thumbnails_path = path.join(directory, ImageStore.THUMBNAILS_FILE)
+
+        if path.isfile(thumbnails_path):
+            store.thumbnails = np.load(thumbnails_path)
+            store.thumb_size = int(round(np.sqrt(store.thumbnails.shape[1])))
+        else:
+            store.thumbnails = ImageStore.thumbnail(np.asarray(matrices), thumb_size)
+
+        return store
+
+class ImageComparer:
+    """
+        Ranks the images of an ImageStore by similarity to query images:
+        every reference is prefiltered by thumbnail distance and only the
+        top_k closest candidates are compared with MSE and SSIM
+    """
+
+    def __init__(self, store: ImageStore, workers: Optional[int] = None):
+        self.store = store
+        self.workers = workers
+
+    @staticmethod
+    def score(query: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+        """
+            Computes the (mse, ssim) of the query against each candidate matrix
+        """
+        return np.array([(mse(query, candidate), ssim(query, candidate)) for candidate in candidates]).reshape(-1, 2)
+
+    def candidates(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+            Retrieves the indices and thumbnail distances of the top_k references
+            closest to the query matrix, ordered by distance
+        """
+        descriptor = ImageStore.thumbnail(query[np.newaxis], self.store.thumb_size)[0]
+        distances = np.linalg.norm(self.store.thumbnails - descriptor, axis=1)
+
+        top_k = min(top_k, len(distances))
+        indices = np.argpartition(distances, top_k - 1)[:top_k] if top_k > 0 else np.empty(0, dtype=int)
+        indices = indices[np.argsort(distances[indices])]
+
+        return indices, distances[indices]
+
+    def compare(self, query_path: str, top_k: int = 20) -> pd.DataFrame:
+        """
+            Compares one query image against the store and retrieves
+            a table ranked by SSIM (most similar first)
+        """
+        return self.compare_many([query_path], top_k).drop(columns="query")
+
+    def compare_many(self, query_paths: Sequence[str], top_k: int = 20) -> pd.DataFrame:
+        """
+            Compares several query images against the store and retrieves
+            one table with the top_k references of each query, ranked by SSIM
+        """
+        queries = self.store.decode(query_paths, workers=1)
+        jobs = []
+
+        for query in queries:
+            indices, distances = self.candidates(query, top_k)
+            # Sorting makes reads from a memory mapped store sequential
+            order = np.argsort(indices)
+            jobs.append((indices[order], distances[order], query))
+
+        if self.workers == 1:
+            scores = [ImageComparer.score(query, self.store.matrices[indices]) for indices, _, query in jobs]
+        else:
+            with ProcessPoolExecutor(self.workers) as executor:
+                # The candidates of each query are split in one chunk per worker
+                chunks = self.workers or os.cpu_count()
+                futures = [
+                    [executor.submit(ImageComparer.score, query, np.asarray(self.store.matrices[part]))
+                     for part in np.array_split(indices, min(chunks, max(1, len(indices))))]
+                    for indices, _, query in jobs
+                ]
+                scores = [np.concatenate([future.result() for future in parts]) for parts in futures]
+
+        tables = []
+
+        for query_path, (indices, distances, _), score in zip(query_paths, jobs, scores):
+            tables.append(pd.DataFrame({
+                "query": query_path,
+                "path": [self.store.paths[i] for i in indices],
+                "thumbnail_distance": distances,
+                "mse": score[:, 0],
+                "ssim": score[:, 1],
+            }).sort_values("ssim", ascending=False))
+
+        columns = ["query", "path", "thumbnail_distance", "mse", "ssim"]
+
+        return pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=columns)
@@ -0,0 +1,254 @@
+'''
+  Transformadas de Fourier de sinais reais em lote, e transformada de Fourier de tempo curto
+  (STFT) com os quadros tirados como vistas sobrepostas do sinal, sem cópia.
+
+  Os sinais são transformados juntos, ao longo de um eixo de uma matriz, usando todos os
+  núcleos (workers), e podem ser completados com zeros até o tamanho rápido seguinte
+  (next_fast_len), para o qual a FFT é bem mais rápida que para tamanhos com fatores primos
+  grandes. O scipy guarda os planos das FFTs já usadas; os tamanhos rápidos, os eixos de
+  frequência e as janelas são guardados aqui, por tamanho e taxa de amostragem, para que
+  análises com muitas janelas do mesmo tamanho não os recalculem.
+'''
+from functools import lru_cache
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from scipy import fft, signal
+
+# Quantidade de threads das FFTs (-1: todos os núcleos)
+WORKERS = -1
+
+
+@lru_cache(maxsize=256)
+def tamanho_rapido(n):
+    '''
+      Retorno: O menor tamanho maior ou igual a n para o qual a rFFT é rápida.
+      '''
+    return fft.next_fast_len(n, real=True)
+
+
+@lru_cache(maxsize=256)
+def frequencias(n, amostragem):
+    '''
+      Parametros:
+        entrada =
+          n: tamanho do sinal (com o preenchimento, se houver) no domínio do tempo
+          amostragem: Sample Rate do sinal em hertz
+      Retorno: Array, somente leitura, com a frequência de cada ponto da rFFT.
+      '''
+    eixo = fft.rfftfreq(n, 1 / amostragem)
+    eixo.setflags(write=False)
+
+    return eixo
+
+
+@lru_cache(maxsize=64)
+def janela(nome, n, dtype=np.float64):
+    '''
+      Parametros:
+        entrada =
+          nome: nome da janela no scipy.signal.get_window (ou tupla com nome e parâmetros)
+          n: tamanho da janela
+          dtype: tipo da janela
+      Retorno: Array, somente leitura, com a janela periódica (própria para FFTs).
+      '''
+    valores = signal.get_window(nome, n, fftbins=True).astype(dtype)
+    valores.setflags(write=False)
+
+    return valores
+
+
+def tamanho_transformada(pontos, n):
+    '''
+      Retorno: O tamanho, no domínio do tempo, da rFFT com pontos frequências de um sinal de n
+        amostras: tamanho_rapido(n) se ele foi preenchido por transformar, senão n.
+      '''
+    return tamanho_rapido(n) if pontos == tamanho_rapido(n) // 2 + 1 else n
+
+
+def transformar(sinais, eixo=-1, preencher=True):
+    '''
+      Parametros:
+        entrada =
+          sinais: array de floats com um sinal, ou com vários sinais, no domínio do tempo
+          eixo: eixo ao longo do qual estão as amostras
+          preencher: se verdadeiro, completa os sinais com zeros até tamanho_rapido
+      Retorno: A rFFT de todos os sinais ao longo do eixo (complex64 para sinais float32).
+      '''
+    sinais = np.asarray(sinais)
+    n = sinais.shape[eixo]
+
+    return fft.rfft(sinais, tamanho_rapido(n) if preencher else n, axis=eixo, workers=WORKERS)
+
+
+def inverter(espectros, n, eixo=-1):
+    '''
+      Parametros:
+        entrada =
+          espectros: rFFTs retornadas por transformar
+          n: tamanho original dos sinais no domínio do tempo
+          eixo: eixo ao longo do qual estão as frequências
+      Retorno: Os sinais no domínio do tempo, com exatamente n amostras, inclusive para n ímpar.
+      '''
+    espectros = np.asarray(espectros)
+    # Espectro de um sinal preenchido: a inversa tem o tamanho rápido e é cortada em n
+    n_fft = tamanho_transformada(espectros.shape[eixo], n)
+    sinais = fft.irfft(espectros, n_fft, axis=eixo, workers=WORKERS)
+
+    if n_fft == n:
+        return sinais
+    corte = [slice(None)] * sinais.ndim
+    corte[eixo] = slice(0, n)
+
+    return sinais[tuple(corte)]
+
+
+def quadros(sinais, tamanho, passo, centralizar=True):
+    '''
+      Parametros:
+        entrada =
+          sinais: array com um sinal, ou com vários sinais, ao longo do último eixo
+          tamanho: quantidade de amostras de cada quadro
+          passo: quantidade de amostras entre o início de um quadro e o do seguinte
+          centralizar: se verdadeiro, completa os sinais com tamanho//2 zeros em cada ponta, para
+            que o quadro t seja centrado na amostra t*passo
+      Retorno: Vista somente leitura (..., quadros, tamanho) dos sinais, sem cópia das amostras.
+      '''
+    sinais = np.asarray(sinais)
+    if centralizar:
+        metade = tamanho // 2
+        sinais = np.pad(sinais, [(0, 0)] * (sinais.ndim - 1) + [(metade, metade)])
+    n_quadros = max(0, 1 + (sinais.shape[-1] - tamanho) // passo)
+    forma = sinais.shape[:-1] + (n_quadros, tamanho)
+    passos = sinais.strides[:-1] + (sinais.strides[-1] * passo, sinais.strides[-1])
+
+    return as_strided(sinais, forma, passos, writeable=False)
+
+
+def tipo_real(dtype):
+    # float32 e complex64 são mantidos em precisão simples; os demais tipos usam float64
+    return np.float32 if np.dtype(dtype) in (np.float32, np.complex64) else np.float64
+
+
+def stft(sinais, tamanho=2048, passo=None, tipo_janela='hann', centralizar=True):
+    '''
+      Parametros:
+        entrada =
+          sinais: array com um sinal, ou com vários sinais, ao longo do último eixo
+          tamanho: quantidade de amostras de cada quadro (tamanho da FFT)
+          passo: quantidade de amostras entre quadros (padrão: tamanho//4)
+          tipo_janela: janela aplicada a cada quadro, como em janela
+          centralizar: como em quadros
+      Retorno: Array (..., tamanho//2 + 1, quadros) com a rFFT de cada quadro; complex64 para
+        sinais float32. Todos os quadros de todos os sinais são transformados por uma única rFFT.
+      '''
+    passo = passo or tamanho // 4
+    sinais = np.asarray(sinais)
+    dtype = tipo_real(sinais.dtype)
+    vistas = quadros(sinais.astype(dtype, copy=False), tamanho, passo, centralizar)
+    transformada = fft.rfft(vistas * janela(tipo_janela, tamanho, dtype), axis=-1, workers=WORKERS)
+
+    return np.swapaxes(transformada, -1, -2)
+
+
+def sobrepor(quadros_, passo):
+    '''
+      Soma quadros (..., quadros, tamanho) espaçados de passo amostras (overlap-add). Cada quadro
+      é dividido em pedaços de passo amostras, e os pedaços de mesma posição de todos os quadros
+      são somados de uma só vez: o laço é sobre tamanho/passo posições, não sobre os quadros.
+      '''
+    n_quadros, tamanho = quadros_.shape[-2:]
+    pedacos = -(-tamanho // passo)
+    if pedacos * passo != tamanho:
+        quadros_ = np.pad(quadros_, [(0, 0)] * (quadros_.ndim - 1) + [(0, pedacos * passo - tamanho)])
+    quadros_ = quadros_.reshape(quadros_.shape[:-1] + (pedacos, passo))
+
+    saida = np.zeros(quadros_.shape[:-3] + (n_quadros + pedacos - 1, passo), dtype=quadros_.dtype)
+    for j in range(pedacos):
+        saida[..., j:j + n_quadros, :] += quadros_[..., j, :]
+
+    return saida.reshape(saida.shape[:-2] + (-1,))
+
+
+def istft(espectros, passo=None, tipo_janela='hann', n=None, centralizar=True, tamanho=None):
+    '''
+      Parametros:
+        entrada =
+          espectros: array (..., frequências, quadros), como o retornado por stft
+          passo, tipo_janela, centralizar: os mesmos usados na stft
+          n: tamanho dos sinais originais (padrão: o que os quadros cobrem)
+          tamanho: tamanho dos quadros (padrão: 2*(frequências - 1))
+      Retorno: Os sinais no domínio do tempo. Com uma janela que satisfaz a condição NOLA (como
+        a de Hann com passo de até tamanho/2), a reconstrução é exata a menos de arredondamentos.
+      '''
+    espectros = np.swapaxes(np.asarray(espectros), -1, -2)
+    tamanho = tamanho or 2 * (espectros.shape[-1] - 1)
+    passo = passo or tamanho // 4
+    dtype = tipo_real(espectros.dtype)
+    valores_janela = janela(tipo_janela, tamanho, dtype)
+
+    sinais = sobrepor(fft.irfft(espectros, tamanho, axis=-1, workers=WORKERS) * valores_janela, passo)
+
+    # Divide pela soma das janelas ao quadrado que cobrem cada amostra
+    envelope = sobrepor(np.broadcast_to(valores_janela ** 2, (espectros.shape[-2], tamanho)), passo)
+    sinais /= np.where(envelope > np.finfo(dtype).tiny, envelope, 1)
+
+    inicio = tamanho // 2 if centralizar else 0
+    fim = sinais.shape[-1] - inicio if n is None else inicio + n
+
+    return sinais[..., inicio:fim]
+
+
+def stft_fluxo(blocos, tamanho=2048, passo=None, tipo_janela='hann', centralizar=True):
+    '''
+      STFT de um sinal longo lido em blocos (com as amostras no último eixo), mantendo em
+      memória só as amostras que ainda não formaram um quadro completo.
+
+      Retorno: Gerador de arrays (..., frequências, quadros) que, concatenados no último eixo,
+        são iguais à stft do sinal inteiro.
+      '''
+    passo = passo or tamanho // 4
+    metade = tamanho // 2 if centralizar else 0
+    restante = None
+
+    def emitir(amostras):
+        # Transforma os quadros completos e retorna as amostras a partir do próximo quadro
+        espectros = stft(amostras, tamanho, passo, tipo_janela, centralizar=False)
+        return espectros, amostras[..., espectros.shape[-1] * passo:]
+
+    for bloco in blocos:
+        bloco = np.asarray(bloco)
+        if restante is None:
+            restante = np.zeros(bloco.shape[:-1] + (metade,), dtype=tipo_real(bloco.dtype))
+        restante = np.concatenate([restante, bloco.astype(restante.dtype, copy=False)], axis=-1)
+        espectros, restante = emitir(restante)
+        if espectros.shape[-1]:
+            yield espectros
+
+    if restante is not None and metade:
+        zeros = np.zeros(restante.shape[:-1] + (metade,), dtype=restante.dtype)
+        espectros, _ = emitir(np.concatenate([restante, zeros], axis=-1))
+        if espectros.shape[-1]:
+            yield espectros
+
+
+def espectrograma(sinais, amostragem, tamanho=2048, passo=None, tipo_janela='hann', potencia=2.0, db=False):
+    '''
+      Parametros:
+        entrada =
+          sinais: array com um sinal, ou com vários sinais, ao longo do último eixo
+          amostragem: Sample Rate dos sinais em hertz
+          tamanho, passo, tipo_janela: como em stft
+          potencia: expoente da magnitude (1: magnitude, 2: potência)
+          db: se verdadeiro, retorna os valores em decibéis
+      Retorno: As frequências (hertz), os tempos do centro de cada quadro (segundos) e o
+        espectrograma (..., frequências, quadros).
+      '''
+    passo = passo or tamanho // 4
+    valores = np.abs(stft(sinais, tamanho, passo, tipo_janela))
+    if potencia != 1:
+        valores **= potencia
+    if db:
+        valores = (10 if potencia == 2 else 20 / potencia) * np.log10(np.maximum(valores, 1e-10))
+    tempos = np.arange(valores.shape[-1]) * passo / amostragem
+
+    return frequencias(tamanho, amostragem), tempos, valores
@@ -0,0 +1,291 @@
+'''
+  Processamento de sinais longos em blocos, sem carregar o sinal inteiro na memória.
+
+  Um Pipeline encadeia estágios (suavização, filtros FIR e IIR, remoção de frequências,
+  reamostragem) que guardam, entre um bloco e o seguinte, o estado necessário para que o
+  resultado seja o mesmo do processamento do sinal inteiro: os filtros FIR guardam as últimas
+  amostras de entrada (overlap-save) e os IIR o estado interno do sosfilt (zi). Os blocos são
+  lidos de arquivos de áudio, arquivos .npy, arrays ou geradores, e o resultado é escrito no
+  destino à medida que é calculado.
+'''
+from fractions import Fraction
+import numpy as np
+import soundfile as sf
+from scipy import signal
+from sinais import Sinais
+
+# Quantidade padrão de amostras por bloco lido
+TAMANHO_BLOCO = 1 << 16
+
+
+def ler_blocos(fonte, tamanho_bloco=TAMANHO_BLOCO):
+    '''
+      Parametros:
+        entrada =
+          fonte: caminho de um arquivo de áudio (qualquer formato do soundfile) ou .npy, array,
+            ou iterável de blocos (por exemplo um gerador lendo de um sensor)
+          tamanho_bloco: quantidade de amostras por bloco, para arquivos e arrays
+      Retorno: Gerador de blocos (amostras,) ou (amostras, canais) de floats.
+      '''
+    if isinstance(fonte, str) and fonte.endswith('.npy'):
+        fonte = np.load(fonte, mmap_mode='r')
+    if isinstance(fonte, str):
+        with sf.SoundFile(fonte) as arquivo:
+            yield from arquivo.blocks(tamanho_bloco, dtype='float32')
+    elif isinstance(fonte, np.ndarray):
+        for inicio in range(0, len(fonte), tamanho_bloco):
+            yield np.asarray(fonte[inicio:inicio + tamanho_bloco])
+    else:
+        for bloco in fonte:
+            yield np.asarray(bloco)
+
+
+def taxa_amostragem(fonte):
+    '''
+      Retorno: Sample Rate de um arquivo de áudio, ou None para as demais fontes.
+      '''
+    if isinstance(fonte, str) and not fonte.endswith('.npy'):
+        return sf.info(fonte).samplerate
+
+    return None
+
+
+class Estagio:
+    '''
+      Estágio de um Pipeline. Recebe blocos de amostras (o tempo é o primeiro eixo) e retorna os
+      blocos processados, que podem ter outro tamanho. finalizar retorna as amostras que ainda
+      estavam retidas no estado do estágio quando o sinal acaba.
+      '''
+
+    # Razão entre as taxas de amostragem da saída e da entrada
+    fator = Fraction(1)
+
+    def processar(self, bloco):
+        return bloco
+
+    def finalizar(self):
+        return None
+
+
+class EstagioFIR(Estagio):
+    '''
+      Convolução com um filtro FIR, com o mesmo resultado de Sinais.convolucao(sinal, filtro)
+      aplicada ao sinal inteiro (modo 'same'). Cada bloco é convoluído junto com as últimas
+      len(filtro) - 1 amostras do bloco anterior (overlap-save), pelo método de menor custo.
+      '''
+
+    def __init__(self, filtro):
+        self.filtro = np.asarray(filtro, dtype=float)
+        self.historia = None
+        # As primeiras (m - 1)//2 saídas causais ficam antes do início do modo 'same'
+        self.descartar = (len(self.filtro) - 1) // 2
+        self.amostras = 0
+        self.emitidas = 0
+
+    def convoluir(self, bloco):
+        m = len(self.filtro)
+        if self.historia is None:
+            self.historia = np.zeros((m - 1,) + bloco.shape[1:], dtype=np.result_type(bloco, float))
+        estendido = np.concatenate([self.historia, bloco])
+        self.historia = estendido[len(estendido) - (m - 1):]
+
+        # Saídas causais que dependem apenas das amostras já recebidas
+        filtro = self.filtro.reshape((-1,) + (1,) * (bloco.ndim - 1))
+        if Sinais.metodo_convolucao(len(estendido), m) == 'direct':
+            return signal.convolve(estendido, filtro, mode='valid', method='direct')
+
+        return signal.fftconvolve(estendido, filtro, mode='valid', axes=0)
+
+    def processar(self, bloco):
+        self.amostras += len(bloco)
+        saida = self.convoluir(bloco)
+        descartados = min(self.descartar, len(saida))
+        self.descartar -= descartados
+        self.emitidas += len(saida) - descartados
+
+        return saida[descartados:]
+
+    def finalizar(self):
+        if self.historia is None:
+            return None
+        # Zeros depois do fim completam as saídas das últimas amostras
+        faltam = self.amostras - self.emitidas
+        if faltam == 0:
+            return None
+        zeros = np.zeros((self.descartar + faltam,) + self.historia.shape[1:])
+        saida = self.convoluir(zeros)[self.descartar:]
+        self.emitidas += len(saida)
+
+        return saida
+
+
+class Suavizacao(EstagioFIR):
+    '''
+      O filtro em formato de sino de Sinais.suaviza, com tamanho_filtro amostras
+      (em Sinais.suaviza, tamanho_filtro = coeficiente*len(sinal)).
+      '''
+
+    def __init__(self, tamanho_filtro):
+        filtro = np.hanning(tamanho_filtro)
+        super().__init__(filtro / filtro.sum())
+
+
+class EstagioIIR(Estagio):
+    '''
+      Filtro IIR em seções de segunda ordem (sos), com o estado interno de cada seção
+      (zi do sosfilt) carregado de um bloco para o seguinte.
+      '''
+
+    def __init__(self, sos):
+        self.sos = np.atleast_2d(np.asarray(sos, dtype=float))
+        self.zi = None
+
+    def processar(self, bloco):
+        if self.zi is None:
+            # Estado inicial nulo: o mesmo de filtrar o sinal inteiro de uma vez
+            self.zi = np.zeros((len(self.sos), 2) + bloco.shape[1:])
+        saida, self.zi = signal.sosfilt(self.sos, bloco, axis=0, zi=self.zi)
+
+        return saida
+
+
+class EstagioNotch(EstagioIIR):
+    '''
+      Remove frequências (por exemplo 50/60 Hz da rede elétrica e seus harmônicos) com um
+      filtro notch IIR por frequência, em cascata, como Sinais.remove_frequencia no modo 'iir'.
+      '''
+
+    def __init__(self, frequencias, amostragem, fator_q=30.0, harmonicos=1):
+        frequencias = Sinais.frequencias_notch(frequencias, amostragem, harmonicos)
+        super().__init__(Sinais.filtro_notch(frequencias, amostragem, fator_q))
+
+
+class Reamostragem(Estagio):
+    '''
+      Muda a taxa de amostragem pela razão cima/baixo, com o mesmo resultado de
+      signal.resample_poly aplicado ao sinal inteiro: as amostras são intercaladas com zeros,
+      filtradas por um FIR passa-baixa (um EstagioFIR, que mantém o estado entre os blocos)
+      e dizimadas, acompanhando a fase da dizimação de um bloco para o outro.
+      '''
+
+    def __init__(self, cima, baixo):
+        razao = Fraction(cima, baixo)
+        self.cima, self.baixo = razao.numerator, razao.denominator
+        self.fator = razao
+        maximo = max(self.cima, self.baixo)
+        # O mesmo filtro padrão do resample_poly
+        filtro = signal.firwin(2 * 10 * maximo + 1, 1 / maximo, window=('kaiser', 5.0)) * self.cima
+        self.fir = EstagioFIR(filtro)
+        self.fase = 0
+        self.amostras = 0
+        self.emitidas = 0
+
+    def dizimar(self, filtrado):
+        saida = filtrado[self.fase::self.baixo]
+        self.fase = (self.fase - len(filtrado)) % self.baixo
+        self.emitidas += len(saida)
+
+        return saida
+
+    def processar(self, bloco):
+        self.amostras += len(bloco)
+        intercalado = np.zeros((len(bloco) * self.cima,) + bloco.shape[1:], dtype=np.result_type(bloco, float))
+        intercalado[::self.cima] = bloco
+
+        return self.dizimar(self.fir.processar(intercalado))
+
+    def finalizar(self):
+        restante = self.fir.finalizar()
+        if restante is None:
+            return None
+        # O resample_poly retorna ceil(amostras*cima/baixo) amostras
+        faltam = -(-self.amostras * self.cima // self.baixo) - self.emitidas
+
+        return self.dizimar(restante)[:faltam]
+
+
+class Pipeline:
+    '''
+      Sequência de estágios aplicada a um sinal lido em blocos.
+      '''
+
+    def __init__(self, *estagios):
+        self.estagios = list(estagios)
+
+    @property
+    def fator(self):
+        '''
+          Razão entre as taxas de amostragem da saída e da entrada.
+          '''
+        fator = Fraction(1)
+        for estagio in self.estagios:
+            fator *= estagio.fator
+
+        return fator
+
+    def passar(self, bloco, inicio=0):
+        # Passa o bloco pelos estágios a partir do estágio inicio
+        for estagio in self.estagios[inicio:]:
+            if bloco is None or len(bloco) == 0:
+                return None
+            bloco = estagio.processar(bloco)
+
+        return bloco
+
+    def processar(self, blocos):
+        '''
+          Parametros:
+            entrada =
+              blocos: iterável de blocos do sinal, em ordem
+          Retorno: Gerador dos blocos processados. Ao final, as amostras retidas no estado de
+            cada estágio são passadas pelos estágios seguintes.
+          '''
+        for bloco in blocos:
+            saida = self.passar(bloco)
+            if saida is not None and len(saida):
+                yield saida
+
+        for i, estagio in enumerate(self.estagios):
+            saida = self.passar(estagio.finalizar(), i + 1)
+            if saida is not None and len(saida):
+                yield saida
+
+    def executar(self, fonte, destino=None, tamanho_bloco=TAMANHO_BLOCO, amostragem=None, formato=None):
+        '''
+          Parametros:
+            entrada =
+              fonte: origem dos blocos, como em ler_blocos
+              destino: caminho de um arquivo de áudio, escrito à medida que os blocos são
+                processados; função chamada com cada bloco processado; ou None
+              tamanho_bloco: quantidade de amostras por bloco lido
+              amostragem: Sample Rate da fonte em hertz (padrão: a do arquivo de áudio), usado
+                para calcular o da saída
+              formato: subtipo do soundfile para o arquivo de saída, por exemplo 'PCM_16' ou 'FLOAT'
+          Retorno: O sinal processado inteiro quando destino é None; senão, a quantidade de
+            amostras escritas.
+          '''
+        amostragem = amostragem or taxa_amostragem(fonte)
+        blocos = self.processar(ler_blocos(fonte, tamanho_bloco))
+
+        if destino is None:
+            return np.concatenate(list(blocos))
+
+        amostras = 0
+        arquivo = None
+        try:
+            for bloco in blocos:
+                if callable(destino):
+                    destino(bloco)
+                else:
+                    if arquivo is None:
+                        if amostragem is None:
+                            raise ValueError('A amostragem da fonte é necessária para escrever um arquivo de áudio')
+                        canais = 1 if bloco.ndim == 1 else bloco.shape[1]
+                        arquivo = sf.SoundFile(destino, 'w', int(round(amostragem * self.fator)), canais, formato)
+                    arquivo.write(bloco.astype(np.float32, copy=False))
+                amostras += len(bloco)
+        finally:
+            if arquivo is not None:
+                arquivo.close()
+
+        return amostras
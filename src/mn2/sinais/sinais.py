@@ -1,20 +1,622 @@
+import os
+import queue
+import re
+import threading
+import time
 import pandas as pd
 import numpy as np
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
 import matplotlib.pyplot as plt
-from scipy import signal, fft
+from scipy import fft, ndimage, signal
+import espectro
 from librosa import load
 from librosa.feature import mfcc
-from matplotlib.animation import FuncAnimation
+from librosa.filters import mel
+from matplotlib.animation import FuncAnimation, FFMpegWriter, PillowWriter
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
 from matplotlib import rc
 rc('animation', html='jshtml')
 
 # Definições
 
+# Quantidade aproximada de pontos avaliados de cada vez por Sinais.discretizar
+TAMANHO_PEDACO = 1 << 16
+
+# Curvas de suavização do morphing: levam o tempo t em [0, 1] ao progresso da transição em [0, 1]
+SUAVIZACOES = {
+    'linear': lambda t: t,
+    'quadratica': lambda t: np.where(t < 0.5, 2 * t * t, 1 - 2 * (1 - t) * (1 - t)),
+    'cubica': lambda t: t * t * (3 - 2 * t),
+    'seno': lambda t: (1 - np.cos(np.pi * t)) / 2,
+}
+
+
+# Custos relativos, por operação, da convolução direta (uma multiplicação-soma) e da FFT
+# (um ponto de n*log2(n)), medidos com benchmarks/convolucao.py
+CUSTO_DIRETA = 1.0
+CUSTO_FFT = 2.0
+
+# Tamanho da FFT de cada bloco da convolução overlap-add, em múltiplos do tamanho do filtro
+FATOR_BLOCO_OA = 8
+
+# Quantidade máxima de espectros de filtros guardados por Sinais.espectro_filtro
+ESPECTROS_MAXIMO = 32
+ESPECTROS_FILTROS = OrderedDict()
+
+
+class Polinomio:
+    '''
+      Polinômio ajustado por mínimos quadrados. A variável é normalizada para o intervalo
+      [-1, 1] dos pontos ajustados, o que mantém o sistema bem condicionado em graus altos.
+      Pode ser chamado como função, avaliando arrays inteiros pelo esquema de Horner.
+      '''
+
+    def __init__(self, coeficientes, centro=0.0, escala=1.0):
+        '''
+          Parametros:
+            entrada =
+              coeficientes: array (grau+1,), ou (lote, grau+1) para um lote de polinômios, do maior
+                para o menor grau, na variável normalizada t = (x - centro)/escala
+              centro: centro do domínio (um por polinômio do lote, ou um só para todos)
+              escala: meia largura do domínio (um por polinômio do lote, ou um só para todos)
+          '''
+        self.coeficientes = np.asarray(coeficientes, dtype=float)
+        self.centro = np.asarray(centro, dtype=float)
+        self.escala = np.asarray(escala, dtype=float)
+
+    @staticmethod
+    def ajustar(x, y, grau):
+        '''
+          Parametros:
+            entrada =
+              x: array (n,) com as abscissas, ou (lote, n) com as abscissas de cada conjunto
+              y: array (n,) com as ordenadas, ou (lote, n) com as ordenadas de cada conjunto
+              grau: grau dos polinômios
+          Retorno: Polinomio (ou lote de polinômios) que aproxima os pontos. Conjuntos que
+            compartilham as abscissas são resolvidos com uma única fatoração QR.
+          '''
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+
+        # Normaliza as abscissas de cada conjunto para [-1, 1]
+        minimo, maximo = x.min(axis=-1), x.max(axis=-1)
+        centro = (maximo + minimo) / 2
+        escala = (maximo - minimo) / 2
+        escala = np.where(escala > 0, escala, 1.0)
+        t = (x - centro[..., np.newaxis]) / escala[..., np.newaxis]
+
+        # Matriz de Vandermonde (..., n, grau+1), do maior para o menor grau
+        v = t[..., np.newaxis] ** np.arange(grau, -1, -1)
+
+        posto_completo = False
+        if x.ndim == 1 and v.shape[0] >= v.shape[1]:
+            # Abscissas compartilhadas: uma única fatoração QR resolve todos os conjuntos
+            q, r = np.linalg.qr(v)
+            # Abscissas repetidas deixam a matriz sem posto completo (diagonal de R quase nula)
+            diagonal = np.abs(np.diag(r))
+            posto_completo = diagonal.min() > diagonal.max() * max(v.shape) * np.finfo(float).eps
+        if posto_completo:
+            coeficientes = np.linalg.solve(r, q.T @ y.T).T
+        elif x.ndim == 1:
+            # Sistema subdeterminado ou sem posto completo: solução de norma mínima
+            coeficientes = (np.linalg.pinv(v) @ y.T).T
+        else:
+            # Abscissas diferentes por conjunto: pseudo-inversa em lote
+            coeficientes = (np.linalg.pinv(v) @ y[..., np.newaxis])[..., 0]
+
+        return Polinomio(coeficientes, centro, escala)
+
+    def __call__(self, x):
+        '''
+          Parametros:
+            entrada =
+              x: número ou array de pontos
+          Retorno: Valores do polinômio em x (com uma dimensão inicial a mais no caso de um lote).
+          '''
+        x = np.asarray(x, dtype=float)
+        eixos = (1,) * x.ndim
+        forma = self.coeficientes.shape[:-1] + eixos
+        t = (x - self.centro.reshape(self.centro.shape + eixos)) / self.escala.reshape(self.escala.shape + eixos)
+
+        # Esquema de Horner, acumulando no próprio array de resultado
+        y = np.empty(np.broadcast_shapes(t.shape, forma))
+        y[...] = self.coeficientes[..., 0].reshape(forma)
+        for k in range(1, self.coeficientes.shape[-1]):
+            y *= t
+            y += self.coeficientes[..., k].reshape(forma)
+
+        return y[()] if y.ndim == 0 else y
+
+
+class CacheAudio:
+    '''
+      Áudios decodificados guardados em um único array float32, com os clipes concatenados e
+      um índice de offsets: o clipe i é dados[offsets[i]:offsets[i+1]]. Pode ser gravado em um
+      diretório, de onde é lido por memmap, para que execuções seguintes não decodifiquem os
+      arquivos de novo.
+      '''
+
+    ARQUIVO_DADOS = 'audios.f32'
+    ARQUIVO_OFFSETS = 'offsets.npy'
+    ARQUIVO_TAXAS = 'taxas.npy'
+    ARQUIVO_MANIFESTO = 'manifesto.txt'
+
+    # Quantidade de arquivos decodificados por tarefa do pool de processos
+    LOTE = 64
+
+    # Quantidade de clipes copiados de cada vez por matriz
+    LINHAS_POR_COPIA = 256
+
+    def __init__(self, dados, offsets, taxas, caminhos):
+        self.dados = dados
+        self.offsets = offsets
+        self.taxas = taxas
+        self.caminhos = caminhos
+
+    def __len__(self):
+        return len(self.caminhos)
+
+    def __getitem__(self, i):
+        return self.dados[self.offsets[i]:self.offsets[i + 1]]
+
+    def tamanhos(self):
+        return np.diff(self.offsets)
+
+    @staticmethod
+    def decodificar(caminho):
+        '''
+          Parametros:
+            entrada =
+              caminho: caminho de um arquivo de áudio
+          Retorno: Vetor float32 do áudio e sua frequência de amostragem original.
+          '''
+        dados, taxa = load(caminho, sr=None)
+
+        return dados.astype(np.float32, copy=False), taxa
+
+    @staticmethod
+    def assinatura(caminho):
+        '''
+          Retorno: Linha do manifesto que identifica o arquivo: caminho, tamanho e data de modificação.
+          '''
+        info = os.stat(caminho)
+
+        return '{0}\t{1}\t{2}'.format(caminho, info.st_size, info.st_mtime_ns)
+
+    @staticmethod
+    def construir(caminhos, diretorio=None, workers=None):
+        '''
+          Decodifica os arquivos em um pool de processos.
+
+          Parametros:
+            entrada =
+              caminhos: lista de arquivos de áudio
+              diretorio: se informado, os áudios são gravados nele à medida que são decodificados
+                e o cache retornado é lido por memmap; senão ficam em memória
+              workers: quantidade de processos (padrão: todos os núcleos)
+          Retorno: CacheAudio com os áudios, na ordem dos caminhos.
+          '''
+        caminhos = list(caminhos)
+        tamanhos, taxas, partes = [], [], []
+        saida = None
+        if diretorio is not None:
+            os.makedirs(diretorio, exist_ok=True)
+            saida = open(os.path.join(diretorio, CacheAudio.ARQUIVO_DADOS), 'wb')
+
+        try:
+            with ProcessPoolExecutor(workers) as executor:
+                for dados, taxa in executor.map(CacheAudio.decodificar, caminhos, chunksize=CacheAudio.LOTE):
+                    tamanhos.append(len(dados))
+                    taxas.append(taxa)
+                    if saida is None:
+                        partes.append(dados)
+                    else:
+                        saida.write(dados.tobytes())
+        finally:
+            if saida is not None:
+                saida.close()
+
+        offsets = np.concatenate([[0], np.cumsum(tamanhos, dtype=np.int64)])
+        taxas = np.array(taxas, dtype=np.int64)
+
+        if diretorio is None:
+            dados = np.concatenate(partes) if partes else np.empty(0, dtype=np.float32)
+            return CacheAudio(dados, offsets, taxas, caminhos)
+
+        np.save(os.path.join(diretorio, CacheAudio.ARQUIVO_OFFSETS), offsets)
+        np.save(os.path.join(diretorio, CacheAudio.ARQUIVO_TAXAS), taxas)
+        # O manifesto é gravado por último: um cache interrompido não é considerado válido
+        with open(os.path.join(diretorio, CacheAudio.ARQUIVO_MANIFESTO), 'w') as manifesto:
+            manifesto.write('\n'.join(CacheAudio.assinatura(caminho) for caminho in caminhos))
+
+        return CacheAudio.abrir(diretorio)
+
+    @staticmethod
+    def abrir(diretorio):
+        '''
+          Retorno: CacheAudio gravado por construir, com os áudios mapeados em memória.
+          '''
+        offsets = np.load(os.path.join(diretorio, CacheAudio.ARQUIVO_OFFSETS))
+        taxas = np.load(os.path.join(diretorio, CacheAudio.ARQUIVO_TAXAS))
+        with open(os.path.join(diretorio, CacheAudio.ARQUIVO_MANIFESTO)) as manifesto:
+            caminhos = [linha.split('\t')[0] for linha in manifesto.read().splitlines()]
+
+        if offsets[-1] > 0:
+            dados = np.memmap(os.path.join(diretorio, CacheAudio.ARQUIVO_DADOS), dtype=np.float32,
+                              mode='r', shape=(int(offsets[-1]),))
+        else:
+            dados = np.empty(0, dtype=np.float32)
+
+        return CacheAudio(dados, offsets, taxas, caminhos)
+
+    @staticmethod
+    def carregar(caminhos, diretorio, workers=None):
+        '''
+          Retorno: O cache gravado em diretorio, se ele foi construído a partir dos mesmos
+            arquivos (sem modificações desde então); senão decodifica os arquivos e grava o cache.
+          '''
+        caminhos = list(caminhos)
+        arquivo_manifesto = os.path.join(diretorio, CacheAudio.ARQUIVO_MANIFESTO)
+        if os.path.isfile(arquivo_manifesto):
+            with open(arquivo_manifesto) as manifesto:
+                if manifesto.read().splitlines() == [CacheAudio.assinatura(caminho) for caminho in caminhos]:
+                    return CacheAudio.abrir(diretorio)
+            os.remove(arquivo_manifesto)
+
+        return CacheAudio.construir(caminhos, diretorio, workers)
+
+    def matriz(self, indices=None, tamanho=None, dtype=np.float32):
+        '''
+          Parametros:
+            entrada =
+              indices: clipes que formam as linhas da matriz (padrão: todos)
+              tamanho: quantidade de colunas (padrão: o tamanho do maior clipe escolhido)
+              dtype: tipo da matriz
+          Retorno: Matriz onde cada linha é um clipe, completado com zeros ou cortado no tamanho,
+            como em Sinais.padroniza_audio. Os clipes são copiados por indexação vetorizada,
+            em grupos de linhas para limitar a memória dos índices.
+          '''
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices, dtype=np.int64)
+        inicios = self.offsets[indices]
+        tamanhos = self.offsets[indices + 1] - inicios
+        if tamanho is None:
+            tamanho = int(tamanhos.max()) if len(tamanhos) else 0
+        tamanhos = np.minimum(tamanhos, tamanho)
+
+        M = np.zeros((len(indices), tamanho), dtype=dtype)
+        plana = M.reshape(-1)
+        for linha in range(0, len(indices), CacheAudio.LINHAS_POR_COPIA):
+            grupo = slice(linha, linha + CacheAudio.LINHAS_POR_COPIA)
+            n = tamanhos[grupo]
+            # Posição de cada amostra dentro do seu clipe, sem laço em Python
+            colunas = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+            linhas = np.repeat(np.arange(linha, linha + len(n)), n)
+            plana[linhas * tamanho + colunas] = self.dados[np.repeat(inicios[grupo], n) + colunas]
+
+        return M
+
+
+class ExtratorMFCC:
+    '''
+      Calcula MFCCs de uma matriz de áudios (um por linha) de uma só vez, com os mesmos
+      parâmetros padrão de librosa.feature.mfcc: os quadros de todas as linhas são vistas
+      sobrepostas do mesmo array, transformados por uma única rFFT em lote, e os bancos de
+      filtros mel e a DCT são aplicados como multiplicações de matrizes pré-calculadas.
+      '''
+
+    # Quantidade aproximada de valores do espectro calculados de cada vez
+    TAMANHO_ESPECTRO = 1 << 22
+
+    def __init__(self, sr=8000, n_mfcc=13, n_fft=2048, hop_length=512, n_mels=128, fmin=0.0, fmax=None,
+                 top_db=80.0):
+        self.sr = sr
+        self.n_mfcc = n_mfcc
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.top_db = top_db
+        self.janela = espectro.janela('hann', n_fft, np.float32)
+        # (n_fft//2 + 1, n_mels): espectro de potência -> energia em cada banda mel
+        self.banco_mel = mel(sr=sr, n_fft=n_fft, n_mels=n_mels, fmin=fmin, fmax=fmax).T.astype(np.float32)
+        # (n_mels, n_mfcc): as n_mfcc primeiras linhas da DCT-II ortonormal
+        self.dct = fft.dct(np.eye(n_mels), type=2, norm='ortho', axis=0)[:n_mfcc].T.astype(np.float32)
+
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def obter(sr=8000, n_mfcc=13, n_fft=2048, hop_length=512, n_mels=128):
+        '''
+          Retorno: Extrator com esses parâmetros, criado apenas na primeira chamada.
+          '''
+        return ExtratorMFCC(sr, n_mfcc, n_fft, hop_length, n_mels)
+
+    def quadros(self, tamanho):
+        '''
+          Retorno: Quantidade de quadros de um áudio com tamanho amostras.
+          '''
+        return 1 + tamanho // self.hop_length
+
+    def coeficientes(self, M):
+        '''
+          Parametros:
+            entrada =
+              M: matriz (lote, tamanho) de áudios
+          Retorno: Array float32 (lote, n_mfcc, quadros), igual a librosa.feature.mfcc em cada linha.
+          '''
+        M = np.asarray(M, dtype=np.float32)
+        # Quadros centralizados como no librosa (center=True, pad_mode='constant')
+        quadros = espectro.quadros(M, self.n_fft, self.hop_length, centralizar=True)
+
+        transformada = fft.rfft(quadros * self.janela, axis=-1)
+        potencia = np.square(transformada.real)
+        potencia += np.square(transformada.imag)
+        del transformada
+
+        # Espectrograma mel em decibéis, com o piso de top_db abaixo do máximo de cada áudio
+        db = np.matmul(potencia, self.banco_mel)
+        np.maximum(db, 1e-10, out=db)
+        np.log10(db, out=db)
+        db *= 10
+        if self.top_db is not None:
+            np.maximum(db, db.max(axis=(1, 2), keepdims=True) - self.top_db, out=db)
+
+        return np.matmul(db, self.dct).transpose(0, 2, 1)
+
+    def transformar(self, M, workers=1):
+        '''
+          Parametros:
+            entrada =
+              M: matriz onde cada linha é um vetor extraído de um áudio
+              workers: Nº de processos; com mais de um, os lotes de linhas são divididos entre eles
+          Retorno: Matriz float32 onde cada linha é o MFCC vetorizado da mesma linha de M.
+          '''
+        M = np.asarray(M)
+        n_quadros = self.quadros(M.shape[1])
+        resultado = np.empty((M.shape[0], self.n_mfcc * n_quadros), dtype=np.float32)
+        # Lotes de linhas pequenos o bastante para limitar a memória do espectro
+        linhas = max(1, ExtratorMFCC.TAMANHO_ESPECTRO // (n_quadros * (self.n_fft // 2 + 1)))
+        lotes = [slice(i, i + linhas) for i in range(0, M.shape[0], linhas)]
+
+        if workers == 1:
+            partes = (self.coeficientes(M[lote]) for lote in lotes)
+            for lote, parte in zip(lotes, partes):
+                resultado[lote] = parte.reshape(len(parte), -1)
+        else:
+            with ProcessPoolExecutor(workers) as executor:
+                for lote, parte in zip(lotes, executor.map(self.coeficientes, [M[lote] for lote in lotes])):
+                    resultado[lote] = parte.reshape(len(parte), -1)
+
+        return resultado
+
+
+class ClassificadorAudio:
+    '''
+      Classificador de áudio de longa duração: o tamanho padrão, o extrator de MFCC e o buffer
+      dos lotes são preparados uma só vez. Recebe áudios já em memória (arrays ou buffers PCM)
+      ou fluxos de pedaços, e agrupa os pedidos pendentes em micro-lotes, classificados por uma
+      única chamada de predict. A latência de cada pedido é registrada.
+      '''
+
+    def __init__(self, modelo, tam_padrao, sr=8000, n_mfcc=13, tamanho_lote=32, espera_maxima=0.002,
+                 historico=10000):
+        '''
+          Parametros:
+            entrada =
+              modelo: Modelo treinado com os MFCCs vetorizados; deve ter uma função predict(M),
+              tam_padrao: Tamanho para a padronização dos vetores,
+              sr: Frequencia de amostragem (Sample rate) dos áudios em Hz,
+              n_mfcc: Nº de MFCCs gerados para cada áudio,
+              tamanho_lote: Nº máximo de pedidos classificados juntos,
+              espera_maxima: Tempo máximo, em segundos, que um pedido espera por outros para formar um lote,
+              historico: Nº de latências mais recentes guardadas para o relatório.
+          '''
+        self.modelo = modelo
+        self.tam_padrao = tam_padrao
+        self.extrator = ExtratorMFCC.obter(sr, n_mfcc)
+        self.tamanho_lote = tamanho_lote
+        self.espera_maxima = espera_maxima
+        self.buffer = np.zeros((tamanho_lote, tam_padrao), dtype=np.float32)
+        self.trava = threading.Lock()
+        self.latencias = deque(maxlen=historico)
+        self.fila = queue.Queue()
+        self.thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *erro):
+        self.fechar()
+
+    @staticmethod
+    def para_float(audio, formato='int16'):
+        '''
+          Parametros:
+            entrada =
+              audio: array, ou buffer (bytes) de amostras PCM
+              formato: tipo das amostras PCM de buffers
+          Retorno: Vetor float32 com o áudio; inteiros são escalados para [-1, 1).
+          '''
+        if isinstance(audio, (bytes, bytearray, memoryview)):
+            audio = np.frombuffer(audio, dtype=formato)
+        audio = np.asarray(audio)
+        if np.issubdtype(audio.dtype, np.integer):
+            return audio.astype(np.float32) / -float(np.iinfo(audio.dtype).min)
+
+        return audio.astype(np.float32, copy=False)
+
+    def classificar_lote(self, audios):
+        '''
+          Parametros:
+            entrada =
+              audios: lista de áudios (arrays ou buffers PCM) de qualquer tamanho
+          Retorno: Lista com a classificação de cada áudio, obtida com uma chamada de predict
+            por grupo de tamanho_lote áudios.
+          '''
+        resultados = []
+        with self.trava:
+            for inicio in range(0, len(audios), self.tamanho_lote):
+                parte = audios[inicio:inicio + self.tamanho_lote]
+                # Padroniza os áudios direto no buffer do lote
+                buffer = self.buffer[:len(parte)]
+                buffer.fill(0)
+                for linha, audio in zip(buffer, parte):
+                    audio = ClassificadorAudio.para_float(audio)[:self.tam_padrao]
+                    linha[:len(audio)] = audio
+                caracteristicas = self.extrator.coeficientes(buffer).reshape(len(parte), -1)
+                resultados.extend(self.modelo.predict(caracteristicas))
+
+        return resultados
+
+    def classificar(self, audio):
+        '''
+          Retorno: Classificação de um áudio (array ou buffer PCM), sem esperar por outros pedidos.
+          '''
+        inicio = time.perf_counter()
+        resultado = self.classificar_lote([audio])[0]
+        self.latencias.append(time.perf_counter() - inicio)
+
+        return resultado
+
+    def classificar_fluxo(self, pedacos):
+        '''
+          Parametros:
+            entrada =
+              pedacos: iterável com os pedaços de um áudio (arrays ou buffers PCM com amostras
+                inteiras), por exemplo lidos de um microfone ou de um socket
+          Retorno: Classificação do áudio. Os pedaços são escritos direto em um vetor do tamanho
+            padrão, e a leitura para quando ele é preenchido.
+          '''
+        audio = np.zeros(self.tam_padrao, dtype=np.float32)
+        n = 0
+        for pedaco in pedacos:
+            pedaco = ClassificadorAudio.para_float(pedaco)[:self.tam_padrao - n]
+            audio[n:n + len(pedaco)] = pedaco
+            n += len(pedaco)
+            if n == self.tam_padrao:
+                break
+
+        return self.classificar(audio)
+
+    def enviar(self, audio):
+        '''
+          Coloca um áudio na fila de classificação em micro-lotes.
+
+          Retorno: Future com a classificação do áudio.
+        '''
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.atender, daemon=True)
+            self.thread.start()
+        futuro = Future()
+        self.fila.put((time.perf_counter(), audio, futuro))
+
+        return futuro
+
+    def atender(self):
+        '''
+          Laço da thread que forma os micro-lotes: espera o primeiro pedido, junta os que chegam
+          em até espera_maxima segundos (ou até completar o lote) e os classifica juntos.
+          '''
+        parar = False
+        while not parar:
+            pedido = self.fila.get()
+            if pedido is None:
+                break
+            pedidos = [pedido]
+            prazo = pedido[0] + self.espera_maxima
+            while len(pedidos) < self.tamanho_lote:
+                try:
+                    pedido = self.fila.get(timeout=max(0.0, prazo - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if pedido is None:
+                    parar = True
+                    break
+                pedidos.append(pedido)
+
+            try:
+                resultados = self.classificar_lote([audio for _, audio, _ in pedidos])
+            except Exception as erro:
+                for _, _, futuro in pedidos:
+                    futuro.set_exception(erro)
+                continue
+
+            fim = time.perf_counter()
+            for (chegada, _, futuro), resultado in zip(pedidos, resultados):
+                self.latencias.append(fim - chegada)
+                futuro.set_result(resultado)
+
+    def fechar(self):
+        '''
+          Classifica os pedidos pendentes e encerra a thread dos micro-lotes.
+          '''
+        if self.thread is not None:
+            self.fila.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def relatorio_latencia(self):
+        '''
+          Retorno: Dicionário com a quantidade de pedidos registrados e a média e os percentis
+            50, 95 e 99 e o máximo da latência, em milissegundos.
+          '''
+        latencias = np.array(self.latencias) * 1000
+        if len(latencias) == 0:
+            return {'pedidos': 0}
+        p50, p95, p99 = np.percentile(latencias, [50, 95, 99])
+
+        return {'pedidos': len(latencias), 'media_ms': latencias.mean(), 'p50_ms': p50, 'p95_ms': p95,
+                'p99_ms': p99, 'max_ms': latencias.max()}
+
 
 class Sinais:
     @staticmethod
-    def discretizar(valor_inicial, valor_final, tamanho_vetor, funcao):
+    def eixos_discretizacao(valor_inicial, valor_final, tamanho_vetor, dtype):
+        '''
+          Parametros:
+            entrada =
+              valor_inicial, valor_final, tamanho_vetor: números, ou sequências com um valor por dimensão
+              dtype: tipo dos valores do espaço
+          Retorno: Lista com os pontos de cada dimensão do espaço discretizado
+          '''
+        limites = np.broadcast_arrays(np.atleast_1d(valor_inicial), np.atleast_1d(valor_final),
+                                      np.atleast_1d(tamanho_vetor))
+
+        return [np.linspace(inicio, fim, int(tamanho), dtype=dtype) for inicio, fim, tamanho in zip(*limites)]
+
+    @staticmethod
+    def aceita_arrays(funcao, grade):
+        '''
+          Parametros:
+            entrada =
+              funcao: função a ser aplicada ao espaço
+              grade: amostra pequena do espaço, como retornada por np.meshgrid(..., sparse=True)
+          Retorno: Verdadeiro se a função pode ser aplicada ao array inteiro de uma só vez, isto é,
+            se aplicada à amostra ela retorna o mesmo que aplicada a cada ponto separadamente.
+          '''
+        forma = np.broadcast_shapes(*[g.shape for g in grade])
+        try:
+            resultado = np.asarray(funcao(*grade))
+            if np.broadcast_shapes(resultado.shape, forma) != forma:
+                return False
+            resultado = np.broadcast_to(resultado, forma)
+        except Exception:
+            return False
+
+        pontos = [np.broadcast_to(g, forma).ravel() for g in grade]
+        for i, ponto in enumerate(zip(*pontos)):
+            try:
+                if not np.allclose(resultado.flat[i], funcao(*ponto), equal_nan=True):
+                    return False
+            except Exception:
+                return False
+
+        return True
+
+    @staticmethod
+    def discretizar(valor_inicial, valor_final, tamanho_vetor, funcao, dtype=None, out=None,
+                    tamanho_pedaco=TAMANHO_PEDACO):
         '''
           Parametros:
             entrada = 
@@ -22,24 +624,127 @@ class Sinais:
               valor_final: limite superior do espaço
               tamanho_vetor: quantidades de valores nos quais o espaço será particionado
               funcao: função a ser a aplicada ao nosso espaço
+              dtype: tipo do resultado, por exemplo np.float32 (padrão: o tipo retornado pela função)
+              out: array onde o resultado é escrito, em vez de alocar um novo
+              tamanho_pedaco: quantidade aproximada de pontos avaliados de cada vez
+            Para discretizar um espaço de várias dimensões, os limites e tamanhos podem ser
+            sequências com um valor por dimensão; a função recebe então uma coordenada por dimensão.
           Retorno: Array com a função aplicada a cada valor do nosso espaço discretizado
           '''
-        values = np.linspace(valor_inicial, valor_final, tamanho_vetor)
-        vfunc = np.vectorize(funcao)
-
-        return vfunc(values)
+        if out is not None:
+            dtype = out.dtype
+        tipo_espaco = np.float32 if dtype is not None and np.dtype(dtype) == np.float32 else np.float64
+        eixos = Sinais.eixos_discretizacao(valor_inicial, valor_final, tamanho_vetor, tipo_espaco)
+        forma = tuple(len(eixo) for eixo in eixos)
+
+        # Grade esparsa: cada dimensão só é expandida por broadcasting durante a avaliação
+        grade = np.meshgrid(*eixos, indexing='ij', sparse=True)
+        amostra = np.meshgrid(*[eixo[:2] for eixo in eixos], indexing='ij', sparse=True)
+
+        # Ufuncs e funções que operam sobre arrays são chamadas diretamente; as demais
+        # são aplicadas ponto a ponto, como faria np.vectorize
+        if isinstance(funcao, np.ufunc) or Sinais.aceita_arrays(funcao, amostra):
+            aplicar = funcao
+        else:
+            aplicar = np.frompyfunc(funcao, len(eixos), 1)
+        escrever_direto = aplicar is funcao and isinstance(funcao, np.ufunc) and funcao.nout == 1
+
+        if out is None:
+            if dtype is None:
+                dtype = np.asarray(funcao(*[eixo[0] for eixo in eixos])).dtype
+            out = np.empty(forma, dtype=dtype)
+        elif out.shape != forma:
+            raise ValueError('out deve ter a forma ' + str(forma))
+        if out.size == 0:
+            return out
+
+        # Avalia em pedaços ao longo da primeira dimensão, para limitar os arrays temporários
+        linhas = max(1, tamanho_pedaco // (out.size // forma[0]))
+        for inicio in range(0, forma[0], linhas):
+            pedaco = slice(inicio, inicio + linhas)
+            argumentos = [grade[0][pedaco]] + list(grade[1:])
+            if escrever_direto and np.can_cast(np.result_type(*argumentos), out.dtype, 'same_kind'):
+                aplicar(*argumentos, out=out[pedaco])
+            else:
+                out[pedaco] = aplicar(*argumentos)
+
+        return out
 
     @staticmethod
-    def morphing(vetor1, vetor2, t):
+    def morphing(vetor1, vetor2, t, out=None):
         '''
           Parametros:
             entrada = 
               vetor1: vetor 1 de elementos que definem uma função discretizada
               vetor2: vetor 2 de elementos que definem uma função discretizada
-              t: tempo t do morphing
-          Retorno: Array com o morphing da vetor 1 até o vetor 2 no tempo t.
+              t: tempo t do morphing, ou array de tempos (um quadro por tempo)
+              out: array onde o resultado é escrito, em vez de alocar um novo
+          Retorno: Array com o morphing da vetor 1 até o vetor 2 no tempo t. Com um array de
+            tempos, o resultado tem uma dimensão inicial a mais, com um quadro por tempo.
+          '''
+        vetor1 = np.asarray(vetor1)
+        t = np.asarray(t)
+        t = t.reshape(t.shape + (1,) * vetor1.ndim)
+
+        # (1 - t)*vetor1 + t*vetor2 com uma única multiplicação e sem arrays temporários por quadro
+        out = np.multiply(np.subtract(vetor2, vetor1), t, out=out)
+        out += vetor1
+
+        return out
+
+    @staticmethod
+    def tempos_morphing(frames, suavizacao='linear', dtype=np.float64):
+        '''
+          Parametros:
+            entrada =
+              frames: quantidade de quadros da transição
+              suavizacao: nome de uma curva de SUAVIZACOES, ou função que recebe e retorna arrays
+              dtype: tipo dos tempos
+          Retorno: Array com o tempo do morphing em cada quadro, i/frames com a suavização aplicada.
           '''
-        return (1 - t)*vetor1 + t*vetor2
+        t = np.arange(frames, dtype=dtype) / frames
+        curva = suavizacao if callable(suavizacao) else SUAVIZACOES[suavizacao]
+
+        return curva(t).astype(dtype, copy=False)
+
+    @staticmethod
+    def morphing_frames(vetores, frames=100, suavizacao='linear', gerador=False, dtype=np.float64):
+        '''
+          Parametros:
+            entrada =
+              vetores: sequência de dois ou mais vetores de mesmo tamanho; o morphing passa por
+                cada um deles, em ordem, com frames quadros por transição
+              frames: quantidade de quadros de cada transição
+              suavizacao: curva de suavização, como em tempos_morphing
+              gerador: se verdadeiro, retorna um gerador que calcula cada quadro apenas quando é
+                pedido, sempre no mesmo array (copie o quadro se precisar guardá-lo). Se falso,
+                todos os quadros são calculados de uma vez
+              dtype: tipo dos quadros, por exemplo np.float32
+          Retorno: Array (transições * frames, n) com todos os quadros, ou gerador de quadros.
+          '''
+        vetores = np.asarray(vetores, dtype=dtype)
+        if len(vetores) < 2:
+            raise ValueError('O morphing precisa de pelo menos dois vetores')
+        t = Sinais.tempos_morphing(frames, suavizacao, dtype)
+        inicios = vetores[:-1]
+        diferencas = np.diff(vetores, axis=0)
+
+        if gerador:
+            def quadros():
+                quadro = np.empty_like(vetores[0])
+                for inicio, diferenca in zip(inicios, diferencas):
+                    for tempo in t:
+                        np.multiply(diferenca, tempo, out=quadro)
+                        quadro += inicio
+                        yield quadro
+            return quadros()
+
+        # (transições, frames, n) = diferença * tempo + início, por broadcasting
+        eixos = (1,) * (vetores.ndim - 1)
+        quadros = np.multiply(diferencas[:, np.newaxis], t.reshape((1, frames) + eixos))
+        quadros += inicios[:, np.newaxis]
+
+        return quadros.reshape((-1,) + vetores.shape[1:])
 
     @staticmethod
     def normalizar(vetor):
@@ -53,7 +758,7 @@ class Sinais:
         return vetor/np.linalg.norm(vetor)
 
     @staticmethod
-    def animMorphing(vetor1, vetor2, xlim=(-5, 5), ylim=(-5, 5), frames=100):
+    def animMorphing(vetor1, vetor2, xlim=(-5, 5), ylim=(-5, 5), frames=100, suavizacao='linear'):
         '''
           Parametros:
             entrada = 
@@ -62,6 +767,7 @@ class Sinais:
               xlim: tupla com os valores de mínimo e máximo de gŕafico no eixo X.
               ylim: tupla com os valores de mínimo e máximo de gŕafico no eixo Y.
               frames: quantidade de frames da animação
+              suavizacao: curva de suavização, como em tempos_morphing
           Retorno: Objeto de animação do matplotlib.
           '''
         fig = plt.figure()
@@ -70,14 +776,16 @@ class Sinais:
                         ylim=ylim)
         line, = axis.plot([], [], lw=3)
 
+        # O eixo x e os quadros são calculados uma só vez, fora da animação
+        x = np.linspace(-5, 5, len(vetor1))
+        quadros = Sinais.morphing_frames([vetor1, vetor2], frames, suavizacao)
+
         def init():
             line.set_data([], [])
             return line,
 
         def animate(i):
-            x = np.linspace(-5, 5, len(vetor1))
-            y = morphing(vetor1, vetor2, i/frames)
-            line.set_data(x, y)
+            line.set_data(x, quadros[i])
 
             return line,
 
@@ -85,23 +793,56 @@ class Sinais:
                              frames=frames, interval=20, blit=True)
         return anim
 
+    @staticmethod
+    def salvar_morphing(caminho, vetores, frames=100, xlim=(-5, 5), ylim=(-5, 5), fps=50,
+                        suavizacao='linear', dpi=100, writer=None):
+        '''
+          Grava a animação do morphing direto em um arquivo, sem interface gráfica e sem gerar
+          o HTML da animação. Os quadros são calculados um a um e desenhados na mesma linha.
+
+          Parametros:
+            entrada =
+              caminho: arquivo de saída; .gif é gravado com o Pillow e os demais formatos
+                (.mp4, .webm, ...) com o ffmpeg
+              vetores: sequência de dois ou mais vetores, como em morphing_frames
+              frames: quantidade de frames de cada transição
+              xlim: tupla com os valores de mínimo e máximo de gŕafico no eixo X.
+              ylim: tupla com os valores de mínimo e máximo de gŕafico no eixo Y.
+              fps: quadros por segundo do arquivo
+              suavizacao: curva de suavização, como em tempos_morphing
+              dpi: resolução dos quadros
+              writer: MovieWriter do matplotlib a ser usado no lugar do padrão
+          '''
+        # Figura sem pyplot: não é registrada no gerenciador de janelas e é descartada ao final
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        axis = fig.add_subplot(xlim=xlim, ylim=ylim)
+
+        x = np.linspace(-5, 5, np.shape(vetores)[-1])
+        line, = axis.plot(x, np.zeros_like(x), lw=3)
+
+        if writer is None:
+            writer = PillowWriter(fps=fps) if str(caminho).lower().endswith('.gif') else FFMpegWriter(fps=fps)
+
+        with writer.saving(fig, caminho, dpi):
+            for quadro in Sinais.morphing_frames(vetores, frames, suavizacao, gerador=True):
+                line.set_ydata(quadro)
+                writer.grab_frame()
+
     @staticmethod
     def interpolar(pontos, grauMaximo):
         '''
           Parametros:
             entrada = 
-              pontos: array de tuplas com o x e o y de pontos em um plano cartesiano.
+              pontos: array de tuplas com o x e o y de pontos em um plano cartesiano, ou array
+                (lote, n, 2) com vários conjuntos de pontos ajustados de uma só vez.
               grauMaximo: grau da função pela qual os pontos serão aproximados
 
-          Retorno: Função que aproxima os pontos de entrada.
+          Retorno: Polinomio que aproxima os pontos de entrada; pode ser chamado com números ou arrays.
           '''
-        x = [i[0] for i in pontos]
-        y = [i[1] for i in pontos]
-        v = np.array([np.array(x)**i for i in range(grauMaximo, -1, -1)]).T
+        pontos = np.asarray(pontos, dtype=float)
 
-        coef_array = np.linalg.lstsq(v, y, rcond=0.0000000001)[0]
-
-        return lambda x: np.sum([coef_array[i]*(x**(len(coef_array)-(i+1))) for i in range(len(coef_array))])
+        return Polinomio.ajustar(pontos[..., 0], pontos[..., 1], grauMaximo)
 
     @staticmethod
     def padroniza_audio(audio_vet, tamanho):
@@ -124,102 +865,182 @@ class Sinais:
         return novo_audio_data
 
     @staticmethod
-    def preprocessa_dataset_audio(por_dataset_teste=10):
+    def preprocessa_dataset_audio(por_dataset_teste=10, diretorio='free-spoken-digit-dataset/recordings',
+                                  padrao=r'(?P<rotulo>\d+)_(?P<locutor>[^_]+)_(?P<indice>\d+)\.wav$',
+                                  cache=None, workers=None):
         '''
-        Antes de executar essa função, é preciso baixar o dataset de áudios de números utilizando 'git clone https://github.com/Jakobovski/free-spoken-digit-dataset.git'.
+        Antes de executar essa função com os valores padrão, é preciso baixar o dataset de áudios de números utilizando 'git clone https://github.com/Jakobovski/free-spoken-digit-dataset.git'.
 
         Parametros:
-          por_dataset_teste: Porcentagem dos vetores que serão usados para o dataset de teste (default = 10%).
+          por_dataset_teste: Porcentagem dos vetores que serão usados para o dataset de teste (default = 10%),
+          diretorio: Diretório com os arquivos de áudio,
+          padrao: Expressão regular para os nomes dos arquivos, com os grupos 'rotulo' (a classificação)
+            e 'indice' (número da gravação); os arquivos com os menores índices formam o dataset de teste,
+          cache: Diretório onde os áudios decodificados são guardados (ver CacheAudio); se None, não há cache,
+          workers: Nº de processos que decodificam os áudios (default = todos os núcleos).
 
         Retorno: 
-          X_treino: Matriz onde cada linha é um vetor do dataset de treino,
-          X_teste: Matriz onde cada linha é um vetor do dataset de teste,
+          X_treino: Matriz float32 onde cada linha é um vetor do dataset de treino,
+          X_teste: Matriz float32 onde cada linha é um vetor do dataset de teste,
           Y_treino: Vetor com a classificação de cada linha de X_treino,
           Y_teste: Vetor com a classificação de cada linha de X_teste.
         '''
-        # Lista com os nomes usados nos caminhos dos arquivos
-        names = ['jackson', 'nicolas', 'theo', 'yweweler', 'george', 'lucas']
-
-        # Listas auxiliares
-        audio_data_teste = []
-        audio_data_treino = []
-        labels_treino = []
-        labels_teste = []
-
-        # Variável para determinar o maior tamanho de vetor entre os áudios
-        max_size = 0
-
-        # Percorre por todos os arquivos de áudio
-        for i in range(10):
-            for name in names:
-                for j in range(50):
-                    # Carrega o vetor do áudio
-                    data, sr = load("free-spoken-digit-dataset/recordings/" +
-                                    str(i) + "_" + name + "_" + str(j) + ".wav", sr=None)
-
-                    # Separa entre a parte de treino e a parte de teste
-                    if j <= (por_dataset_teste * 50)/100 - 1:
-                        audio_data_teste.append(data)
-                        labels_teste.append(i)
-                    else:
-                        audio_data_treino.append(data)
-                        labels_treino.append(i)
+        expressao = re.compile(padrao)
+        arquivos = []
+        for nome in os.listdir(diretorio):
+            encontrado = expressao.search(nome)
+            if encontrado:
+                arquivos.append((encontrado.group('rotulo'), int(encontrado.group('indice')),
+                                 os.path.join(diretorio, nome)))
+
+        # Rótulos numéricos são ordenados e retornados como números
+        numericos = all(rotulo.isdigit() for rotulo, _, _ in arquivos)
+        arquivos.sort(key=lambda arquivo: (int(arquivo[0]) if numericos else arquivo[0], arquivo[2]))
+        rotulos = np.array([int(r) if numericos else r for r, _, _ in arquivos])
+        indices = np.array([i for _, i, _ in arquivos], dtype=np.int64)
+        caminhos = [caminho for _, _, caminho in arquivos]
+
+        if cache is None:
+            audios = CacheAudio.construir(caminhos, workers=workers)
+        else:
+            audios = CacheAudio.carregar(caminhos, cache, workers)
 
-                    # Se encontrar tamanho de vetor maior que max_size, armazena ele
-                    if data.shape[0] > max_size:
-                        max_size = data.shape[0]
+        # Separa entre a parte de treino e a parte de teste
+        gravacoes = indices.max() + 1 if len(indices) else 0
+        teste = indices < por_dataset_teste * gravacoes / 100
 
-        tam_dataset_treino = len(audio_data_treino)
-        tam_dataset_teste = len(audio_data_teste)
+        # Todas as matrizes têm o tamanho do maior áudio do dataset
+        max_size = int(audios.tamanhos().max()) if len(audios) else 0
+        X_treino = audios.matriz(np.flatnonzero(~teste), max_size)
+        X_teste = audios.matriz(np.flatnonzero(teste), max_size)
 
-        # Inicializa os dados que serão retornados
-        X_treino = np.zeros((tam_dataset_treino, max_size))
-        X_teste = np.zeros((tam_dataset_teste, max_size))
-        Y_treino = np.zeros(tam_dataset_treino)
-        Y_teste = np.zeros(tam_dataset_teste)
+        return X_treino, X_teste, rotulos[~teste], rotulos[teste]
 
-        # Preenche a matriz X e vetor Y da parte de treino
-        for i in range(tam_dataset_treino):
-            # Padroniza o vetor do áudio
-            new_audio = padroniza_audio(audio_data_treino[i], max_size)
-            X_treino[i] = new_audio
-            Y_treino[i] = labels_treino[i]
-            i += 1
+    @staticmethod
+    def transforma_audio_mfcc(M, sr=8000, n_mfcc=13, workers=1):
+        '''
+        Parametros:
+          M: Matriz onde cada linha é um vetor extraído de um áudio,
+          sr: Frequencia de amostragem (Sample rate) dos áudios em Hz (default = 8000),
+          n_mfcc: Nº de MFCCs gerados para cada áudio (default = 13),
+          workers: Nº de processos entre os quais os lotes de linhas são divididos (default = 1).
+
+        Retorno: Matriz float32 onde cada linha é o MFCC vetorizado da mesma linha de M.
+        '''
+        return ExtratorMFCC.obter(sr, n_mfcc).transformar(M, workers)
 
-        # Preenche a matriz X e vetor Y da parte de treino
-        for i in range(tam_dataset_teste):
-            # Padroniza o vetor do áudio
-            new_audio = padroniza_audio(audio_data_teste[i], max_size)
-            X_teste[i] = new_audio
-            Y_teste[i] = labels_teste[i]
-            i += 1
+    @staticmethod
+    def metricas_classificacao(Y_real, Y_pred, classes=None):
+        '''
+        Parametros:
+          Y_real: Vetor com a classificação correta de cada amostra,
+          Y_pred: Vetor com a classificação predita de cada amostra,
+          classes: Vetor com as classes, na ordem das linhas e colunas da matriz de confusão
+            (default = as que aparecem em Y_real ou Y_pred, ordenadas). Rótulos fora dele são um erro.
 
-        return X_treino, X_teste, Y_treino, Y_teste
+        Retorno: Dicionário com a acurácia, a matriz de confusão (linhas: classe real, colunas:
+          classe predita) e a precisão e a revocação de cada classe (0 para classes sem amostras).
+        '''
+        Y_real, Y_pred = np.asarray(Y_real), np.asarray(Y_pred)
+        if classes is None:
+            classes = np.union1d(Y_real, Y_pred)
+        classes = np.asarray(classes)
+        k = len(classes)
+
+        desconhecidos = np.setdiff1d(np.union1d(Y_real, Y_pred), classes)
+        if len(desconhecidos):
+            raise ValueError('Rótulos que não estão em classes: ' + str(desconhecidos))
+
+        # Posição de cada rótulo em classes, que não precisa estar ordenado
+        ordem = np.argsort(classes, kind='stable')
+        def posicoes(rotulos):
+            return ordem[np.searchsorted(classes[ordem], rotulos)]
+
+        # Matriz de confusão com uma única contagem sobre os pares (real, predita)
+        pares = posicoes(Y_real) * k + posicoes(Y_pred)
+        confusao = np.bincount(pares, minlength=k * k).reshape(k, k)
+        acertos = np.diag(confusao)
+        preditos, reais = confusao.sum(axis=0), confusao.sum(axis=1)
+
+        return {
+            'acuracia': acertos.sum() / max(1, len(Y_real)),
+            'classes': classes,
+            'matriz_confusao': confusao,
+            'precisao': np.divide(acertos, preditos, out=np.zeros(k), where=preditos > 0),
+            'revocacao': np.divide(acertos, reais, out=np.zeros(k), where=reais > 0),
+        }
 
     @staticmethod
-    def transforma_audio_mfcc(M, sr=8000, n_mfcc=13):
+    def avaliar_modelo(modelo, X_treino, X_teste, Y_treino, Y_teste, amostras_latencia=20):
         '''
+        Avalia um modelo, predizendo cada dataset uma única vez.
+
         Parametros:
-          M: Matriz onde cada linha é um vetor extraído de um áudio,
-          sr: Frequencia de amostragem (Sample rate) dos áudios em Hz (default = 8000),
-          n_mfcc: Nº de MFCCs gerados para cada áudio (default = 13).
+          modelo: Modelo que foi treinado para a classificação; Deve ser uma classe com uma função predict(M) que recebe uma matriz,
+          X_treino, X_teste, Y_treino, Y_teste: Datasets de treino e de teste, como em testa_modelo,
+          amostras_latencia: Nº de chamadas de predict com uma só amostra para medir a latência.
 
-        Retorno: Matriz onde cada linha é o MFCC vetorizado da mesma linha de M.
+        Retorno: Dicionário com as métricas de metricas_classificacao para 'treino' e 'teste', a vazão
+          de predict no dataset de teste ('amostras_por_segundo') e a mediana da latência de predict
+          para uma amostra ('latencia_ms').
         '''
-        # Calcula o mfcc da primeira linha da matriz para saber o tamanho do vetor de resultado
-        prim_mfcc = mfcc(M[0], sr=sr, n_mfcc=n_mfcc)
-        tam_mfcc = prim_mfcc.shape[0] * prim_mfcc.shape[1]
+        Y_pred_treino = modelo.predict(X_treino)
+        inicio = time.perf_counter()
+        Y_pred_teste = modelo.predict(X_teste)
+        duracao = time.perf_counter() - inicio
 
-        # Inicializa a matriz que será retornada
-        M_mfcc = np.zeros((M.shape[0], tam_mfcc))
-        # Preenche a primeira linha de M_mfcc
-        M_mfcc[0] = prim_mfcc.reshape((tam_mfcc))
+        latencias = []
+        for i in range(min(amostras_latencia, len(X_teste))):
+            inicio = time.perf_counter()
+            modelo.predict(X_teste[i:i + 1])
+            latencias.append(time.perf_counter() - inicio)
 
-        # Preenche o restante de M_mfcc
-        for i in range(1, M.shape[0]):
-            M_mfcc[i] = mfcc(M[i], sr=sr, n_mfcc=n_mfcc).reshape((tam_mfcc))
+        # As mesmas classes nos dois datasets, para que as matrizes de confusão sejam comparáveis
+        classes = np.union1d(np.union1d(Y_treino, Y_teste), np.union1d(Y_pred_treino, Y_pred_teste))
 
-        return M_mfcc
+        return {
+            'treino': Sinais.metricas_classificacao(Y_treino, Y_pred_treino, classes),
+            'teste': Sinais.metricas_classificacao(Y_teste, Y_pred_teste, classes),
+            'amostras_por_segundo': len(X_teste) / duracao if duracao > 0 else np.inf,
+            'latencia_ms': np.median(latencias) * 1000 if latencias else np.nan,
+        }
+
+    @staticmethod
+    def avaliar_modelos(modelos, X_treino, X_teste, Y_treino, Y_teste, workers=None, amostras_latencia=20):
+        '''
+        Avalia vários modelos em paralelo, em threads que compartilham as mesmas matrizes de treino e teste.
+
+        Parametros:
+          modelos: Dicionário {nome: modelo}, ou lista de modelos (nomeados pela posição),
+          X_treino, X_teste, Y_treino, Y_teste: Datasets de treino e de teste, como em testa_modelo,
+          workers: Nº de threads (default = do ThreadPoolExecutor); com mais de uma, os modelos
+            disputam os núcleos e a vazão e a latência medidas são menores que as de cada um sozinho,
+          amostras_latencia: como em avaliar_modelo.
+
+        Retorno:
+          resumo: DataFrame com uma linha por modelo e as acurácias, a vazão e a latência,
+          resultados: Dicionário {nome: resultado de avaliar_modelo}.
+        '''
+        if not isinstance(modelos, dict):
+            modelos = dict(enumerate(modelos))
+
+        def avaliar(modelo):
+            return Sinais.avaliar_modelo(modelo, X_treino, X_teste, Y_treino, Y_teste, amostras_latencia)
+
+        if workers == 1:
+            resultados = dict(zip(modelos, map(avaliar, modelos.values())))
+        else:
+            with ThreadPoolExecutor(workers) as executor:
+                resultados = dict(zip(modelos, executor.map(avaliar, modelos.values())))
+
+        resumo = pd.DataFrame({
+            'acuracia_treino': [r['treino']['acuracia'] for r in resultados.values()],
+            'acuracia_teste': [r['teste']['acuracia'] for r in resultados.values()],
+            'amostras_por_segundo': [r['amostras_por_segundo'] for r in resultados.values()],
+            'latencia_ms': [r['latencia_ms'] for r in resultados.values()],
+        }, index=list(resultados))
+
+        return resumo, resultados
 
     @staticmethod
     def testa_modelo(modelo, X_treino, X_teste, Y_treino, Y_teste):
@@ -232,35 +1053,19 @@ class Sinais:
           X_teste: Matriz onde cada linha é um vetor do dataset de teste,
           Y_treino: Vetor com a classificação de cada linha de X_treino,
           Y_teste: Vetor com a classificação de cada linha de X_teste.
-        '''
-        # Usa o modelo para predizer os datasets de treino e de teste
-        Y_pred_treino = modelo.predict(X_treino)
-        Y_pred_teste = modelo.predict(X_teste)
 
-        # Armazena o tamanho dos datasets de treino e de teste
-        tam_treino = Y_pred_treino.shape[0]
-        tam_teste = Y_pred_teste.shape[0]
-
-        # Inicializa os contadores de acertos
-        acertos_treino = 0
-        acertos_teste = 0
-
-        # Conta os acertos no dataset de treino
-        for i in range(tam_treino):
-            if Y_pred_treino[i] == Y_treino[i]:
-                acertos_treino += 1
-
-        # Conta os acertos no dataset de teste
-        for i in range(tam_teste):
-            if Y_pred_teste[i] == Y_teste[i]:
-                acertos_teste += 1
+        Retorno: O resultado de avaliar_modelo, com as demais métricas.
+        '''
+        resultado = Sinais.avaliar_modelo(modelo, X_treino, X_teste, Y_treino, Y_teste)
 
         # Imprime os resultados
         print("Avaliação do modelo:")
         print("% de acertos nos dados de treino: " +
-              str(acertos_treino/tam_treino * 100) + "%")
+              str(resultado['treino']['acuracia'] * 100) + "%")
         print("% de acertos nos dados de teste: " +
-              str(acertos_teste/tam_teste * 100) + "%")
+              str(resultado['teste']['acuracia'] * 100) + "%")
+
+        return resultado
 
     @staticmethod
     def classifica_audio(modelo, caminho, tam_padrao, sr=8000, n_mfcc=13):
@@ -272,72 +1077,265 @@ class Sinais:
           sr: Frequencia de amostragem (Sample rate) do áudio em Hz (default = 8000),
           n_mfcc: Nº de MFCCs gerados para o áudio (default = 13).
 
-        Retorno: Matriz onde cada linha é o MFCC vetorizado da mesma linha de M.
+        Retorno: Classificação do áudio. Para classificar muitos áudios com baixa latência, use ClassificadorAudio.
         '''
         # Carrega o vetor do áudio
         audio_data, _ = load(caminho, sr=None)
 
         # Padroniza o tamanho do audio
-        audio_data_padr = padroniza_audio(audio_data, tam_padrao)
-
-        # Calcula o mfcc do áudio
-        audio_data_mfcc = mfcc(audio_data_padr, sr=sr, n_mfcc=n_mfcc)
+        audio_data_padr = Sinais.padroniza_audio(audio_data, tam_padrao)
 
-        # Transforma o mfcc em um vetor
-        audio_data_mfcc_vet = audio_data_mfcc.reshape(
-            (audio_data_mfcc.shape[0]*audio_data_mfcc.shape[1]))
+        # Calcula o mfcc do áudio, já vetorizado, com o extrator em cache
+        audio_data_mfcc_vet = ExtratorMFCC.obter(sr, n_mfcc).transformar(audio_data_padr[np.newaxis])
 
-        return modelo.predict([audio_data_mfcc_vet])[0]
+        return modelo.predict(audio_data_mfcc_vet)[0]
 
     @staticmethod
-    def serie_temporal_para_frequencia(sinal):
+    def serie_temporal_para_frequencia(sinal, eixo=-1, preencher=False):
         '''
         Usa a Transformada Rápida de Fourier para converter o sinal do domínio do tempo para o domínio da frequência
         Parametros:
-          sinal: array de floats com um sinal no domínio do tempo
+          sinal: array de floats com um sinal no domínio do tempo, ou com vários sinais (por exemplo,
+            uma matriz janelas x amostras), transformados juntos ao longo de eixo
+          eixo: eixo ao longo do qual estão as amostras
+          preencher: se verdadeiro, completa o sinal com zeros até um tamanho para o qual a FFT é
+            rápida (o eixo de frequências muda; use frequencia_para_serie_temporal com n para voltar)
 
         Retorno: array de floats com um sinal no domínio de frequência
         '''
-        return fft.rfft(sinal)
+        return espectro.transformar(sinal, eixo, preencher)
 
     @staticmethod
-    def frequencia_para_serie_temporal(sinal):
+    def frequencia_para_serie_temporal(sinal, n=None, eixo=-1):
         '''
         Usa a Transformada Inversa de Fourier para converter o sinal do domínio da frequência para o domínio do tempo
         Parametros:
-          sinal: array de floats com um sinal no domínio de frequência
+          sinal: array de floats com um sinal no domínio de frequência, ou com vários sinais
+          n: tamanho original do sinal no domínio do tempo; sem ele, sinais de tamanho ímpar
+            voltam com uma amostra a menos
+          eixo: eixo ao longo do qual estão as frequências
 
         Retorno: array de floats com um sinal no domínio do tempo
         '''
-        return fft.irfft(sinal)
+        if n is None:
+            return fft.irfft(sinal, axis=eixo, workers=espectro.WORKERS)
+
+        return espectro.inverter(sinal, n, eixo)
 
     @staticmethod
-    def plot_frequencia(sinal, amostragem):
+    def stft(sinal, tamanho=2048, passo=None, janela='hann'):
         '''
-        Faz o plot do gráfico com as frequências do sinal
+        Transformada de Fourier de tempo curto: a rFFT de quadros sobrepostos do sinal
 
         Parametros:
-          sinal: array de floats com um sinal no domínio de frequência
+          sinal: array de floats com um sinal no domínio do tempo, ou com vários sinais ao longo do último eixo
+          tamanho: quantidade de amostras de cada quadro
+          passo: quantidade de amostras entre quadros (default = tamanho//4)
+          janela: janela aplicada a cada quadro (nome do scipy.signal.get_window)
+
+        Retorno: array (..., tamanho//2 + 1, quadros) de complexos (complex64 para sinais float32)
+        '''
+        return espectro.stft(sinal, tamanho, passo, janela)
+
+    @staticmethod
+    def istft(sinal, passo=None, janela='hann', n=None, tamanho=None):
+        '''
+        Inversa da stft
+
+        Parametros:
+          sinal: array (..., frequências, quadros) retornado por stft
+          passo, janela: os mesmos usados na stft
+          n: tamanho do sinal original no domínio do tempo
+          tamanho: o tamanho dos quadros usado na stft; necessário quando ele é ímpar (o padrão,
+            2*(frequências - 1), só recupera tamanhos pares)
+
+        Retorno: array de floats com o sinal no domínio do tempo
+        '''
+        return espectro.istft(sinal, passo, janela, n, tamanho=tamanho)
+
+    @staticmethod
+    def espectrograma(sinal, amostragem, tamanho=2048, passo=None, janela='hann', db=True):
+        '''
+        Parametros:
+          sinal: array de floats com um sinal no domínio do tempo, ou com vários sinais ao longo do último eixo
           amostragem: Sample Rate do sinal em hertz
+          tamanho, passo, janela: como em stft
+          db: se verdadeiro, retorna a potência em decibéis
+
+        Retorno: as frequências, os tempos de cada quadro e a potência (..., frequências, quadros)
         '''
+        return espectro.espectrograma(sinal, amostragem, tamanho, passo, janela, db=db)
 
-        # eixo x para mostrar as frequências
-        xf = fft.rfftfreq(len(sinal)*2-2, 1 / amostragem)
+    @staticmethod
+    def plot_frequencia(sinal, amostragem, n=None, espectrograma=False, tamanho=2048, passo=None):
+        '''
+        Faz o plot do gráfico com as frequências do sinal
+
+        Parametros:
+          sinal: array de floats com um sinal no domínio de frequência; com espectrograma, um sinal no domínio do tempo
+          amostragem: Sample Rate do sinal em hertz
+          n: tamanho original do sinal no domínio do tempo (default = o de um sinal de tamanho par)
+          espectrograma: se verdadeiro, mostra como as frequências variam ao longo do tempo (em decibéis)
+          tamanho, passo: tamanho dos quadros e passo entre eles no espectrograma, como em stft
+        '''
+        if espectrograma:
+            frequencias, tempos, potencia = Sinais.espectrograma(sinal, amostragem, tamanho, passo)
+            plt.pcolormesh(tempos, frequencias, potencia, shading='auto')
+            plt.xlabel('Tempo')
+            plt.ylabel('Frequência')
+            plt.colorbar(label='dB')
+            plt.show()
+            return
+
+        # eixo x para mostrar as frequências, guardado por tamanho e amostragem
+        n = len(sinal)*2-2 if n is None else espectro.tamanho_transformada(len(sinal), n)
+        xf = espectro.frequencias(n, amostragem)
         plt.plot(xf, np.abs(sinal))
         plt.xlabel('Frequência')
         plt.show()
 
     @staticmethod
-    def convolucao(sinal, filtro):
+    def espectro_filtro(filtro, n_fft):
         '''
-        Chama a função de convolução do scipy
+        Retorna a rFFT do filtro com n_fft pontos. Os espectros dos últimos ESPECTROS_MAXIMO
+        filtros usados são guardados, para que filtros reaproveitados não sejam transformados de novo.
 
         Parametros:
-          sinal: array de floats com um sinal no domínio de frequência
           filtro: array de floats com um filtro
+          n_fft: tamanho da FFT
+        '''
+        chave = (filtro.dtype.str, n_fft, filtro.tobytes())
+        transformada = ESPECTROS_FILTROS.get(chave)
+        if transformada is None:
+            transformada = fft.rfft(filtro, n_fft)
+            ESPECTROS_FILTROS[chave] = transformada
+            if len(ESPECTROS_FILTROS) > ESPECTROS_MAXIMO:
+                ESPECTROS_FILTROS.popitem(last=False)
+        else:
+            ESPECTROS_FILTROS.move_to_end(chave)
+
+        return transformada
+
+    @staticmethod
+    def tamanho_bloco_oa(m):
+        '''
+        Retorna o tamanho da FFT e a quantidade de amostras novas de cada bloco da convolução
+        overlap-add com um filtro de m amostras.
+        '''
+        n_fft = espectro.tamanho_rapido(FATOR_BLOCO_OA * m)
+
+        return n_fft, n_fft - m + 1
+
+    @staticmethod
+    def custos_convolucao(n, m):
+        '''
+        Estima o custo de convoluir um sinal de n amostras com um filtro de m amostras por cada método.
+
+        Retorno: dicionário {método: custo}
+        '''
+        n_fft = espectro.tamanho_rapido(n + m - 1)
+        n_bloco, passo = Sinais.tamanho_bloco_oa(m)
+        blocos = -(-n // passo)
+
+        return {
+            'direct': CUSTO_DIRETA * n * m,
+            'fft': CUSTO_FFT * n_fft * np.log2(n_fft),
+            'overlap-add': CUSTO_FFT * blocos * n_bloco * np.log2(n_bloco),
+        }
+
+    @staticmethod
+    def metodo_convolucao(n, m):
+        '''
+        Retorna o método de menor custo estimado para convoluir n amostras com um filtro de m amostras.
+        '''
+        custos = Sinais.custos_convolucao(n, m)
+
+        return min(custos, key=custos.get)
+
+    @staticmethod
+    def convolucao_direta(sinais, filtro):
+        # Todas as linhas de uma vez; com filtros de tamanho par, o scipy centraliza o resultado
+        # uma amostra à esquerda do ndimage
+        origem = -1 if len(filtro) % 2 == 0 else 0
+
+        return ndimage.convolve1d(sinais, filtro, axis=-1, mode='constant', origin=origem)
+
+    @staticmethod
+    def convolucao_fft(sinais, filtro):
+        # Uma única rFFT em lote de todas as linhas, com o tamanho rápido seguinte ao da convolução completa
+        n, m = sinais.shape[-1], len(filtro)
+        n_fft = espectro.tamanho_rapido(n + m - 1)
+        transformada = fft.rfft(sinais, n_fft, axis=-1, workers=espectro.WORKERS)
+        transformada *= Sinais.espectro_filtro(filtro, n_fft)
+        inicio = (m - 1) // 2
+
+        return fft.irfft(transformada, n_fft, axis=-1, workers=espectro.WORKERS)[:, inicio:inicio + n]
+
+    @staticmethod
+    def convolucao_overlap_add(sinais, filtro):
+        # Cada linha é dividida em blocos de passo amostras, transformados juntos em uma rFFT em lote
+        lote, n = sinais.shape
+        m = len(filtro)
+        n_fft, passo = Sinais.tamanho_bloco_oa(m)
+        blocos = -(-n // passo)
+
+        pedacos = np.zeros((lote, blocos * passo), dtype=sinais.dtype)
+        pedacos[:, :n] = sinais
+        transformada = fft.rfft(pedacos.reshape(lote, blocos, passo), n_fft, axis=-1, workers=espectro.WORKERS)
+        transformada *= Sinais.espectro_filtro(filtro, n_fft)
+        saidas = fft.irfft(transformada, n_fft, axis=-1, workers=espectro.WORKERS)
+
+        # Soma a cauda de m - 1 amostras de cada bloco ao início do bloco seguinte
+        completa = np.zeros((lote, blocos + 1, passo), dtype=saidas.dtype)
+        completa[:, :-1] = saidas[..., :passo]
+        completa[:, 1:, :m - 1] += saidas[..., passo:]
+        inicio = (m - 1) // 2
+
+        return completa.reshape(lote, -1)[:, inicio:inicio + n]
+
+    @staticmethod
+    def convolucao(sinal, filtro, metodo='auto', eixo=-1):
+        '''
+        Convolução com o mesmo resultado de signal.convolve(sinal, filtro, mode='same'), calculada
+        diretamente, por FFT ou por overlap-add (FFTs por blocos, melhor para filtros bem menores
+        que o sinal). Os espectros dos filtros são guardados para quando eles são reaproveitados.
+
+        Parametros:
+          sinal: array de floats com um sinal, ou com vários sinais (por exemplo, uma matriz
+            sinais x amostras), convoluídos ao longo de eixo
+          filtro: array de floats com um filtro
+          metodo: 'direct', 'fft', 'overlap-add' ou 'auto', que escolhe o de menor custo estimado
+          eixo: eixo de sinal ao longo do qual é feita a convolução
+
+        Retorno: array de floats com a forma de sinal
         '''
-        # chama a função de convolução do scipy
-        return signal.convolve(sinal, filtro, mode='same', method='direct')
+        sinal = np.asarray(sinal)
+        filtro = np.asarray(filtro)
+        if np.iscomplexobj(sinal) or np.iscomplexobj(filtro):
+            return np.apply_along_axis(signal.convolve, eixo, sinal, filtro, mode='same')
+
+        # Os métodos trabalham sobre uma matriz (sinais, amostras)
+        sinais = np.moveaxis(sinal, eixo, -1)
+        forma = sinais.shape
+        sinais = sinais.reshape(-1, forma[-1])
+        if not np.issubdtype(sinais.dtype, np.floating):
+            sinais = sinais.astype(float)
+        filtro = filtro.astype(np.result_type(sinais, filtro), copy=False)
+
+        if metodo == 'auto':
+            metodo = Sinais.metodo_convolucao(forma[-1], len(filtro))
+        if sinais.size == 0 or len(filtro) == 0:
+            metodo = 'direct'
+        if metodo == 'direct':
+            saida = Sinais.convolucao_direta(sinais, filtro)
+        elif metodo == 'fft':
+            saida = Sinais.convolucao_fft(sinais, filtro)
+        elif metodo == 'overlap-add':
+            saida = Sinais.convolucao_overlap_add(sinais, filtro)
+        else:
+            raise ValueError('Método de convolução desconhecido: ' + str(metodo))
+
+        return np.moveaxis(saida.reshape(forma), -1, eixo)
 
     @staticmethod
     def suaviza(sinal, coeficiente):
@@ -357,36 +1355,103 @@ class Sinais:
         # dividimos pela soma para não alterar a amplitude do sinal após a convolução
         filtro = filtro / filtro.sum()
 
-        sinal_filtrado = convolucao(sinal, filtro)
+        sinal_filtrado = Sinais.convolucao(sinal, filtro)
 
         return sinal_filtrado
 
     @staticmethod
-    def remove_frequencia(sinal, amostragem, frequencia, treshold=4):
+    def frequencias_notch(frequencias, amostragem, harmonicos=1):
         '''
-          Remove uma determinada frequência do sinal
+          Parametros:
+            frequencias: frequência, ou lista de frequências, em hertz
+            amostragem: Sample Rate do sinal em hertz
+            harmonicos: quantos múltiplos de cada frequência (incluindo ela mesma) são considerados
+
+          Retorno: array com as frequências e seus harmônicos abaixo da frequência de Nyquist
+          '''
+        todas = np.outer(np.atleast_1d(frequencias), np.arange(1, harmonicos + 1)).ravel()
 
+        return np.unique(todas[(todas > 0) & (todas < amostragem / 2)])
+
+    @staticmethod
+    def mascara_notch(n, amostragem, frequencias, treshold=4, suavizar=False, dtype=np.float64):
+        '''
           Parametros:
-            sinal: array de floats com um sinal no domínio de frequência
+            n: tamanho do sinal no domínio do tempo
             amostragem: Sample Rate do sinal em hertz
-            frequencia: frequencia a ser removida
-            treshold: quantidade de amostragens ao redor da frequência que serão zerados também
+            frequencias: array de frequências a remover, em hertz
+            treshold: quantidade de amostragens ao redor de cada frequência que serão removidas também
+            suavizar: se verdadeiro, os pontos ao redor de cada frequência são atenuados gradualmente
+              (janela de Hann) em vez de zerados, o que reduz o ringing no domínio do tempo
 
-          Retorno: array de floats com o sinal filtrado
+          Retorno: array com o peso de cada ponto da rFFT de um sinal de n amostras
           '''
-        sinal_fft = serie_temporal_para_frequencia(sinal)
+        pontos = n // 2 + 1
+        mascara = np.ones(pontos, dtype=dtype)
+        centros = np.rint(np.asarray(frequencias) * n / amostragem).astype(np.int64)
+        deslocamentos = np.arange(-treshold, treshold + 1)
+        if suavizar:
+            pesos = 1 - np.hanning(2 * treshold + 3)[1:-1]
+        else:
+            pesos = np.zeros(len(deslocamentos))
+
+        indices = centros[:, np.newaxis] + deslocamentos
+        validos = (indices >= 0) & (indices < pontos)
+        np.minimum.at(mascara, indices[validos], np.broadcast_to(pesos, indices.shape)[validos])
+
+        return mascara
+
+    @staticmethod
+    def filtro_notch(frequencias, amostragem, fator_q=30.0):
+        '''
+          Parametros:
+            frequencias: array de frequências a remover, em hertz
+            amostragem: Sample Rate do sinal em hertz
+            fator_q: fator de qualidade de cada notch (largura de banda = frequência / fator_q)
+
+          Retorno: seções de segunda ordem (sos) da cascata de filtros notch IIR, uma por frequência
+          '''
+        secoes = [signal.tf2sos(*signal.iirnotch(f, fator_q, amostragem)) for f in np.atleast_1d(frequencias)]
+
+        return np.concatenate(secoes) if secoes else np.array([[1.0, 0, 0, 1.0, 0, 0]])
+
+    @staticmethod
+    def remove_frequencia(sinal, amostragem, frequencia, treshold=4, harmonicos=1, suavizar=False, modo='fft',
+                          fator_q=30.0, eixo=-1):
+        '''
+          Remove frequências do sinal
 
-        # calcula quantos pontos de amostragem existem para cada frequência
-        xf = fft.rfftfreq(len(sinal_fft)*2-2, 1 / amostragem)
-        pontos_por_frequencia = len(xf) / (amostragem / 2)
+          Parametros:
+            sinal: array de floats com um sinal no domínio do tempo, ou com vários sinais
+              (por exemplo, uma matriz canais x amostras), filtrados ao longo de eixo
+            amostragem: Sample Rate do sinal em hertz
+            frequencia: frequencia a ser removida, ou lista de frequências
+            treshold: quantidade de amostragens ao redor da frequência que serão zerados também
+            harmonicos: quantos múltiplos de cada frequência são removidos (ex.: 50 Hz com
+              harmonicos=3 remove 50, 100 e 150 Hz)
+            suavizar: no modo 'fft', atenua os pontos ao redor de cada frequência gradualmente
+            modo: 'fft' remove todas as frequências com uma única rFFT/irFFT; 'iir' aplica uma
+              cascata de filtros notch IIR, que não precisa do sinal inteiro (ver fluxo.EstagioNotch)
+            fator_q: fator de qualidade dos filtros notch do modo 'iir'
+            eixo: eixo de sinal ao longo do qual estão as amostras
+
+          Retorno: array de floats com o sinal filtrado, com a mesma forma do sinal de entrada
+          '''
+        sinal = np.asarray(sinal)
+        frequencias = Sinais.frequencias_notch(frequencia, amostragem, harmonicos)
 
-        # calcula a posição da frequência que queremos remover no sinal
-        frequencia_para_remover = int(pontos_por_frequencia * frequencia)
+        if modo == 'iir':
+            return signal.sosfilt(Sinais.filtro_notch(frequencias, amostragem, fator_q), sinal, axis=eixo)
+        if modo != 'fft':
+            raise ValueError('Modo desconhecido: ' + str(modo))
 
-        inicio = max(0, frequencia_para_remover - treshold)
-        fim = min(len(sinal_fft) + 1, frequencia_para_remover + treshold)
+        n = sinal.shape[eixo]
+        sinal_fft = espectro.transformar(sinal, eixo, preencher=False)
 
-        # remove a frequência
-        sinal_fft[inicio: frequencia_para_serie_temporal] = 0
+        # Uma única máscara com todas as frequências, aplicada a todos os sinais por broadcasting
+        mascara = Sinais.mascara_notch(n, amostragem, frequencias, treshold, suavizar, sinal_fft.real.dtype)
+        forma = [1] * sinal.ndim
+        forma[eixo] = len(mascara)
+        sinal_fft *= mascara.reshape(forma)
 
-        return sinal_fft
+        return espectro.inverter(sinal_fft, n, eixo)
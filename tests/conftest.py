@@ -0,0 +1,11 @@
+"""
+Os módulos de mn2.imagens e mn2.sinais se importam pelo nome (from Imagem import *,
+from sinais import Sinais), como quando executados de dentro do próprio diretório.
+"""
+import os
+import sys
+
+RAIZ = os.path.join(os.path.dirname(__file__), "..", "src", "mn2")
+
+for pacote in ("imagens", "sinais"):
+  sys.path.insert(0, os.path.abspath(os.path.join(RAIZ, pacote)))
@@ -0,0 +1,80 @@
+"""
+Testes da convolução de mn2.imagens.filtros contra scipy.ndimage.convolve canal a canal.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import numpy as np
+import pytest
+from scipy import ndimage
+
+from filtros import (MODOS_BORDA, Imagem, blur_gaussiano, convoluir_dados, convoluir_em_faixas,
+                     numero_threads)
+
+KERNELS = {
+  "gaussiano 3x3": np.outer([1, 2, 1], [1, 2, 1]) / 16,
+  "separavel 2x4": np.outer([1.0, -2.0], [0.5, 1.0, 3.0, -1.0]),
+  "separavel 7x7": np.outer(np.hanning(9)[1:-1], np.hanning(9)[1:-1]),
+  "qualquer 3x3": np.arange(9, dtype=float).reshape(3, 3) - 3,
+  "qualquer 4x4": np.random.default_rng(1).standard_normal((4, 4)),
+  "qualquer 2x5": np.random.default_rng(2).standard_normal((2, 5)),
+  "qualquer 9x9": np.random.default_rng(3).standard_normal((9, 9)),
+}
+
+
+def referencia(dados, filtro, borda):
+  # O kernel é revertido, como no convoluir original, que recebia o kernel já na orientação da imagem
+  canais = [ndimage.convolve(dados[..., c], filtro[::-1, ::-1], mode=borda) for c in range(dados.shape[-1])]
+  return np.stack(canais, axis=-1)
+
+
+@pytest.fixture(scope="module")
+def dados():
+  return np.random.default_rng(0).random((37, 45, 3))
+
+
+def metodos(filtro):
+  return ["auto", "direto", "fft"] + (["separavel"] if np.linalg.matrix_rank(filtro) == 1 else [])
+
+
+@pytest.mark.parametrize("borda", MODOS_BORDA)
+@pytest.mark.parametrize("nome", KERNELS)
+def test_convoluir_dados_igual_ao_ndimage(dados, nome, borda):
+  filtro = KERNELS[nome]
+  esperado = referencia(dados, filtro, borda)
+  for metodo in metodos(filtro):
+    resultado = convoluir_dados(dados, filtro, borda, metodo)
+    assert resultado.shape == dados.shape
+    np.testing.assert_allclose(resultado, esperado, atol=1e-12, err_msg=metodo)
+
+
+def test_kernel_nao_separavel_rejeitado(dados):
+  with pytest.raises(Exception):
+    convoluir_dados(dados, KERNELS["qualquer 3x3"], metodo="separavel")
+
+
+@pytest.mark.parametrize("borda", [b for b in MODOS_BORDA if b != "wrap"])
+@pytest.mark.parametrize("nome", KERNELS)
+def test_faixas_identicas_ao_serial(dados, nome, borda):
+  filtro = KERNELS[nome]
+  for metodo in [m for m in metodos(filtro) if m in ("direto", "separavel")]:
+    serial = convoluir_dados(dados, filtro, borda, metodo)
+    for threads in (1, 3, 8):
+      np.testing.assert_array_equal(convoluir_em_faixas(dados, filtro, borda, metodo, threads), serial)
+    with ThreadPoolExecutor(4) as executor:
+      np.testing.assert_array_equal(convoluir_dados(dados, filtro, borda, metodo, executor), serial)
+
+
+def test_blur_gaussiano_sem_passadas_nao_altera_a_imagem(dados):
+  img = Imagem(dados, dados.shape[1], dados.shape[0], None, "RGB")
+  for n in (0, -1):
+    resultado = blur_gaussiano(img, n)
+    np.testing.assert_array_equal(resultado.dados, dados)
+    assert resultado.dados is not img.dados
+
+
+def test_numero_threads():
+  assert numero_threads(None) == 1
+  assert numero_threads(3) == 3
+  with ThreadPoolExecutor(2) as executor:
+    assert numero_threads(executor) == (os.cpu_count() or 1)
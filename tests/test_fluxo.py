@@ -0,0 +1,89 @@
+'''
+  Testes do processamento em blocos de mn2.sinais.fluxo: o resultado deve ser o mesmo do
+  processamento do sinal inteiro pelo scipy, para qualquer divisão em blocos.
+'''
+import numpy as np
+import pytest
+from scipy import signal
+
+from fluxo import EstagioFIR, EstagioIIR, Pipeline, Reamostragem, Suavizacao
+
+
+def blocos_aleatorios(sinal, semente):
+    '''
+      Retorno: Gerador de blocos do sinal com tamanhos aleatórios, inclusive blocos de 1 amostra.
+      '''
+    rng = np.random.default_rng(semente)
+    inicio = 0
+    while inicio < len(sinal):
+        tamanho = int(rng.choice([1, 7, 64, 333, 1000, 4096]))
+        yield sinal[inicio:inicio + tamanho]
+        inicio += tamanho
+
+
+def processar(estagios, sinal, semente=0):
+    return np.concatenate(list(Pipeline(*estagios).processar(blocos_aleatorios(sinal, semente))))
+
+
+@pytest.fixture(scope='module')
+def sinal():
+    return np.random.default_rng(1).standard_normal(20000)
+
+
+FILTROS = {
+    'impar': signal.firwin(101, 0.2),
+    'par': signal.firwin(64, 0.3, window='hann'),
+    'uma amostra': np.array([0.5]),
+    'longo': signal.firwin(1025, 0.05),
+}
+
+
+@pytest.mark.parametrize('nome', FILTROS)
+@pytest.mark.parametrize('semente', [0, 1])
+def test_fir_igual_a_convolucao(sinal, nome, semente):
+    filtro = FILTROS[nome]
+    esperado = signal.convolve(sinal, filtro, mode='same')
+    np.testing.assert_allclose(processar([EstagioFIR(filtro)], sinal, semente), esperado, atol=1e-10)
+
+
+def test_suavizacao_igual_a_convolucao(sinal):
+    filtro = np.hanning(257)
+    esperado = signal.convolve(sinal, filtro / filtro.sum(), mode='same')
+    np.testing.assert_allclose(processar([Suavizacao(257)], sinal), esperado, atol=1e-10)
+
+
+def test_iir_igual_a_sosfilt(sinal):
+    sos = signal.butter(6, [0.1, 0.3], btype='band', output='sos')
+    np.testing.assert_allclose(processar([EstagioIIR(sos)], sinal), signal.sosfilt(sos, sinal), atol=1e-10)
+
+
+@pytest.mark.parametrize('cima, baixo', [(147, 160), (160, 147), (1, 3), (2, 1)])
+def test_reamostragem_igual_a_resample_poly(sinal, cima, baixo):
+    esperado = signal.resample_poly(sinal, cima, baixo)
+    resultado = processar([Reamostragem(cima, baixo)], sinal)
+    assert resultado.shape == esperado.shape
+    np.testing.assert_allclose(resultado, esperado, atol=1e-10)
+
+
+@pytest.mark.parametrize('semente', [0, 1, 2])
+def test_pipeline_igual_ao_sinal_inteiro(sinal, semente):
+    filtro = FILTROS['par']
+    sos = signal.butter(4, 0.25, output='sos')
+    esperado = signal.resample_poly(signal.sosfilt(sos, signal.convolve(sinal, filtro, mode='same')), 147, 160)
+
+    pipeline = Pipeline(EstagioFIR(filtro), EstagioIIR(sos), Reamostragem(147, 160))
+    assert pipeline.fator * 160 == 147
+    resultado = np.concatenate(list(pipeline.processar(blocos_aleatorios(sinal, semente))))
+    assert resultado.shape == esperado.shape
+    np.testing.assert_allclose(resultado, esperado, atol=1e-10)
+
+
+def test_pipeline_com_varios_canais(sinal):
+    canais = np.stack([sinal, sinal[::-1], 2 * sinal], axis=1)
+    filtro = FILTROS['impar']
+    sos = signal.butter(4, 0.25, output='sos')
+    esperado = signal.resample_poly(signal.sosfilt(sos, signal.convolve(canais, filtro[:, np.newaxis], mode='same'), axis=0),
+                                    147, 160, axis=0)
+
+    resultado = Pipeline(EstagioFIR(filtro), EstagioIIR(sos), Reamostragem(147, 160)).executar(canais, tamanho_bloco=777)
+    np.testing.assert_allclose(resultado, esperado, atol=1e-10)
@@ -0,0 +1,108 @@
+"""
+    Tests of the multi-index hashing queries of HashIndex against a brute-force hamming scan
+"""
+import numpy as np
+import pytest
+
+from hashing import HashIndex, ImageHash
+
+
+def brute_force(keys, hashes, hash):
+    """
+        Retrieves {key: distance} of every stored hash to the query
+    """
+    bits = np.unpackbits(np.bitwise_xor(hashes, np.uint64(hash)).view(np.uint8).reshape(-1, 8), axis=1)
+
+    return dict(zip(keys, bits.sum(axis=1).tolist()))
+
+
+def clustered_hashes(rng, count, centers=20):
+    """
+        Hashes grouped around a few centers, so that small radii have matches
+    """
+    base = rng.integers(0, 1 << 63, centers, dtype=np.uint64) * np.uint64(2) + rng.integers(0, 2, centers, dtype=np.uint64)
+    hashes = base[rng.integers(0, centers, count)]
+
+    for _ in range(6):
+        flips = np.uint64(1) << rng.integers(0, 64, count).astype(np.uint64)
+        hashes = np.where(rng.random(count) < 0.5, hashes ^ flips, hashes)
+
+    return hashes
+
+
+@pytest.fixture
+def index_and_reference():
+    rng = np.random.default_rng(0)
+    index, reference = HashIndex(), {}
+
+    #several adds, with queries in between so that the new slots are merged into built tables
+    for batch in range(4):
+        keys = ["img_{0}.png".format(i) for i in rng.integers(0, 1500, 600)]
+        hashes = clustered_hashes(rng, len(keys))
+        index.add(keys, hashes)
+        reference.update(zip(keys, hashes.tolist()))
+        index.query_radius(int(hashes[0]), 3)
+
+    removed = list(reference)[::7]
+    index.remove(removed)
+
+    for key in removed:
+        del reference[key]
+
+    return index, reference, rng
+
+
+def check_queries(index, reference, queries):
+    keys = list(reference)
+    hashes = np.array(list(reference.values()), dtype=np.uint64)
+
+    for hash in queries:
+        expected = brute_force(keys, hashes, hash)
+
+        for radius in (0, 3, 7, 12, 20, 64):
+            results = index.query_radius(hash, radius)
+            assert dict(results) == {k: d for k, d in expected.items() if d <= radius}
+            assert [d for _, d in results] == sorted(d for _, d in results)
+
+        for k in (1, 5, 50):
+            results = index.query_knn(hash, k)
+            assert [d for _, d in results] == sorted(expected.values())[:k]
+            assert all(expected[key] == d for key, d in results)
+
+
+def test_queries_match_brute_force(index_and_reference):
+    index, reference, rng = index_and_reference
+
+    assert len(index) == len(reference)
+    check_queries(index, reference, clustered_hashes(rng, 10).tolist() + [0, (1 << 64) - 1])
+
+
+def test_repeated_key_keeps_only_last_hash():
+    index = HashIndex()
+    index.add(["a", "b", "a"], [0, 1 << 40, (1 << 64) - 1])
+
+    assert len(index) == 2
+    assert index.query_radius(0, 0) == []
+    assert index.query_radius((1 << 64) - 1, 0) == [("a", 0)]
+    assert [key for key, _ in index.query_knn((1 << 64) - 1, 5)] == ["a", "b"]
+
+
+def test_save_and_load(index_and_reference, tmp_path):
+    index, reference, rng = index_and_reference
+    index.add(["ação/ímã.png"], [12345])
+    reference["ação/ímã.png"] = 12345
+    file_path = str(tmp_path / "index.npz")
+
+    index.save(file_path)
+    loaded = HashIndex.load(file_path)
+
+    assert dict(zip(loaded.keys, loaded.hashes.tolist())) == reference
+    check_queries(loaded, reference, clustered_hashes(rng, 5).tolist() + [12345])
+
+
+def test_distance_matches_brute_force():
+    rng = np.random.default_rng(1)
+    hashes = rng.integers(0, 1 << 63, 100, dtype=np.uint64)
+    expected = brute_force(range(100), hashes, 987654321)
+
+    assert ImageHash.distance(hashes, 987654321).tolist() == [expected[i] for i in range(100)]
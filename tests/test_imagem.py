@@ -0,0 +1,69 @@
+"""
+Testes da avaliação preguiçosa das operações aritméticas de mn2.imagens.Imagem.
+"""
+import numpy as np
+import pytest
+from PIL import Image
+
+import Imagem
+from Imagem import avaliacao_preguicosa
+
+
+def imagem(dados, modo):
+  return Imagem.Imagem(dados, dados.shape[1], dados.shape[0], None, modo)
+
+
+@pytest.fixture
+def imagens():
+  rng = np.random.default_rng(0)
+  a = imagem(rng.random((53, 41, 3), dtype=np.float32), "RGB")
+  b = imagem(rng.integers(0, 256, (53, 41, 3), dtype=np.uint8), "RGB")
+  c = imagem(rng.random((53, 41, 1), dtype=np.float32), "L")
+  return a, b, c
+
+
+def expressoes(a, b, c):
+  return {
+    "(a - b) * 0.5 + c": lambda: (a - b) * 0.5 + c,
+    "c * a - [0.1, 0.2, 0.3]": lambda: c * a - [0.1, 0.2, 0.3],
+    "(c + c) / (b + 1)": lambda: (c + c) / (b + 1),
+  }
+
+
+@pytest.mark.parametrize("tamanho_pedaco", [1 << 20, 41 * 3 * 4, 1])
+def test_expressao_preguicosa_igual_a_imediata(imagens, monkeypatch, tamanho_pedaco):
+  # Pedaços pequenos forçam a avaliação em várias faixas de linhas (até uma linha por vez)
+  monkeypatch.setattr(Imagem, "TAMANHO_PEDACO", tamanho_pedaco)
+  for nome, calcular in expressoes(*imagens).items():
+    imediata = calcular()
+    with avaliacao_preguicosa():
+      preguicosa = calcular()
+    assert preguicosa._expressao is not None, nome
+    assert preguicosa.canais == imediata.canais == 3, nome
+    dados = preguicosa.dados
+    assert preguicosa._expressao is None, nome
+    assert dados.dtype == imediata.dados.dtype, nome
+    np.testing.assert_array_equal(dados, imediata.dados, err_msg=nome)
+
+
+def test_operandos_guardados_por_referencia(imagens):
+  a, b, c = imagens
+  with avaliacao_preguicosa():
+    resultado = a + c
+  # Operações com uma imagem ainda não avaliada continuam preguiçosas fora do modo
+  encadeado = resultado * 2
+  assert encadeado._expressao is not None
+  a.dados[:] = 0
+  np.testing.assert_array_equal(encadeado.dados, (c.dados + c.dados) * np.ones((1, 1, 3), np.float32))
+
+
+def test_salvar_blend(imagens, tmp_path):
+  a, b, _ = imagens
+  nome = str(tmp_path / "blend.gif")
+  Imagem.salvar_blend(nome, a, b, 12, 40)
+  with Image.open(nome) as gif:
+    assert gif.n_frames == 12
+    assert (gif.width, gif.height) == (a.largura, a.altura)
+  Imagem.salvar_gif(nome, Imagem.blend(a, b, 5), 40, paleta=None)
+  with Image.open(nome) as gif:
+    assert gif.n_frames == 5
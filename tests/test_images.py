@@ -0,0 +1,74 @@
+"""
+    Tests of the file helpers of mn2.imagens.images
+"""
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from images import Images
+
+
+def test_to_vector_decodes_fully_unless_draft_is_requested(tmp_path):
+    rng = np.random.default_rng(0)
+    pixels = (np.linspace(0, 255, 1200 * 1600).reshape(1200, 1600) + rng.normal(0, 30, (1200, 1600)))
+    file_path = str(tmp_path / "big.jpg")
+    Image.fromarray(pixels.clip(0, 255).astype(np.uint8)).save(file_path)
+
+    #the baseline: decode the whole JPEG, then resize
+    expected = np.array(Image.open(file_path).convert("L").resize((400, 300)))
+
+    np.testing.assert_array_equal(Images.to_vector(file_path, 300, 400), expected)
+    assert Images.to_vector(file_path, 300, 400, draft=True).shape == (300, 400)
+
+
+def test_open_large_restores_the_pixel_limit(tmp_path, monkeypatch):
+    file_path = str(tmp_path / "large.ppm")
+    Image.fromarray(np.zeros((300, 400), dtype=np.uint8)).save(file_path)
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 10000)
+
+    with pytest.raises(Image.DecompressionBombError):
+        Image.open(file_path)
+
+    with ThreadPoolExecutor(8) as executor:
+        sizes = list(executor.map(lambda _: Images.open_large(file_path).size, range(64)))
+
+    assert sizes == [(400, 300)] * 64
+    assert Image.MAX_IMAGE_PIXELS == 10000
+
+
+def read_tiles(output, names):
+    return {name: np.array(Image.open(path.join(output, name))) for name in names}
+
+
+@pytest.mark.parametrize("grayscale", [True, False])
+def test_export_tiles_from_memory_map_matches_decoded_image(tmp_path, grayscale):
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, (203, 317, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(str(tmp_path / "slide.png"))
+    Image.fromarray(pixels).save(str(tmp_path / "slide.ppm"))
+    np.save(str(tmp_path / "slide.npy"), pixels)
+    assert Images.memmap_pixels(str(tmp_path / "slide.ppm")) is not None
+
+    options = dict(tile_size=64, overlap=5, levels=3, grayscale=grayscale, workers=3)
+    names = Images.export_tiles(str(tmp_path / "slide.png"), str(tmp_path / "png"), **options)
+    expected = read_tiles(str(tmp_path / "png"), names)
+
+    for source in ("ppm", "npy"):
+        output = str(tmp_path / source)
+        assert Images.export_tiles(str(tmp_path / ("slide." + source)), output, **options) == names
+
+        for name, tile in read_tiles(output, names).items():
+            np.testing.assert_array_equal(tile, expected[name], err_msg=name)
+
+
+def test_export_tiles_rejects_large_images_it_cannot_map(tmp_path):
+    file_path = str(tmp_path / "slide.png")
+    Image.fromarray(np.zeros((100, 100), dtype=np.uint8)).save(file_path)
+
+    with pytest.raises(ValueError):
+        Images.export_tiles(file_path, str(tmp_path / "out"), tile_size=32, max_pixels=9999)
+
+    assert len(Images.export_tiles(file_path, str(tmp_path / "out"), tile_size=32, max_pixels=10000)) == 16
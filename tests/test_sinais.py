@@ -0,0 +1,50 @@
+'''
+  Testes de mn2.sinais.sinais contra as bibliotecas de referência (librosa).
+'''
+import librosa
+import numpy as np
+import pytest
+
+from sinais import ExtratorMFCC, Sinais
+
+
+def audios_sinteticos(quantidade, tamanho, sr):
+    '''
+      Retorno: Matriz (quantidade, tamanho) float32 com chirps de frequências diferentes somados a ruído.
+      '''
+    rng = np.random.default_rng(0)
+    t = np.arange(tamanho) / sr
+    linhas = []
+    for i in range(quantidade):
+        chirp = np.sin(2 * np.pi * (200 + 150 * i + 400 * t) * t)
+        linhas.append(0.6 * chirp + 0.05 * rng.standard_normal(tamanho))
+    # Um áudio quase silencioso, para exercitar o piso de top_db
+    linhas.append(1e-4 * rng.standard_normal(tamanho))
+
+    return np.array(linhas, dtype=np.float32)
+
+
+@pytest.mark.parametrize('sr, n_mfcc, tamanho', [(8000, 13, 6000), (16000, 20, 9000), (22050, 13, 4097)])
+def test_mfcc_igual_ao_librosa(sr, n_mfcc, tamanho):
+    M = audios_sinteticos(4, tamanho, sr)
+    extrator = ExtratorMFCC(sr, n_mfcc)
+    coeficientes = extrator.coeficientes(M)
+
+    for audio, calculado in zip(M, coeficientes):
+        esperado = librosa.feature.mfcc(y=audio, sr=sr, n_mfcc=n_mfcc)
+        assert calculado.shape == esperado.shape
+        # Os dois são calculados em float32; a tolerância é relativa à escala dos coeficientes
+        np.testing.assert_allclose(calculado, esperado, rtol=0, atol=1e-5 * np.abs(esperado).max())
+
+
+def test_transforma_audio_mfcc_vetoriza_como_o_librosa():
+    M = audios_sinteticos(3, 5000, 8000)
+    esperado = np.array([librosa.feature.mfcc(y=audio, sr=8000, n_mfcc=13).reshape(-1) for audio in M])
+
+    resultado = Sinais.transforma_audio_mfcc(M)
+    assert resultado.dtype == np.float32
+    np.testing.assert_allclose(resultado, esperado, rtol=0, atol=1e-5 * np.abs(esperado).max())
+    # Lotes de uma linha por vez dão o mesmo resultado que o lote inteiro
+    extrator = ExtratorMFCC.obter(8000, 13)
+    np.testing.assert_array_equal(np.concatenate([extrator.transformar(M[i:i + 1]) for i in range(len(M))]),
+                                  extrator.transformar(M))